@@ -1,8 +1,10 @@
 import os
+import time
 import uuid
 import json
 import tempfile
 import shutil
+from contextlib import contextmanager
 from datetime import datetime
 from flask import Flask, request, render_template, redirect, url_for, send_file, jsonify, session
 from werkzeug.utils import secure_filename
@@ -16,6 +18,7 @@ from processing import (
 
 # Import new video utilities
 from video_utils import process_video_to_frames, convert_docx_to_pdf
+from process_memory import memory_usage
 
 # Add the missing extract_doc_name function if it's not in processing.py
 def extract_doc_name(script_lines):
@@ -46,34 +49,128 @@ def extract_doc_name(script_lines):
     # If no digit after first period or no second period needed
     return first_line[:first_period_idx+1].strip()
 
-def process_files(video_path, excel_path, credential_path, bucket_name, frames_folder, temp_folder, job_id):
-    """Process the uploaded files and generate the Word document (no PDF)"""
+# The pipeline's stages, in order. The same names are reported to on_stage (job.json and
+# the server's video_stage_duration_seconds metric) and recorded in timings.json.
+STAGES = ('extract_audio', 'upload_audio', 'transcribe', 'load_script', 'align_script', 'extract_frames',
+          'extract_additional_frames', 'assign_steps', 'generate_document')
+
+class StageTimings:
+    """
+    Per-stage timing record for one job, saved to timings.json after every stage.
+    Each stage records wall time, CPU time of the job's thread and of finished child
+    processes (ffmpeg), RSS and peak RSS at the end of the stage, and whatever sizes
+    the stage adds to the dict it is given. on_stage is called with the stage's name as
+    it starts.
+    Peak RSS and child CPU are process-wide, so they include other jobs running at once.
+    """
+    def __init__(self, path, job_id, on_stage):
+        self.path = path
+        self.on_stage = on_stage
+        self.record = {'job_id': job_id, 'started': time.time(), 'finished': None, 'status': 'running',
+                       'total_seconds': None, 'stages': []}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage: {name}")
+        self.on_stage(name)
+        sizes = {}
+        started = time.time()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        child_cpu = os.times()
+        try:
+            yield sizes
+        finally:
+            children = os.times()
+            rss, peak_rss = memory_usage()
+            self.record['stages'].append(dict({
+                'name': name,
+                'started': started,
+                'wall_seconds': time.perf_counter() - wall,
+                'cpu_seconds': time.thread_time() - cpu,
+                'child_cpu_seconds': (children.children_user - child_cpu.children_user) +
+                                     (children.children_system - child_cpu.children_system),
+                'rss_bytes': rss,
+                'peak_rss_bytes': peak_rss
+            }, **sizes))
+            self.save()
+
+    def finish(self, status):
+        self.record['finished'] = time.time()
+        self.record['status'] = status
+        self.record['total_seconds'] = time.perf_counter() - self.started
+        self.save()
+
+    def save(self):
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.path), suffix='.tmp', delete=False) as f:
+            json.dump(self.record, f, indent=2)
+        os.replace(f.name, self.path)
+
+def process_files(video_path, excel_path, credential_path, bucket_name, frames_folder, temp_folder, job_id,
+                  on_stage=None):
+    """
+    Process the uploaded files and generate the Word document (no PDF).
+    on_stage, if given, is called with each stage's name as the stage starts.
+    Stage timings are written to timings.json in the job directory (the parent of
+    frames_folder), and the total duration is returned as total_seconds.
+    """
+    if on_stage is None:
+        on_stage = lambda stage: None
+    timings = StageTimings(os.path.join(os.path.dirname(frames_folder), 'timings.json'), job_id, on_stage)
+    try:
+        result = run_stages(video_path, excel_path, credential_path, bucket_name, frames_folder, temp_folder,
+                            job_id, timings)
+    except Exception:
+        timings.finish('failed')
+        raise
+    timings.finish('done')
+    result['total_seconds'] = timings.record['total_seconds']
+    return result
+
+def run_stages(video_path, excel_path, credential_path, bucket_name, frames_folder, temp_folder, job_id,
+               timings):
+    """The pipeline behind process_files(), one timed stage after another."""
+
     # Extract base name from Excel file (without extension)
     excel_base_name = os.path.splitext(os.path.basename(excel_path))[0]
     audio_file = os.path.join(temp_folder, f"{excel_base_name}.wav")
     
     # Step 1: Extract audio from the video
-    extract_audio(video_path, audio_file)
+    with timings.stage('extract_audio') as sizes:
+        extract_audio(video_path, audio_file)
     
-    # Get audio properties
-    properties = get_audio_properties(audio_file)
-    sample_rate_hertz = properties.get('sample_rate', 16000)
-    audio_channel_count = properties.get('channels', 1)
+        # Get audio properties
+        properties = get_audio_properties(audio_file)
+        sample_rate_hertz = properties.get('sample_rate', 16000)
+        audio_channel_count = properties.get('channels', 1)
+        sizes.update(video_bytes=os.path.getsize(video_path), audio_bytes=os.path.getsize(audio_file),
+                     sample_rate=sample_rate_hertz, channels=audio_channel_count)
     
     # Step 2: Upload audio file to Google Cloud Storage
-    gcs_uri = upload_to_gcs(audio_file, bucket_name, credential_path)
+    with timings.stage('upload_audio') as sizes:
+        gcs_uri = upload_to_gcs(audio_file, bucket_name, credential_path)
+        sizes['bytes_uploaded'] = os.path.getsize(audio_file)
     
     # Step 3: Transcribe the audio using Google Cloud Speech-to-Text
-    transcription_words = transcribe_audio_gcs(gcs_uri, credential_path, sample_rate_hertz, audio_channel_count)
+    with timings.stage('transcribe') as sizes:
+        transcription_words = transcribe_audio_gcs(gcs_uri, credential_path, sample_rate_hertz, audio_channel_count)
+        sizes['words_transcribed'] = len(transcription_words)
     
     # Step 4: Load the original script from Excel
-    script_lines, df = load_script(excel_path)
+    with timings.stage('load_script') as sizes:
+        script_lines, df = load_script(excel_path)
+        sizes['script_lines'] = len(script_lines)
     
     # Use our local extract_doc_name function
     doc_name = extract_doc_name(script_lines)
     
     # Step 5: Align the script with the transcription to assign timestamps
-    script_alignment = align_script_with_transcription(script_lines, transcription_words)
+    with timings.stage('align_script') as sizes:
+        script_alignment = align_script_with_transcription(script_lines, transcription_words)
+        aligned = [item for item in script_alignment if item['start_time'] is not None]
+        sizes.update(lines_aligned=len(aligned), words_aligned=sum(len(str(item['line']).split()) for item in aligned))
     
     # Adjust lengths to match
     min_length = min(len(df), len(script_alignment))
@@ -81,13 +178,17 @@ def process_files(video_path, excel_path, credential_path, bucket_name, frames_f
     script_alignment = script_alignment[:min_length]
     
     # Step 6: Extract frames from the video
-    frame_data = extract_frames(video_path, frames_folder)
+    with timings.stage('extract_frames') as sizes:
+        frame_data = extract_frames(video_path, frames_folder, stats=sizes)
     
     # Step 7: Extract additional frames at script end times
-    frame_data = extract_additional_frames(video_path, script_alignment, frame_data, frames_folder)
+    with timings.stage('extract_additional_frames') as sizes:
+        frame_data = extract_additional_frames(video_path, script_alignment, frame_data, frames_folder, stats=sizes)
     
     # Step 8: Assign steps to frames based on the script alignment
-    frame_step_mapping = assign_steps_to_frames(frame_data, script_alignment)
+    with timings.stage('assign_steps') as sizes:
+        frame_step_mapping = assign_steps_to_frames(frame_data, script_alignment)
+        sizes['frames'] = len(frame_step_mapping)
     
     # Step 9: Generate Word document only (no PDF conversion)
     results_folder = os.path.join(os.path.dirname(frames_folder), 'results')
@@ -118,7 +219,10 @@ def process_files(video_path, excel_path, credential_path, bucket_name, frames_f
     docx_path = os.path.join(results_folder, docx_name)
     
     # Generate the document (Word document only, no PDF conversion)
-    docx_path = generate_word_document(frame_step_mapping, video_path, doc_name, docx_path, results_folder)
+    with timings.stage('generate_document') as sizes:
+        docx_path = generate_word_document(frame_step_mapping, video_path, doc_name, docx_path, results_folder,
+                                           stats=sizes)
+        sizes['docx_bytes'] = os.path.getsize(docx_path)
     
     return {
         'docx_filename': docx_name,
@@ -0,0 +1,29 @@
+"""
+Memory readings for the current process, kept free of heavy imports so server.py can
+use them without loading the video pipeline.
+"""
+
+import os
+import sys
+
+def memory_usage():
+    """(current RSS, peak RSS) of this process in bytes; None where the platform can't tell."""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return info.rss, getattr(info, 'peak_wset', None)  # peak_wset is Windows only
+    except ImportError:
+        pass
+    rss = peak = None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == 'darwin' else 1024  # Bytes on macOS, KiB elsewhere
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    return rss, peak
@@ -234,8 +234,11 @@ def align_script_with_transcription(script_lines, transcription_words):
 
     return script_alignment
 
-def extract_frames(video_file, frames_folder):
-    """Extract frames from video using color detection and image hashing"""
+def extract_frames(video_file, frames_folder, stats=None):
+    """
+    Extract frames from video using color detection and image hashing.
+    If stats (a dict) is given, frames_decoded and frames_written are added to it.
+    """
     if not os.path.exists(frames_folder):
         os.makedirs(frames_folder)
 
@@ -250,10 +253,12 @@ def extract_frames(video_file, frames_folder):
     lower_bound = np.array([40, 100, 240])
     upper_bound = np.array([60, 130, 255])
 
+    frames_decoded = 0
     while cap.isOpened():
         ret, frame = cap.read()
         if not ret:
             break
+        frames_decoded += 1
 
         # Check if the frame is all black
         if not np.any(frame):
@@ -291,12 +296,19 @@ def extract_frames(video_file, frames_folder):
             cap.set(cv2.CAP_PROP_POS_FRAMES, cap.get(cv2.CAP_PROP_POS_FRAMES) + 30)
 
     cap.release()
+    if stats is not None:
+        stats['frames_decoded'] = stats.get('frames_decoded', 0) + frames_decoded
+        stats['frames_written'] = stats.get('frames_written', 0) + extracted_frames
     return frame_data
 
-def extract_additional_frames(video_file, script_alignment, existing_frame_data, frames_folder):
-    """Extract additional frames based on the end times of script lines"""
+def extract_additional_frames(video_file, script_alignment, existing_frame_data, frames_folder, stats=None):
+    """
+    Extract additional frames based on the end times of script lines.
+    If stats (a dict) is given, frames_decoded and frames_written are added to it.
+    """
     cap = cv2.VideoCapture(video_file)
     additional_frames = 0
+    frames_decoded = 0
 
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
@@ -338,6 +350,7 @@ def extract_additional_frames(video_file, script_alignment, existing_frame_data,
         ret, frame = cap.read()
         if not ret:
             continue
+        frames_decoded += 1
 
         # Check if frame is all black
         if not np.any(frame):
@@ -370,6 +383,9 @@ def extract_additional_frames(video_file, script_alignment, existing_frame_data,
             additional_frames += 1
 
     cap.release()
+    if stats is not None:
+        stats['frames_decoded'] = stats.get('frames_decoded', 0) + frames_decoded
+        stats['frames_written'] = stats.get('frames_written', 0) + additional_frames
     return existing_frame_data
 
 # Import bisect for extract_additional_frames
@@ -782,8 +798,12 @@ def create_header_tables(section, video_file, assets_folder):
                     end={"sz": "2", "val": "single", "color": "000000"}
                 )
 
-def generate_word_document(frame_step_mapping, video_file, doc_name, output_path, assets_folder):
-    """Generate Word document with frames and text"""
+def generate_word_document(frame_step_mapping, video_file, doc_name, output_path, assets_folder, stats=None):
+    """
+    Generate Word document with frames and text.
+    If stats (a dict) is given, the number of pages (step pages plus the copyright page),
+    steps and images written is stored in it.
+    """
     from docx.oxml import parse_xml
     from docx.oxml.ns import nsdecls
     from docx.shared import Inches, Twips
@@ -948,6 +968,7 @@ def generate_word_document(frame_step_mapping, video_file, doc_name, output_path
     
     first_frame = True
     line_count = 0
+    images_added = 0
     page_number = 1  # Track page number for different spacing needs
     
     for mapping in frame_step_mapping:
@@ -1106,6 +1127,7 @@ def generate_word_document(frame_step_mapping, video_file, doc_name, output_path
                 final_width = max_width_cm
                 
             r_img.add_picture(mapping['frame'], width=Cm(final_width))
+            images_added += 1
         except Exception as e:
             print(f"Warning: Could not add image {mapping['frame']}: {str(e)}")
             continue
@@ -1226,6 +1248,10 @@ def generate_word_document(frame_step_mapping, video_file, doc_name, output_path
                             # Copy paragraph alignment
     # Save the document
     document.save(output_path)
+    if stats is not None:
+        stats['pages'] = page_number + 1
+        stats['steps'] = line_count
+        stats['images'] = images_added
     
     # Return only the Word document path (no PDF conversion)
     return output_path
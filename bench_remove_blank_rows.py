@@ -0,0 +1,66 @@
+"""
+Scaling benchmark for blank-row removal.
+
+Builds sheets in the layout ExcelSession produces (an entry, then a blank row) and times
+formatting.compact_rows() against the old one-delete_rows()-per-blank-row approach.
+The old approach is quadratic, so it only runs up to --legacy-max-rows.
+
+Usage: python bench_remove_blank_rows.py [--max-rows 1000000] [--legacy-max-rows 10000]
+"""
+
+import argparse
+import time
+
+from openpyxl import Workbook
+
+from formatting import compact_rows
+
+def build_sheet(rows):
+    """A worksheet with text in every other row of column A."""
+    wb = Workbook()
+    ws = wb.active
+    for row in range(1, rows + 1, 2):
+        ws.cell(row=row, column=1).value = f"Step {row // 2 + 1}"
+    return ws
+
+def legacy_remove_blank_rows(ws):
+    """The previous remove_blank_rows() loop: one delete_rows() call per blank row."""
+    blank_rows = []
+    for row_idx in range(ws.max_row, 0, -1):
+        is_blank = True
+        for col_idx in range(1, ws.max_column + 1):
+            cell = ws.cell(row=row_idx, column=col_idx)
+            if cell.value is not None and str(cell.value).strip() != "":
+                is_blank = False
+                break
+        if is_blank:
+            blank_rows.append(row_idx)
+    for row_idx in blank_rows:
+        ws.delete_rows(row_idx)
+    return len(blank_rows)
+
+def timed(function, ws):
+    start = time.perf_counter()
+    removed = function(ws)
+    return time.perf_counter() - start, removed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-rows', type=int, default=1_000_000)
+    parser.add_argument('--legacy-max-rows', type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'compact_rows (s)':>18} {'delete_rows loop (s)':>22}")
+    rows = 1_000
+    while rows <= args.max_rows:
+        compact_time, removed = timed(compact_rows, build_sheet(rows))
+        legacy = "-"
+        if rows <= args.legacy_max_rows:
+            legacy_time, legacy_removed = timed(legacy_remove_blank_rows, build_sheet(rows))
+            assert legacy_removed == removed
+            legacy = f"{legacy_time:.3f}"
+        print(f"{rows:>10} {compact_time:>18.3f} {legacy:>22}")
+        rows *= 10
+
+if __name__ == "__main__":
+    main()
@@ -1,207 +1,1129 @@
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import column_index_from_string, get_column_letter
 import re
-import tkinter as tk
-from tkinter import filedialog
 import os
+import copy
+import io
+import multiprocessing
+import posixpath
+import struct
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape as xml_escape
 
-def clean_text(original_text: str, options: dict) -> str:
+# Text-cleaning options understood by clean_text(), in the order the rules run.
+TEXT_OPTIONS = (
+    'remove_ellipsis',
+    'remove_spaces_quotes',
+    'remove_spaces_unquoted',
+    'remove_lone_quotes',
+    'capitalize_sentences',
+    'add_periods',
+)
+
+# Patterns are compiled once at import instead of on every clean_text() call.
+QUOTED_PATTERN = re.compile(r'(["\'])(.*?)(\1)')
+# Find patterns like "X Y Z" or "A B C D" (at least 3 single chars)
+# \b([a-zA-Z0-9])\s+ means single char followed by space
+# (?: ... ){2,} means repeat that pattern at least twice
+# \b([a-zA-Z0-9])\b means end with a single char
+UNQUOTED_RUN_PATTERN = re.compile(r'\b(?:[a-zA-Z0-9]\s+){2,}[a-zA-Z0-9]\b')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+SPACE_CHAR_PATTERN = re.compile(r'\s')
+MULTI_SPACE_PATTERN = re.compile(r'\s{2,}')
+
+# 'regex' runs each rule as its own pass; 'scan' does everything in one pass (see scan_clean_text)
+ENGINES = ('regex', 'scan')
+
+# Column selections with at least this many distinct values are cleaned in a process pool
+PARALLEL_MIN_VALUES = 20000
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+def _worker_count() -> int:
+    return os.cpu_count() or 1
+
+def start_worker_pool() -> ProcessPoolExecutor:
     """
-    Cleans text based on provided options dictionary.
-    Keys in options dict correspond to checkboxes, e.g., options['remove_ellipsis'].
+    Returns the process pool used by clean_texts_parallel(), creating it if needed.
+    The server calls this once at startup; other callers get the pool on first use.
+    Workers are spawned, not forked: a fork copies locks held by the server's other
+    threads into the child, where nothing will ever release them.
     """
-    # 1. Strip leading/trailing whitespace
-    text = original_text.strip()
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ProcessPoolExecutor(max_workers=_worker_count(),
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _worker_pool
+
+def shutdown_worker_pool():
+    """Stops the pool's worker processes, waiting for work in progress. A later call starts a new pool."""
+    global _worker_pool
+    with _worker_pool_lock:
+        pool, _worker_pool = _worker_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+class CleaningPlan:
+    """
+    A prebuilt clean_text() for one option set. Build it with compile_cleaner().
+
+    The enabled rules are resolved once into self.steps, a list of
+    (name, function, needs) triples, so calling the plan only runs what is switched on.
+    needs is None for rules that apply to every value, otherwise a cheap test that
+    says whether the rule could change the value at all.
+
+    With engine='scan' the plan has a single step, scan_clean_text(), which applies
+    all the rules in one pass over the text instead of one regex pass per rule.
+    """
+    def __init__(self, flags: tuple, debug: bool = False, engine: str = 'regex'):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown cleaning engine: {engine}. Expected one of {ENGINES}")
+        self.flags = dict(zip(TEXT_OPTIONS, flags))
+        self.enabled = any(flags)  # False when no text option is switched on
+        self.debug = debug
+        self.engine = engine
+        if engine == 'scan':
+            self.steps = [('scan', partial(scan_clean_text, flags=self.flags), None)]
+        else:
+            self.steps = self._build_steps()
+
+    def _build_steps(self):
+        flags = self.flags
+        steps = [('strip', str.strip, None)]
+
+        # Conditionally remove all occurrences of '...'
+        if flags['remove_ellipsis']:
+            steps.append(('remove_ellipsis', lambda text: text.replace("...", ""), None))
+
+        # Quoted text is always processed ("BOM" loses its quotes regardless of options)
+        steps.append(('quoted', lambda text: QUOTED_PATTERN.sub(self._process_quoted, text), has_quote))
+
+        if flags['remove_spaces_unquoted']:
+            steps.append(('remove_spaces_unquoted',
+                          lambda text: UNQUOTED_RUN_PATTERN.sub(self._remove_spaces_in_match, text),
+                          SPACE_CHAR_PATTERN.search))
+
+        # Remove empty quote pairs that remain after the quoted pass
+        if flags['remove_lone_quotes']:
+            steps.append(('remove_lone_quotes', lambda text: text.replace('""', '').replace("''", ''),
+                          has_quote))
+
+        # Convert multiple spaces to single space (Generally always useful)
+        steps.append(('collapse_spaces', lambda text: MULTI_SPACE_PATTERN.sub(' ', text),
+                      SPACE_CHAR_PATTERN.search))
+
+        if flags['capitalize_sentences']:
+            steps.append(('capitalize_sentences', capitalize_first, None))
+
+        if flags['add_periods']:
+            steps.append(('add_periods', add_period, None))
+
+        return steps
+
+    def _process_quoted(self, match):
+        return rewrite_quoted(match.group(1), match.group(2),
+                              self.flags['remove_spaces_quotes'],
+                              self.flags['remove_lone_quotes'])
 
-    # 2. Conditionally remove all occurrences of '...'
-    if options.get('remove_ellipsis', False):
-        text = text.replace("...", "")
-
-    # 3. Process quoted text (both single and double quotes).
-    def process_quoted(match):
-        quote_char = match.group(1)  # The quote symbol (single or double)
-        content    = match.group(2)  # The text inside the quotes
-
-        # Trim leading/trailing spaces inside the quotes
-        content_stripped = content.strip()
-
-        # If the content is "BOM" (any case), remove quotes entirely => BOM
-        if content_stripped.upper() == "BOM":
-            return "BOM"
-
-        # Conditionally remove spaces from single letters in quotes
-        if options.get('remove_spaces_quotes', False):
-            tokens = content_stripped.split()
-            # Check if content is not empty and all parts are single characters
-            if content_stripped and all(len(t) == 1 for t in tokens):
-                content_stripped = "".join(tokens)
-
-        # Conditionally remove lone quotes (if content becomes empty after stripping/processing)
-        if options.get('remove_lone_quotes', False) and not content_stripped:
-             return "" # Return empty string if quote content is empty and option is set
-
-        # Return with the original quote characters preserved, unless it was BOM or removed lone quote
-        return f"{quote_char}{content_stripped}{quote_char}"
-
-    print(f"DEBUG clean_text: Input='{original_text}', Options={options}") # DEBUG
-    print(f"DEBUG clean_text: Before re.sub: text='{text}'") # DEBUG
-    text = re.sub(r'(["\'])(.*?)(\1)', process_quoted, text)
-    print(f"DEBUG clean_text: After re.sub: text='{text}'") # DEBUG
-
-    # Handle unquoted single characters if the option is enabled
-    if options.get('remove_spaces_unquoted', False):
-        # Regex explanation:
-        # (?<!["'])                     # Negative lookbehind: Ensure not preceded by a quote
-        # (                             # Start capturing group 1
-        #   (?:                         # Start non-capturing group for the sequence
-        #     \b[a-zA-Z0-9]\b           # Match a single alphanumeric character (word boundary)
-        #     (?:\s+                    # Match one or more spaces...
-        #       (?![a-zA-Z0-9]\s*[a-zA-Z0-9]) # ...unless followed by another word (to avoid merging words)
-        #       (?![.,;:!?])            # ...or followed by punctuation
-        #     )
-        #   )+                          # Repeat the single char + space pattern one or more times
-        #   \b[a-zA-Z0-9]\b           # Match the final single alphanumeric character
-        # )                             # End capturing group 1
-        # (?![."'])                     # Negative lookahead: Ensure not followed by a quote or period
-        #
-        # This regex is complex and might need refinement based on edge cases.
-        # It aims to find sequences of 2 or more single characters separated by spaces.
-        # A simpler approach might be needed if this is too broad or misses cases.
-
-        # Simpler approach: Find sequences of (single char + space) repeated 2+ times, followed by a single char.
-        def remove_spaces_in_match(match):
-            # Get the matched sequence (e.g., "P R 2 ")
-            sequence = match.group(0)
-            # Remove all spaces within the sequence
-            return re.sub(r'\s+', '', sequence)
-
-        # Find patterns like "X Y Z" or "A B C D" (at least 3 single chars)
-        # \b([a-zA-Z0-9])\s+ means single char followed by space
-        # (?: ... ){2,} means repeat that pattern at least twice
-        # \b([a-zA-Z0-9])\b means end with a single char
-        # We use a function replacement to avoid removing spaces between words accidentally
-        text = re.sub(r'\b(?:[a-zA-Z0-9]\s+){2,}[a-zA-Z0-9]\b', remove_spaces_in_match, text)
-        print(f"DEBUG clean_text: After remove_spaces_unquoted: text='{text}'") # DEBUG
-
-    # Conditionally remove lone quotes that might remain after regex processing or were never paired
-    if options.get('remove_lone_quotes', False):
-         # Remove empty quotes first, then potentially single quotes if they remain
-         text = text.replace('""', '').replace("''", '')
-         # This part is tricky, might remove intended single quotes. Needs careful thought.
-         # A more robust approach might involve checking quote balance.
-         # For now, let's remove only explicitly empty pairs.
-
-    # 4. Convert multiple spaces to single space (Generally always useful)
-    text = re.sub(r'\s{2,}', ' ', text)
-
-    # 5. Conditionally capitalize the first letter
-    if options.get('capitalize_sentences', False) and text:
+    @staticmethod
+    def _remove_spaces_in_match(match):
+        # Remove all spaces within the matched sequence (e.g., "P R 2" -> "PR2")
+        return WHITESPACE_PATTERN.sub('', match.group(0))
+
+    def __call__(self, original_text: str) -> str:
+        text = original_text
+        if self.debug:
+            print(f"DEBUG clean_text: Input='{original_text}', Options={self.flags}")
+            for name, step, needs in self.steps:
+                if needs is None or needs(text):
+                    text = step(text)
+                print(f"DEBUG clean_text: After {name}: text='{text}'")
+            return text
+        for _, step, needs in self.steps:
+            if needs is None or needs(text):
+                text = step(text)
+        return text
+
+def has_quote(text: str) -> bool:
+    """True if text contains a single or double quote."""
+    return '"' in text or "'" in text
+
+def rewrite_quoted(quote_char: str, content: str, remove_spaces_quotes: bool, remove_lone_quotes: bool) -> str:
+    """
+    Returns the replacement for one quoted span: the quote symbol and the text inside it.
+    """
+    # Trim leading/trailing spaces inside the quotes
+    content_stripped = content.strip()
+
+    # If the content is "BOM" (any case), remove quotes entirely => BOM
+    if content_stripped.upper() == "BOM":
+        return "BOM"
+
+    # Conditionally remove spaces from single letters in quotes
+    if remove_spaces_quotes:
+        tokens = content_stripped.split()
+        # Check if content is not empty and all parts are single characters
+        if content_stripped and all(len(t) == 1 for t in tokens):
+            content_stripped = "".join(tokens)
+
+    # Conditionally remove lone quotes (if content becomes empty after stripping/processing)
+    if remove_lone_quotes and not content_stripped:
+        return "" # Return empty string if quote content is empty and option is set
+
+    # Return with the original quote characters preserved, unless it was BOM or removed lone quote
+    return f"{quote_char}{content_stripped}{quote_char}"
+
+def capitalize_first(text: str) -> str:
+    """Capitalizes the first letter of text."""
+    if text:
         text = text[0].upper() + text[1:]
+    return text
 
-    # 6. Conditionally ensure it ends with a period
-    if options.get('add_periods', False) and text and not text.endswith("."):
+def add_period(text: str) -> str:
+    """Ensures text ends with a period."""
+    if text and not text.endswith("."):
         # Avoid adding period if the last char isn't suitable (e.g., another punctuation)
         # This is a basic check, more robust checks might be needed.
         if text[-1].isalnum() or text[-1] in ')]}"\'':
-             text += "."
+            text += "."
+    return text
+
+ASCII_ALNUM = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+
+def scan_clean_text(original_text: str, flags: dict) -> str:
+    """
+    Single left-to-right scan version of the regex rules; output is identical to
+    clean_text(). flags maps every name in TEXT_OPTIONS to a bool.
+
+    The input is read once. Ellipsis runs and quoted spans are rewritten as they
+    are met, and everything they emit is fed through two small state machines:
+      - the run machine buffers a chain of single characters separated by
+        whitespace ("P B 0 0 3") until it knows whether the chain is long enough
+        to merge, which replaces the backtracking unquoted pattern;
+      - the output stack drops adjacent "" and '' pairs and collapses whitespace
+        runs as characters are appended.
+    """
+    remove_ellipsis = flags['remove_ellipsis']
+    remove_spaces_quotes = flags['remove_spaces_quotes']
+    remove_spaces_unquoted = flags['remove_spaces_unquoted']
+    remove_lone_quotes = flags['remove_lone_quotes']
+
+    text = original_text.strip()
+    out = []
+
+    # --- Output stack: lone quote pairs and whitespace collapse ---
+    # The regex version removes "" pairs first and '' pairs second, so a double
+    # quote only pairs with the double quote emitted right before it, while a
+    # single quote pairs with whatever single quote is left on top of the stack.
+    double_quote_open = False
+
+    def put(ch):
+        nonlocal double_quote_open
+        if remove_lone_quotes:
+            if ch == '"':
+                if double_quote_open:
+                    out.pop()
+                    double_quote_open = False
+                else:
+                    out.append(ch)
+                    double_quote_open = True
+                return
+            double_quote_open = False
+            if ch == "'" and out and out[-1] == "'":
+                out.pop()
+                return
+        if ch.isspace() and out and out[-1].isspace():
+            out[-1] = ' '  # Two or more whitespace characters become one space
+        else:
+            out.append(ch)
+
+    # --- Run machine: merge 3+ single characters separated by whitespace ---
+    IDLE, AFTER_CHAR, AFTER_SPACE = 0, 1, 2
+    state = IDLE
+    prev_is_word = False  # Whether the previous character fed in was a word character
+    chain = []            # The single characters of the current run
+    chain_positions = []  # Index of each chain character within raw
+    raw = []              # Everything fed in since the run started
+
+    def flush(length):
+        # Emit the run merged if its first `length` characters form a match, else as it came in
+        if length >= 3:
+            for ch in chain[:length]:
+                put(ch)
+            rest = raw[chain_positions[length - 1] + 1:]
+        else:
+            rest = raw
+        for ch in rest:
+            put(ch)
+        chain.clear()
+        chain_positions.clear()
+        raw.clear()
+
+    def feed(ch):
+        nonlocal state, prev_is_word
+        is_word = ch.isalnum() or ch == '_'
+        if state == AFTER_CHAR:
+            if ch.isspace():
+                raw.append(ch)
+                state = AFTER_SPACE
+                prev_is_word = False
+                return
+            # The last single character is glued to something else. If that is a
+            # word character it cannot end the run, so the run ends one earlier.
+            flush(len(chain) - 1 if is_word else len(chain))
+            state = IDLE
+        elif state == AFTER_SPACE:
+            if ch.isspace():
+                raw.append(ch)
+                return
+            if ch in ASCII_ALNUM:
+                chain_positions.append(len(raw))
+                chain.append(ch)
+                raw.append(ch)
+                state = AFTER_CHAR
+                prev_is_word = True
+                return
+            flush(len(chain))
+            state = IDLE
+        if ch in ASCII_ALNUM and not prev_is_word:
+            chain_positions.append(0)
+            chain.append(ch)
+            raw.append(ch)
+            state = AFTER_CHAR
+        else:
+            put(ch)
+        prev_is_word = is_word
+
+    emit = feed if remove_spaces_unquoted else put
+
+    # --- Input scan: ellipsis runs and quoted spans ---
+    length = len(text)
+    newline = text.find('\n')
+    if newline == -1:
+        newline = length
+    i = 0
+    while i < length:
+        ch = text[i]
+        if ch == '"' or ch == "'":
+            # A quoted span closes at the next matching quote on the same line
+            if i > newline:
+                newline = text.find('\n', i)
+                if newline == -1:
+                    newline = length
+            close = text.find(ch, i + 1, newline)
+            if close != -1:
+                content = text[i + 1:close]
+                if remove_ellipsis:
+                    content = content.replace("...", "")
+                for out_ch in rewrite_quoted(ch, content, remove_spaces_quotes, remove_lone_quotes):
+                    emit(out_ch)
+                i = close + 1
+                continue
+        elif ch == '.' and remove_ellipsis:
+            # Every full "..." in a run of dots is removed; the remainder stays
+            end = i + 1
+            while end < length and text[end] == '.':
+                end += 1
+            for _ in range((end - i) % 3):
+                emit('.')
+            i = end
+            continue
+        emit(ch)
+        i += 1
+
+    if state != IDLE:
+        flush(len(chain))
+
+    text = "".join(out)
+
+    if flags['capitalize_sentences']:
+        text = capitalize_first(text)
+
+    if flags['add_periods']:
+        text = add_period(text)
 
     return text
 
-def remove_blank_rows(input_filename: str, sheet_name: str = None):
+@lru_cache(maxsize=None)
+def _cached_plan(flags: tuple, debug: bool, engine: str) -> CleaningPlan:
+    return CleaningPlan(flags, debug, engine)
+
+def compile_cleaner(options: dict, debug: bool = False, engine: str = 'regex') -> CleaningPlan:
     """
-    Removes all blank rows from the specified (or active) sheet in an Excel file.
-    A row is considered blank if all cells in that row are empty.
+    Returns a cached, prebuilt cleaner for the given options dictionary.
+    The returned plan behaves like clean_text(text, options) but does its setup only once
+    per distinct option set. Pass debug=True to print each step.
+    engine selects 'regex' (default) or 'scan'; both give identical results.
     """
-    # Load the workbook
-    wb = openpyxl.load_workbook(input_filename)
-    
-    # If sheet_name is given, use that sheet; otherwise use active
-    if sheet_name:
-        ws = wb[sheet_name]
-    else:
-        ws = wb.active
-    
-    # Find all blank rows (in reverse order to avoid index issues when deleting)
-    blank_rows = []
-    for row_idx in range(ws.max_row, 0, -1):
-        is_blank = True
-        for col_idx in range(1, ws.max_column + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value is not None and str(cell.value).strip() != "":
-                is_blank = False
-                break
-        if is_blank:
-            blank_rows.append(row_idx)
-    
-    # Delete the blank rows
-    for row_idx in blank_rows:
-        ws.delete_rows(row_idx)
-    
-    # Save the workbook
-    wb.save(input_filename)
-    
-    print(f"Removed {len(blank_rows)} blank rows from {input_filename}.")
-    return len(blank_rows)
+    flags = tuple(bool(options.get(key, False)) for key in TEXT_OPTIONS)
+    return _cached_plan(flags, debug, engine)
 
-def process_excel(input_filename: str, options: dict, sheet_name: str = None):
+def clean_text(original_text: str, options: dict, engine: str = 'regex') -> str:
     """
-    Iterates down column A in the specified (or active) sheet.
-    For each non-empty cell:
-      - Clean the text using clean_text().
-      - Write it back to the cell.
-    Stops when two consecutive blank cells are found.
+    Cleans text based on provided options dictionary.
+    Keys in options dict correspond to checkboxes, e.g., options['remove_ellipsis'].
+    For many cells, use compile_cleaner(options) once and call the result instead.
     """
-    # Load the workbook
-    wb = openpyxl.load_workbook(input_filename)
-    
-    # If sheet_name is given, use that sheet; otherwise use active
-    if sheet_name:
-        ws = wb[sheet_name]
-    else:
-        ws = wb.active
+    return compile_cleaner(options, engine=engine)(original_text)
+
+def clean_texts(values, options: dict, engine: str = 'regex') -> list:
+    """
+    Cleans a whole column of strings at once and returns the results in the same order.
+    Gives the same results as calling clean_text() on each value, but each distinct value
+    is cleaned only once and every rule runs as a single pass over the distinct values.
+    Regex rules only run on the values that could match them.
+    """
+    values = list(values)
+    unique_values = list(dict.fromkeys(values))
+
+    texts = unique_values
+    for _, step, needs in compile_cleaner(options, engine=engine).steps:
+        if needs is None:
+            texts = list(map(step, texts))
+        else:
+            texts = [step(text) if needs(text) else text for text in texts]
+
+    # Scatter the cleaned unique values back to every position they came from
+    cleaned = dict(zip(unique_values, texts))
+    return [cleaned[value] for value in values]
+
+def _compact_rows(ws, non_blank: bytearray) -> int:
+    """
+    Removes the rows whose entry in non_blank is 0 and returns how many were removed.
+
+    Surviving rows keep their order and move up together with their row dimensions
+    (heights, hidden, outline levels) and merged ranges. A merged range shrinks to the rows
+    that survive, and is dropped if nothing of it survives. Other row-based features
+    (data validation, conditional formatting, print areas, images) are not shifted.
+    Row dimensions of removed rows are dropped, and those past the last row with cells
+    move up by the number of rows removed, as Worksheet.delete_rows() would move them.
+
+    The cells are moved by rebuilding the worksheet's private cell store (ws._cells, keyed
+    by (row, column)) in one pass; delete_rows() moves every cell below each deleted row
+    and is quadratic on sheets with many blank rows. The store layout is an openpyxl
+    implementation detail, which is why the README pins openpyxl to 3.1.x.
+    """
+    cells = ws._cells
+    max_row = len(non_blank) - 1
+
+    # Old row number -> new row number for every surviving row
+    new_rows = {}
+    for row in range(1, max_row + 1):
+        if non_blank[row]:
+            new_rows[row] = len(new_rows) + 1
+    removed = max_row - len(new_rows)
+    if not removed:
+        return 0
+
+    # Unmerge first; the merges are re-applied on the compacted rows below
+    merged_ranges = [(r.min_row, r.min_col, r.max_row, r.max_col) for r in ws.merged_cells.ranges]
+    for first_row, first_col, last_row, last_col in merged_ranges:
+        ws.unmerge_cells(start_row=first_row, start_column=first_col, end_row=last_row, end_column=last_col)
+
+    # Rebuild the cell store with every surviving cell moved to its new row
+    compacted = {}
+    for (row, column), cell in cells.items():
+        new_row = new_rows.get(row)
+        if new_row is not None:
+            cell.row = new_row
+            compacted[new_row, column] = cell
+    ws._cells = compacted
+
+    # Row dimensions move with their rows; formatting on rows past the data shifts up
+    dimensions = list(ws.row_dimensions.items())
+    ws.row_dimensions.clear()
+    for row, dimension in dimensions:
+        new_row = row - removed if row > max_row else new_rows.get(row)
+        if new_row is not None:
+            dimension.index = new_row
+            ws.row_dimensions[new_row] = dimension
+
+    for first_row, first_col, last_row, last_col in merged_ranges:
+        surviving = [new_rows[row] for row in range(first_row, last_row + 1) if row in new_rows]
+        if surviving and (len(surviving) > 1 or first_col != last_col):
+            ws.merge_cells(start_row=surviving[0], start_column=first_col,
+                           end_row=surviving[-1], end_column=last_col)
+
+    ws._current_row = ws.max_row if compacted else 0
+    return removed
+
+def clean_texts_parallel(values, options: dict, parallel: bool = True) -> list:
+    """
+    Like clean_texts(), but spreads the distinct values over a pool of worker processes
+    when there are at least PARALLEL_MIN_VALUES of them. Smaller batches, single-core
+    machines and parallel=False clean in this process.
+    """
+    values = list(values)
+    unique_values = list(dict.fromkeys(values))
+    if not parallel or len(unique_values) < PARALLEL_MIN_VALUES or _worker_count() < 2:
+        return clean_texts(values, options)
+
+    # Several chunks per worker keeps the workers busy when some values take longer
+    text_options = {key: bool(options.get(key, False)) for key in TEXT_OPTIONS}
+    chunk_size = -(-len(unique_values) // (_worker_count() * 4))
+    chunks = [unique_values[i:i + chunk_size] for i in range(0, len(unique_values), chunk_size)]
+    cleaned = {}
+    for chunk, results in zip(chunks, start_worker_pool().map(partial(clean_texts, options=text_options), chunks)):
+        cleaned.update(zip(chunk, results))
+    return [cleaned[value] for value in values]
+
+def select_columns(wb, selector: dict = None, sheet_name: str = None) -> list:
+    """
+    Resolves a column selector such as {"Sheet1": ["A", "C"], "*": ["B"]} to a list of
+    (worksheet, column numbers). A sheet's own entry takes precedence over "*".
+    Without a selector, column A of the specified (or active) sheet is selected.
+    """
+    if not selector:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        return [(ws, [1])]
 
+    for name in selector:
+        if name != '*' and name not in wb.sheetnames:
+            raise ValueError(f"Unknown sheet in column selector: {name}")
+
+    targets = []
+    for ws in wb.worksheets:
+        letters = selector.get(ws.title, selector.get('*', []))
+        columns = sorted({column_index_from_string(letter.strip().upper()) for letter in letters})
+        if columns:
+            targets.append((ws, columns))
+    return targets
+
+def _scan_worksheet(ws, columns, remove_blank_lines: bool):
+    """
+    One traversal of a worksheet's cell store. Returns ({column: {row: cell}} for the
+    selected columns, blank-row bitmap filled in from the other columns).
+    """
+    # Work on the cell store directly, like openpyxl's own delete_rows() does. This only
+    # visits cells that exist, so styled empty columns don't inflate the scan.
+    # The selected columns are kept aside and marked after cleaning, since cleaning can
+    # empty a cell.
+    selected = {column: {} for column in columns}
+    non_blank = bytearray(ws.max_row + 1)
+    for (row, column), cell in ws._cells.items():
+        column_cells = selected.get(column)
+        if column_cells is not None:
+            column_cells[row] = cell
+        elif remove_blank_lines:
+            value = cell.value
+            if value is not None and str(value).strip() != "":
+                non_blank[row] = 1
+    return selected, non_blank
+
+def _column_run(column_cells: dict):
+    """Collects the non-empty cells of a column from row 1 until two consecutive blank cells."""
+    cells, texts = [], []
     consecutive_blank_count = 0
-    row = 1  # Start from the first row
-    
+    row = 1
     while True:
-        cell = ws.cell(row=row, column=1)
-        cell_value = cell.value
-        
-        # Check for blank (or None) cell
+        cell = column_cells.get(row)
+        cell_value = cell.value if cell is not None else None
         if cell_value is None or str(cell_value).strip() == "":
             consecutive_blank_count += 1
-            # If we've reached two consecutive blanks, stop
             if consecutive_blank_count == 2:
                 break
         else:
-            # Reset blank count
             consecutive_blank_count = 0
+            cells.append(cell)
+            texts.append(str(cell_value))
+        row += 1
+    return cells, texts
 
-            # Convert cell_value to string and clean it using provided options
-            text = str(cell_value)
-            new_text = clean_text(text, options)
+def format_sheets(targets, options: dict, parallel: bool = True):
+    """
+    Applies the formatting options to a list of (worksheet, column numbers), traversing
+    each sheet's cells once. Every selected column is cleaned like process_excel() has
+    always cleaned column A, with all values cleaned in one batch (in worker processes
+    when there are many). Then blank rows are removed from each sheet if
+    options['remove_blank_lines'] is set. Returns (cells changed, blank rows removed).
+    """
+    cleaner = compile_cleaner(options)
+    remove_blank_lines = options.get('remove_blank_lines', False)
+    scans = [(ws, _scan_worksheet(ws, columns, remove_blank_lines)) for ws, columns in targets]
+
+    changed = 0
+    if cleaner.enabled:
+        cells, texts = [], []
+        for _, (selected, _) in scans:
+            for column_cells in selected.values():
+                run_cells, run_texts = _column_run(column_cells)
+                cells += run_cells
+                texts += run_texts
 
-            # Update the cell if changed
+        # Clean everything at once and update only the cells that changed
+        for cell, text, new_text in zip(cells, texts, clean_texts_parallel(texts, options, parallel)):
             if new_text != text:
                 cell.value = new_text
-        
-        row += 1  # Move to the next row
+                changed += 1
+
+    removed = 0
+    if remove_blank_lines:
+        for ws, (selected, non_blank) in scans:
+            for column_cells in selected.values():
+                for row, cell in column_cells.items():
+                    value = cell.value
+                    if value is not None and str(value).strip() != "":
+                        non_blank[row] = 1
+            removed += _compact_rows(ws, non_blank)
+
+    return changed, removed
+
+def format_worksheet(ws, options: dict, columns=(1,)):
+    """
+    Applies the formatting options to one loaded worksheet in one traversal of its cells,
+    cleaning the given column numbers (column A by default). See format_sheets().
+    Returns (cells changed, blank rows removed).
+    """
+    return format_sheets([(ws, columns)], options, parallel=False)
+
+def compact_rows(ws) -> int:
+    """
+    Removes all blank rows from a loaded worksheet in one pass and returns how many were removed.
+    A row is considered blank if all cells in that row are empty. See _compact_rows() for
+    what moves with the rows.
+    """
+    return format_worksheet(ws, {'remove_blank_lines': True})[1]
+
+def format_workbook(source, options: dict, sheet_name: str = None, stats: dict = None) -> bytes:
+    """
+    Formats an .xlsx given as bytes or a binary stream and returns the result as bytes.
+    Loads the workbook once, applies text cleaning and blank-row removal with
+    format_sheets(), and saves once into memory. options['columns'] may hold a column
+    selector (see select_columns()); without one, column A of the specified (or active)
+    sheet is cleaned. When only text options apply to column A, the shared-strings fast
+    path is tried first so the workbook is not loaded at all.
+    If stats is given it is filled with 'values_changed' and 'blank_rows_removed', plus
+    'fast_path_skipped' with the reason when the fast path was tried and not taken.
+    """
+    data = source if isinstance(source, (bytes, bytearray)) else source.read()
+    cleaner = compile_cleaner(options)
+    remove_blank_lines = options.get('remove_blank_lines', False)
+    if stats is None:
+        stats = {}
+    stats.update(values_changed=0, blank_rows_removed=0)
+
+    if not cleaner.enabled and not remove_blank_lines:
+        return bytes(data)
+
+    if not remove_blank_lines and not options.get('columns'):
+        output = io.BytesIO()
+        try:
+            changed = _rewrite_shared_strings(io.BytesIO(data), output, options, sheet_name)
+        except FastPathUnavailable as e:
+            stats['fast_path_skipped'] = str(e)
+        else:
+            stats['values_changed'] = changed
+            return output.getvalue() if changed else bytes(data)
+
+    wb = openpyxl.load_workbook(io.BytesIO(data))
+    targets = select_columns(wb, options.get('columns'), sheet_name)
+    changed, removed = format_sheets(targets, options)
+    stats.update(values_changed=changed, blank_rows_removed=removed)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def remove_blank_rows(input_filename: str, sheet_name: str = None):
+    """
+    Removes all blank rows from the specified (or active) sheet in an Excel file.
+    A row is considered blank if all cells in that row are empty.
+    Thin wrapper around format_workbook() for files on disk.
+    """
+    stats = {}
+    with open(input_filename, 'rb') as f:
+        data = format_workbook(f, {'remove_blank_lines': True}, sheet_name, stats)
+    with open(input_filename, 'wb') as f:
+        f.write(data)
     
-    # Option A: Overwrite the same file (make sure it's not open in Excel)
-    wb.save(input_filename)
+    removed = stats['blank_rows_removed']
+    print(f"Removed {removed} blank rows from {input_filename}.")
+    return removed
 
-    # Option B: Save to a new file to avoid overwriting
-    # new_filename = os.path.join(
-    #     os.path.dirname(input_filename),
-    #     "cleaned_" + os.path.basename(input_filename)
-    # )
-    # wb.save(new_filename)
+def process_excel(input_filename: str, options: dict, sheet_name: str = None):
+    """
+    Iterates down column A in the specified (or active) sheet.
+    Reads the non-empty cells, cleans them in one batch with clean_texts(),
+    and writes back only the cells whose text changed.
+    Stops when two consecutive blank cells are found.
+    Thin wrapper around format_workbook() for files on disk; blank rows are left alone.
+    """
+    with open(input_filename, 'rb') as f:
+        data = format_workbook(f, dict(options, remove_blank_lines=False), sheet_name)
+    # Overwrite the same file (make sure it's not open in Excel)
+    with open(input_filename, 'wb') as f:
+        f.write(data)
 
     print(f"Finished processing {input_filename}.")
 
+# --- Shared-strings fast path ---
+# Text cleaning only ever changes string values in column A. Those are stored once in
+# xl/sharedStrings.xml, so the fast path patches that one part of the .xlsx zip and copies
+# every other part across untouched instead of loading the whole workbook with openpyxl.
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+DOC_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+SHARED_STRING_ITEM = re.compile(rb'<si>.*?</si>|<si/>', re.S)
+PREFIXED_SHARED_STRING_ITEM = re.compile(rb'<\w+:si\b')
+CELL_REF = re.compile(r'([A-Z]+)(\d+)$')
+
+class FastPathUnavailable(Exception):
+    """Raised when a workbook needs the full openpyxl path in process_excel()."""
+
+def _resolve_part(base_dir: str, target: str) -> str:
+    """Resolves a relationship target to a zip member name."""
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+def _read_rels(zin: zipfile.ZipFile, rels_name: str) -> dict:
+    """Maps relationship id -> (type, target) for one .rels part."""
+    root = ElementTree.fromstring(zin.read(rels_name))
+    return {rel.get('Id'): (rel.get('Type'), rel.get('Target'))
+            for rel in root.iter(f'{PACKAGE_REL_NS}Relationship')}
+
+def _list_sheets(zin: zipfile.ZipFile):
+    """
+    Reads the workbook part. Returns (sheets, active_tab, rels, base_dir) where sheets is a
+    list of (name, relationship type, zip member) in workbook order, which is what wb.active indexes.
+    """
+    workbook_part = 'xl/workbook.xml'
+    for rel_type, target in _read_rels(zin, '_rels/.rels').values():
+        if rel_type.endswith('/officeDocument'):
+            workbook_part = _resolve_part('', target)
+    base_dir = posixpath.dirname(workbook_part)
+    rels = _read_rels(zin, posixpath.join(base_dir, '_rels', posixpath.basename(workbook_part) + '.rels'))
+    workbook = ElementTree.fromstring(zin.read(workbook_part))
+
+    sheets = []
+    for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+        rel_type, target = rels[sheet.get(f'{DOC_REL_NS}id')]
+        sheets.append((sheet.get('name'), rel_type, _resolve_part(base_dir, target)))
+
+    view = workbook.find(f'{MAIN_NS}bookViews/{MAIN_NS}workbookView')
+    active_tab = int(view.get('activeTab', 0)) if view is not None else 0
+    if active_tab >= len(sheets):
+        active_tab = 0
+    return sheets, active_tab, rels, base_dir
+
+def _locate_parts(zin: zipfile.ZipFile, sheet_name: str = None):
+    """
+    Finds the parts needed by the fast path.
+    Returns (target sheet member, other worksheet members, shared strings member).
+    """
+    sheets, active_tab, rels, base_dir = _list_sheets(zin)
+
+    if sheet_name:
+        matches = [sheet for sheet in sheets if sheet[0] == sheet_name]
+        if not matches:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        target_sheet = matches[0]
+    else:
+        target_sheet = sheets[active_tab]
+    if not target_sheet[1].endswith('/worksheet'):
+        raise FastPathUnavailable("active sheet is not a worksheet")
+
+    shared_strings = [_resolve_part(base_dir, target) for rel_type, target in rels.values()
+                      if rel_type.endswith('/sharedStrings')]
+    if not shared_strings:
+        raise FastPathUnavailable("workbook has no shared strings")
+
+    other_sheets = [member for _, rel_type, member in sheets
+                    if rel_type.endswith('/worksheet') and member != target_sheet[2]]
+    return target_sheet[2], other_sheets, shared_strings[0]
+
+def _scan_sheet(zin: zipfile.ZipFile, member: str):
+    """
+    Streams one worksheet. Returns (column_a, references): column_a maps row number to
+    the shared string index in column A (None for an empty cell), and references counts
+    how many cells in the whole sheet use each shared string index.
+    """
+    column_a = {}
+    references = {}
+    with zin.open(member) as source:
+        for _, element in ElementTree.iterparse(source):
+            if element.tag == f'{MAIN_NS}c':
+                value = element.find(f'{MAIN_NS}v')
+                if element.get('t') == 's' and value is not None:
+                    index = int(value.text)
+                    references[index] = references.get(index, 0) + 1
+                else:
+                    index = None
+                    if value is not None or len(element):
+                        index = -1  # Numbers, formulas, inline strings...
+                ref = CELL_REF.match(element.get('r') or '')
+                if ref is None:
+                    raise FastPathUnavailable("cell without a reference")
+                if ref.group(1) == 'A':
+                    column_a[int(ref.group(2))] = index
+            elif element.tag == f'{MAIN_NS}row':
+                element.clear()
+    return column_a, references
+
+def _count_references(zin: zipfile.ZipFile, member: str, indices) -> int:
+    """Counts the cells in a worksheet that use any of the given shared string indices."""
+    count = 0
+    with zin.open(member) as source:
+        for _, element in ElementTree.iterparse(source):
+            if element.tag == f'{MAIN_NS}c' and element.get('t') == 's':
+                value = element.find(f'{MAIN_NS}v')
+                if value is not None and int(value.text) in indices:
+                    count += 1
+            elif element.tag == f'{MAIN_NS}row':
+                element.clear()
+    return count
+
+def _shared_string_text(item: bytes) -> str:
+    """Text of one <si> item, read the way openpyxl reads it (formatting and phonetics dropped)."""
+    element = ElementTree.fromstring(item)
+    snippets = []
+    for child in element:
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 't':
+            snippets.append(child.text or '')
+        elif tag == 'r':
+            for run_text in child.iter():
+                if run_text.tag.rsplit('}', 1)[-1] == 't':
+                    snippets.append(run_text.text or '')
+    return ''.join(snippets).replace('x005F_', '')
+
+def _shared_string_item(text: str) -> bytes:
+    """Serialises text as a plain <si> item."""
+    escaped = xml_escape(text, {'\r': '&#13;'})
+    return f'<si><t xml:space="preserve">{escaped}</t></si>'.encode('utf-8')
+
+def _copy_zip_member(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Copies one member's compressed bytes across as they are, without recompressing."""
+    zin.fp.seek(info.header_offset)
+    local_header = zin.fp.read(30)
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+    zin.fp.seek(info.header_offset + 30 + name_length + extra_length)
+
+    copied = copy.copy(info)
+    copied.flag_bits &= ~0x08  # Sizes and CRC go in the header, so no data descriptor follows
+    copied.header_offset = zout.fp.tell()
+    zout.fp.write(copied.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = zin.fp.read(min(remaining, 1024 * 1024))
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+    zout.filelist.append(copied)
+    zout.NameToInfo[copied.filename] = copied
+    zout.start_dir = zout.fp.tell()
+
+def _rewrite_shared_strings(source, destination, options: dict, sheet_name: str = None) -> int:
+    """
+    Core of the shared-strings fast path. source and destination are paths or binary file
+    objects. Returns how many shared strings changed; nothing is written when that is 0.
+    Raises FastPathUnavailable when the workbook needs the full openpyxl path.
+    """
+    with zipfile.ZipFile(source) as zin:
+        sheet_member, other_sheets, strings_member = _locate_parts(zin, sheet_name)
+        column_a, references = _scan_sheet(zin, sheet_member)
+
+        strings_xml = zin.read(strings_member)
+        if PREFIXED_SHARED_STRING_ITEM.search(strings_xml):
+            raise FastPathUnavailable("shared strings use a namespace prefix")
+        items = [match.span() for match in SHARED_STRING_ITEM.finditer(strings_xml)]
+
+        # Walk column A from row 1 until two consecutive blank cells, like process_excel
+        to_clean = {}  # shared string index -> cells in range using it
+        consecutive_blank_count = 0
+        row = 1
+        while consecutive_blank_count < 2:
+            index = column_a.get(row)
+            if index == -1:
+                raise FastPathUnavailable(f"cell A{row} is not a shared string")
+            if index is None:
+                consecutive_blank_count += 1
+            elif index >= len(items):
+                raise FastPathUnavailable(f"cell A{row} points past the shared strings")
+            else:
+                start, end = items[index]
+                text = _shared_string_text(strings_xml[start:end])
+                if text.strip() == "":
+                    consecutive_blank_count += 1
+                else:
+                    consecutive_blank_count = 0
+                    entry = to_clean.setdefault(index, [text, 0])
+                    entry[1] += 1
+            row += 1
+
+        indices = list(to_clean)
+        cleaned = clean_texts([to_clean[index][0] for index in indices], options)
+        changed = {index: new_text for index, new_text in zip(indices, cleaned)
+                   if new_text != to_clean[index][0]}
+        if not changed:
+            return 0
+
+        # A changed string must not be shared with any cell outside the cleaned range
+        if any(references[index] != to_clean[index][1] for index in changed):
+            raise FastPathUnavailable("changed string is used outside column A")
+        changed_indices = set(changed)
+        for member in other_sheets:
+            if _count_references(zin, member, changed_indices):
+                raise FastPathUnavailable("changed string is used on another sheet")
+
+        # Splice the cleaned items into the original XML, keeping everything else as is
+        pieces = []
+        position = 0
+        for index in sorted(changed):
+            start, end = items[index]
+            pieces.append(strings_xml[position:start])
+            pieces.append(_shared_string_item(changed[index]))
+            position = end
+        pieces.append(strings_xml[position:])
+
+        with zipfile.ZipFile(destination, 'w') as zout:
+            for info in zin.infolist():
+                if info.filename == strings_member:
+                    rewritten = zipfile.ZipInfo(info.filename, info.date_time)
+                    zout.writestr(rewritten, b''.join(pieces), compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    _copy_zip_member(zin, zout, info)
+    return len(changed)
+
+def rewrite_shared_strings(input_filename: str, options: dict, sheet_name: str = None) -> bool:
+    """
+    Fast path for process_excel() when only text options apply.
+    Finds the shared strings that column A uses (same stopping rule as process_excel),
+    cleans each one once, and rewrites xl/sharedStrings.xml. Every other part of the
+    file is copied byte-for-byte.
+
+    Returns False, leaving the file untouched, when the workbook needs process_excel():
+    column A holds numbers, formulas or inline strings, or a string that would change is
+    also used by a cell that process_excel would not clean.
+    """
+    output_dir = os.path.dirname(os.path.abspath(input_filename))
+    with tempfile.NamedTemporaryFile(dir=output_dir, suffix='.xlsx', delete=False) as tmp_file:
+        tmp_filename = tmp_file.name
+    try:
+        changed = _rewrite_shared_strings(input_filename, tmp_filename, options, sheet_name)
+    except FastPathUnavailable as e:
+        os.unlink(tmp_filename)
+        print(f"Shared-strings fast path not used for {input_filename}: {e}")
+        return False
+    except Exception:
+        os.unlink(tmp_filename)
+        raise
+
+    if changed:
+        os.replace(tmp_filename, input_filename)
+    else:
+        os.unlink(tmp_filename)
+    print(f"Finished processing {input_filename} ({changed} shared strings rewritten).")
+    return True
+
+# --- Streaming mode ---
+# process_excel() and remove_blank_rows() load every cell into memory. The streaming mode
+# reads rows with a read-only workbook and appends them to a write-only workbook, so memory
+# stays flat no matter how many rows the sheet has.
+
+def _read_column_widths(zin: zipfile.ZipFile, member: str) -> list:
+    """Reads the <cols> entries of a worksheet as (min, max, width, hidden), stopping at the cell data."""
+    widths = []
+    with zin.open(member) as source:
+        for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start' and element.tag == f'{MAIN_NS}sheetData':
+                break
+            if event == 'end' and element.tag == f'{MAIN_NS}col':
+                widths.append((int(element.get('min')), int(element.get('max')),
+                               element.get('width'), element.get('hidden') in ('1', 'true')))
+    return widths
+
+def _copy_cell(ws_out, cell, value):
+    """Builds a write-only cell carrying the value and, if it has one, the style of a read-only cell."""
+    if not getattr(cell, 'has_style', False):
+        return value
+    out_cell = WriteOnlyCell(ws_out, value=value)
+    out_cell.font = cell.font
+    out_cell.fill = cell.fill
+    out_cell.border = cell.border
+    out_cell.alignment = cell.alignment
+    out_cell.number_format = cell.number_format
+    out_cell.protection = cell.protection
+    return out_cell
+
+def process_excel_streaming(input_filename: str, options: dict, sheet_name: str = None,
+                            output_filename: str = None):
+    """
+    Constant-memory equivalent of process_excel() followed by remove_blank_rows().
+    Cleans column A of the specified (or active) sheet with the same stopping rule as
+    process_excel(), and drops blank rows in the same pass if options['remove_blank_lines']
+    is set. Other sheets are copied across. Writes to output_filename, or overwrites
+    input_filename if not given. Returns the number of blank rows removed.
+
+    Carry-over is best-effort: cell values, cell styles (font, fill, border, alignment,
+    number format, protection), column widths and hidden columns, sheet order and sheet
+    visibility are kept. Merged cells, row heights, images, charts, comments, data
+    validation, conditional formatting, print settings and defined names are silently
+    lost. When only text options apply, try rewrite_shared_strings() first: it is lossless.
+    """
+    cleaner = compile_cleaner(options)
+    remove_blank_lines = options.get('remove_blank_lines', False)
+
+    # Opened here because load_workbook() rejects paths without an Excel extension, such as
+    # the .part files uploads are spooled to
+    with open(input_filename, 'rb') as source:
+        wb_in = openpyxl.load_workbook(source, read_only=True)
+        try:
+            with zipfile.ZipFile(input_filename) as zin:
+                sheets, _, _, _ = _list_sheets(zin)
+                members = {name: member for name, _, member in sheets}
+                column_widths = {name: _read_column_widths(zin, members[name])
+                                 for name in wb_in.sheetnames if name in members}
+
+            target = wb_in[sheet_name] if sheet_name else wb_in.active
+            wb_out = openpyxl.Workbook(write_only=True)
+            removed = 0
+
+            for ws_in in wb_in.worksheets:
+                ws_out = wb_out.create_sheet(ws_in.title)
+                ws_out.sheet_state = ws_in.sheet_state
+                for first, last, width, hidden in column_widths.get(ws_in.title, []):
+                    dimension = ws_out.column_dimensions[get_column_letter(first)]
+                    dimension.min, dimension.max = first, last
+                    if width is not None:
+                        dimension.width = float(width)
+                    dimension.hidden = hidden
+
+                is_target = ws_in is target
+                cleaning = is_target and cleaner.enabled
+                consecutive_blank_count = 0
+
+                for row in ws_in.iter_rows():
+                    values = [cell.value for cell in row]
+
+                    if cleaning and values:
+                        cell_value = values[0]
+                        if cell_value is None or str(cell_value).strip() == "":
+                            consecutive_blank_count += 1
+                            # After two consecutive blanks process_excel stops cleaning
+                            if consecutive_blank_count == 2:
+                                cleaning = False
+                        else:
+                            consecutive_blank_count = 0
+                            text = str(cell_value)
+                            new_text = cleaner(text)
+                            if new_text != text:
+                                values[0] = new_text
+
+                    if is_target and remove_blank_lines and all(
+                            value is None or str(value).strip() == "" for value in values):
+                        removed += 1
+                        continue
+
+                    ws_out.append([_copy_cell(ws_out, cell, value) for cell, value in zip(row, values)])
+
+            # Write next to the output and swap in, since the input is still open for reading
+            final_filename = output_filename or input_filename
+            output_dir = os.path.dirname(os.path.abspath(final_filename))
+            with tempfile.NamedTemporaryFile(dir=output_dir, suffix='.xlsx', delete=False) as tmp_file:
+                tmp_filename = tmp_file.name
+            try:
+                wb_out.save(tmp_filename)
+            except Exception:
+                os.unlink(tmp_filename)
+                raise
+        finally:
+            wb_in.close()
+    os.replace(tmp_filename, final_filename)
+
+    print(f"Finished streaming {input_filename}: removed {removed} blank rows.")
+    return removed
+
+# --- Preview ---
+# The formatter page previews one window of rows at a time. The read-only loader parses
+# rows lazily, so a page only reads the sheet up to its last row.
+
+def _preview_value(value):
+    """Converts a cell value to something JSON can carry."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+def preview_rows(source, offset: int = 0, limit: int = 100, sheet_name: str = None, options: dict = None,
+                 columns: dict = None) -> dict:
+    """
+    Reads rows offset+1 .. offset+limit of the specified (or active) sheet without loading
+    the rest of the workbook. source is a path or a binary file object.
+    If options is given, each page also carries the clean_text() result for every value
+    format_workbook() would clean ('cleaned', None elsewhere): the non-blank values of the
+    selected columns, from row 1 until two consecutive blank cells. columns is the same
+    column selector; without one that is column A of the active sheet.
+    """
+    wb = openpyxl.load_workbook(source, read_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        selected = set()
+        if options is not None:
+            # Same selection as format_workbook(), which doesn't take a sheet name
+            selected = next((set(numbers) for target, numbers in select_columns(wb, columns)
+                             if target.title == ws.title), set())
+
+        # One extra row tells the client whether there is another page. Where cleaning
+        # stops depends on the rows above the page, so those are read too when it matters.
+        first_row = 1 if selected else offset + 1
+        values = []
+        run_ends = {column: None for column in selected}  # Row of the second consecutive blank
+        blank_counts = dict.fromkeys(selected, 0)
+        for row_number, row in enumerate(ws.iter_rows(min_row=first_row, max_row=offset + limit + 1,
+                                                      values_only=True), start=first_row):
+            for column in selected:
+                if run_ends[column] is not None:
+                    continue
+                value = row[column - 1] if column <= len(row) else None
+                if value is None or str(value).strip() == "":
+                    blank_counts[column] += 1
+                    if blank_counts[column] == 2:
+                        run_ends[column] = row_number
+                else:
+                    blank_counts[column] = 0
+            if row_number > offset:
+                values.append((row_number, row))
+        has_more = len(values) > limit
+        values = values[:limit]
+
+        page = {
+            'sheets': wb.sheetnames,
+            'sheet': ws.title,
+            'offset': offset,
+            'limit': limit,
+            'has_more': has_more,
+            'rows': [[_preview_value(value) for value in row] for _, row in values]
+        }
+        if options is not None:
+            def is_cleaned(row_number, column, value):
+                return (column in selected and (run_ends[column] is None or row_number < run_ends[column])
+                        and value is not None and str(value).strip() != "")
+            texts = [str(value) for row_number, row in values for column, value in enumerate(row, start=1)
+                     if is_cleaned(row_number, column, value)]
+            cleaned = iter(clean_texts(texts, options))
+            page['cleaned'] = [[next(cleaned) if is_cleaned(row_number, column, value) else None
+                                for column, value in enumerate(row, start=1)]
+                               for row_number, row in values]
+        return page
+    finally:
+        wb.close()
+
 def main():
     """
     Main function that provides a GUI for selecting an Excel file and processing it.
     """
+    # Imported here so the library functions work without a display
+    import tkinter as tk
+    from tkinter import filedialog
+
     # Create a hidden root window for the file dialog
     root = tk.Tk()
     root.withdraw()
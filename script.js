@@ -221,25 +221,37 @@ function generateFileId() {
     return Math.random().toString(36).substring(2) + Date.now().toString(36);
 }
 
-// Function to load and display history
-function loadHistory() {
+// Function to load and display history, one page at a time
+let historyCursor = null;
+
+function loadHistory(append = false) {
     const historyTableBody = document.getElementById('history-table-body');
     const historyStatus = document.getElementById('history-status');
+    const historyMore = document.getElementById('history-more');
     
-    fetch('/api/history')
+    let url = '/api/history';
+    if (append && historyCursor) {
+        url += `?cursor=${encodeURIComponent(historyCursor)}`;
+    }
+    fetch(url)
         .then(response => response.json())
         .then(history => {
-            historyTableBody.innerHTML = '';
-            if (history.length === 0) {
+            if (!append) {
+                historyTableBody.innerHTML = '';
+            }
+            historyCursor = history.next_cursor;
+            historyMore.style.display = historyCursor ? '' : 'none';
+            if (!append && history.jobs.length === 0) {
                 historyStatus.textContent = 'No processing history found.';
                 return;
             }
             
-            history.forEach(item => {
+            history.jobs.forEach(item => {
                 const row = document.createElement('tr');
                 row.innerHTML = `
                     <td>${item.date}</td>
                     <td>${item.type}</td>
+                    <td>${formatDuration(item.duration)}</td>
                     <td>${item.files.join(', ')}</td>
                     <td class="action-buttons">
                         ${item.files.map(file => `
@@ -261,6 +273,16 @@ function loadHistory() {
         });
 }
 
+function formatDuration(seconds) {
+    if (seconds === null || seconds === undefined) {
+        return '';
+    }
+    if (seconds < 60) {
+        return `${seconds.toFixed(1)} s`;
+    }
+    return `${Math.floor(seconds / 60)} min ${Math.round(seconds % 60)} s`;
+}
+
 // Function to download a file from history
 function downloadFile(jobId, filename) {
     window.location.href = `/download/${jobId}/${filename}`;
@@ -380,11 +402,14 @@ document.addEventListener('DOMContentLoaded', function() {
     const removeSpacesUnquoted = document.getElementById('remove-spaces-unquoted');
     const removeLoneQuotes = document.getElementById('remove-lone-quotes');
     const removeEllipsis = document.getElementById('remove-ellipsis');
+    const formatColumns = document.getElementById('format-columns');
+    const lowMemory = document.getElementById('low-memory');
     
     // Excel Formatter State
     let files = [];
     let selectedFileIndex = -1;
-    let workbook = null;
+    let workbook = null; // Current preview page from /api/excel-preview
+    const PREVIEW_PAGE_SIZE = 100;
     
     // Excel Formatter Event Listeners
     dropZone.addEventListener('dragover', handleDragOver);
@@ -522,43 +547,134 @@ document.addEventListener('DOMContentLoaded', function() {
         updateFormatButtonState();
     }
     
+    function currentTextOptions() {
+        return {
+            capitalize_sentences: capitalizeSentences.checked,
+            add_periods: addPeriods.checked,
+            remove_spaces_quotes: removeSpacesQuotes.checked,
+            remove_spaces_unquoted: removeSpacesUnquoted.checked,
+            remove_lone_quotes: removeLoneQuotes.checked,
+            remove_ellipsis: removeEllipsis.checked
+        };
+    }
+    
+    function fetchPreviewJson(url, init) {
+        return fetch(url, init).then(response => {
+            if (!response.ok) {
+                return response.text().then(text => {
+                    throw new Error(text || `Server returned ${response.status}: ${response.statusText}`);
+                });
+            }
+            return response.json();
+        });
+    }
+    
     function loadExcelPreview(file) {
         updateStatus(`Loading preview for ${file.name}...`);
         
-        const reader = new FileReader();
+        // The server reads only the rows of the requested page, so large files don't freeze the tab
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('offset', 0);
+        formData.append('limit', PREVIEW_PAGE_SIZE);
+        formData.append('options', JSON.stringify(currentTextOptions()));
+        if (formatColumns.value.trim()) {
+            formData.append('columns', formatColumns.value.trim());
+        }
         
-        reader.onload = function(e) {
-            try {
-                const data = new Uint8Array(e.target.result);
-                workbook = XLSX.read(data, { type: 'array' });
-                displayExcelPreview(workbook);
+        fetchPreviewJson('/api/excel-preview', { method: 'POST', body: formData })
+            .then(page => {
+                if (files[selectedFileIndex] !== file) {
+                    return; // Another file was selected meanwhile
+                }
+                workbook = page;
+                displayExcelPreview(page);
                 updateStatus(`Loaded preview for ${file.name}`);
-            } catch (error) {
-                console.error('Error reading Excel file:', error);
+                updateFormatButtonState();
+            })
+            .catch(error => {
+                console.error('Error loading preview:', error);
                 updateStatus(`Error loading preview: ${error.message}`);
                 clearExcelPreview();
-            }
-        };
-        
-        reader.onerror = function() {
-            console.error('Error reading file');
-            updateStatus('Error reading file');
-            clearExcelPreview();
-        };
-        
-        reader.readAsArrayBuffer(file);
+                updateFormatButtonState();
+            });
+    }
+    
+    function loadPreviewPage(offset, sheet) {
+        if (!workbook) {
+            return;
+        }
+        const params = new URLSearchParams({
+            id: workbook.id,
+            offset: Math.max(offset, 0),
+            limit: PREVIEW_PAGE_SIZE,
+            sheet: sheet,
+            options: JSON.stringify(currentTextOptions())
+        });
+        if (formatColumns.value.trim()) {
+            params.append('columns', formatColumns.value.trim());
+        }
+        fetchPreviewJson(`/api/excel-preview?${params}`)
+            .then(page => {
+                workbook = page;
+                displayExcelPreview(page);
+            })
+            .catch(error => {
+                console.error('Error loading preview page:', error);
+                updateStatus(`Error loading preview: ${error.message}`);
+            });
     }
     
-    function displayExcelPreview(workbook) {
-        if (!workbook || !workbook.SheetNames || workbook.SheetNames.length === 0) {
+    function escapeHtml(value) {
+        return String(value)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;');
+    }
+    
+    function displayExcelPreview(page) {
+        if (!page || !page.sheets || page.sheets.length === 0) {
             clearExcelPreview();
             return;
         }
         
-        const sheetName = workbook.SheetNames[0];
-        const worksheet = workbook.Sheets[sheetName];
-        const html = XLSX.utils.sheet_to_html(worksheet);
+        let html = '<div class="preview-controls">';
+        if (page.sheets.length > 1) {
+            html += '<select class="preview-sheet">' + page.sheets.map(name =>
+                `<option value="${escapeHtml(name)}"${name === page.sheet ? ' selected' : ''}>${escapeHtml(name)}</option>`
+            ).join('') + '</select>';
+        }
+        const first = page.offset + 1;
+        const last = page.offset + page.rows.length;
+        html += `<button class="preview-prev"${page.offset === 0 ? ' disabled' : ''}>Previous</button>`;
+        html += `<span>Rows ${page.rows.length ? `${first}-${last}` : 'none'}</span>`;
+        html += `<button class="preview-next"${page.has_more ? '' : ' disabled'}>Next</button>`;
+        html += '</div><table class="preview-table">';
+        
+        page.rows.forEach((row, rowIndex) => {
+            html += `<tr><th>${page.offset + rowIndex + 1}</th>`;
+            row.forEach((value, columnIndex) => {
+                const cleaned = page.cleaned ? page.cleaned[rowIndex][columnIndex] : null;
+                html += '<td>' + (value === null ? '' : escapeHtml(value));
+                if (cleaned !== null && cleaned !== value) {
+                    html += `<div class="cleaned-value">${escapeHtml(cleaned)}</div>`;
+                }
+                html += '</td>';
+            });
+            html += '</tr>';
+        });
+        html += '</table>';
         excelPreview.innerHTML = html;
+        
+        const sheetSelect = excelPreview.querySelector('.preview-sheet');
+        if (sheetSelect) {
+            sheetSelect.addEventListener('change', () => loadPreviewPage(0, sheetSelect.value));
+        }
+        excelPreview.querySelector('.preview-prev').addEventListener('click', () =>
+            loadPreviewPage(page.offset - PREVIEW_PAGE_SIZE, page.sheet));
+        excelPreview.querySelector('.preview-next').addEventListener('click', () =>
+            loadPreviewPage(page.offset + PREVIEW_PAGE_SIZE, page.sheet));
     }
     
     function clearExcelPreview() {
@@ -585,15 +701,21 @@ document.addEventListener('DOMContentLoaded', function() {
         formData.append('removeSpacesUnquoted', removeSpacesUnquoted.checked);
         formData.append('removeLoneQuotes', removeLoneQuotes.checked);
         formData.append('removeEllipsis', removeEllipsis.checked);
+        if (formatColumns.value.trim()) {
+            formData.append('columns', formatColumns.value.trim());
+        }
+        formData.append('lowMemory', lowMemory.checked);
         
         formatButton.disabled = true;
         
+        let formatWarning = null;
         fetch('/api/format-excel', {
             method: 'POST',
             body: formData
         })
         .then(response => {
             console.log("Received response from /api/format-excel"); // DEBUG
+            formatWarning = response.headers.get('X-Format-Warning');
             if (!response.ok) {
                  // Try to get error text, then throw
                  return response.text().then(text => {
@@ -626,7 +748,8 @@ document.addEventListener('DOMContentLoaded', function() {
                  console.log("Download link cleanup complete."); // DEBUG
             }, 0);
 
-            updateStatus(`Formatted and saved as ${modifiedFileName}`);
+            updateStatus(formatWarning ? `Formatted and saved as ${modifiedFileName}. ${formatWarning}`
+                                       : `Formatted and saved as ${modifiedFileName}`);
             console.log("Status updated. Skipping preview reload for now."); // DEBUG
             // loadExcelPreview(file); // Temporarily commented out
         })
@@ -750,11 +873,27 @@ document.addEventListener('DOMContentLoaded', function() {
         progressBar.style.display = 'flex';
         progressBarInner.style.width = '10%';
         
+        // Chunk checksums need SubtleCrypto, which browsers only provide on localhost and HTTPS
+        const upload = window.crypto && crypto.subtle ? uploadInChunks : uploadInOneRequest;
+        upload({ video: videoFile, excel: scriptFile }, fraction => {
+            progressBarInner.style.width = `${10 + 40 * fraction}%`;
+        })
+        .then(uploadedJobId => {
+            jobId = uploadedJobId;
+            progressBarInner.style.width = '50%';
+            processFiles(jobId);
+        })
+        .catch(error => {
+            showError('Upload failed: ' + error.message);
+        });
+    }
+    
+    function uploadInOneRequest(files) {
         const formData = new FormData();
-        formData.append('video', videoFile, videoFile.name);
-        formData.append('excel', scriptFile, scriptFile.name);
+        formData.append('video', files.video, files.video.name);
+        formData.append('excel', files.excel, files.excel.name);
         
-        fetch('/upload', {
+        return fetch('/upload', {
             method: 'POST',
             body: formData
         })
@@ -768,20 +907,145 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(data => {
             if (data.error) {
-                showError(data.error);
-                return;
+                throw new Error(data.error);
             }
-            
-            jobId = data.job_id;
-            progressBarInner.style.width = '50%';
-            processFiles(jobId);
-        })
-        .catch(error => {
-            showError('Upload failed: ' + error.message);
+            return data.job_id;
+        });
+    }
+    
+    // Chunked uploads: UPLOAD_PARALLEL chunks are in flight at once and a failed chunk is tried
+    // UPLOAD_RETRIES times. The upload id is kept in localStorage, so after a dropped connection
+    // or a reload, selecting the same files again only sends the chunks the server is missing.
+    const UPLOAD_PARALLEL = 4;
+    const UPLOAD_RETRIES = 3;
+    
+    function toHex(buffer) {
+        return Array.from(new Uint8Array(buffer), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+    
+    async function requestJson(url, options) {
+        const response = await fetch(url, options);
+        if (!response.ok) {
+            throw new Error(await response.text());
+        }
+        return response.json();
+    }
+    
+    async function openUpload(files) {
+        const key = 'upload:' + Object.values(files).map(file => `${file.name}:${file.size}:${file.lastModified}`).join('|');
+        const uploadId = localStorage.getItem(key);
+        if (uploadId) {
+            const response = await fetch(`/api/uploads/${uploadId}`);
+            if (response.ok) {
+                const session = await response.json();
+                if (Object.keys(files).every(field => session.files[field] && session.files[field].size === files[field].size)) {
+                    return { key, session };
+                }
+            }
+        }
+        const session = await requestJson('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                files: Object.fromEntries(Object.entries(files).map(([field, file]) => [field, { name: file.name, size: file.size }]))
+            })
         });
+        localStorage.setItem(key, session.upload_id);
+        return { key, session };
+    }
+    
+    async function putChunk(uploadId, chunk, body, digest) {
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(`/api/uploads/${uploadId}/${chunk.field}/${chunk.index}`, {
+                    method: 'PUT',
+                    headers: { 'X-Chunk-SHA256': digest },
+                    body: body
+                });
+                if (response.ok) {
+                    return;
+                }
+                throw new Error(await response.text());
+            } catch (error) {
+                if (attempt >= UPLOAD_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+            }
+        }
+    }
+    
+    async function uploadInChunks(files, onProgress) {
+        const { key, session } = await openUpload(files);
+        const uploadId = session.upload_id;
+        const chunkSize = session.chunk_size;
+        const totalBytes = Object.values(files).reduce((sum, file) => sum + file.size, 0);
+        const digests = {};
+        let pending = [];
+        let doneBytes = 0;
+        
+        for (const [field, info] of Object.entries(session.files)) {
+            digests[field] = new Array(info.chunks);
+            const received = new Set(info.received);
+            for (let index = 0; index < info.chunks; index++) {
+                pending.push({ field, index, send: !received.has(index) });
+            }
+        }
+        
+        for (let round = 0; pending.length; round++) {
+            if (round >= UPLOAD_RETRIES) {
+                throw new Error('The server kept rejecting the uploaded data');
+            }
+            // Every chunk is hashed, including those already on the server, for the manifest checksum
+            const queue = pending.slice();
+            const worker = async () => {
+                while (queue.length) {
+                    const chunk = queue.shift();
+                    const start = chunk.index * chunkSize;
+                    const body = await files[chunk.field].slice(start, start + chunkSize).arrayBuffer();
+                    const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', body));
+                    digests[chunk.field][chunk.index] = digest;
+                    if (chunk.send) {
+                        await putChunk(uploadId, chunk, body, toHex(digest));
+                    }
+                    doneBytes += body.byteLength;
+                    onProgress(Math.min(doneBytes / totalBytes, 1));
+                }
+            };
+            await Promise.all(Array.from({ length: UPLOAD_PARALLEL }, worker));
+            
+            // The manifest checksum is the SHA-256 of the chunk digests in order
+            const checksums = {};
+            for (const [field, fieldDigests] of Object.entries(digests)) {
+                const manifest = new Uint8Array(fieldDigests.length * 32);
+                fieldDigests.forEach((digest, index) => manifest.set(digest, index * 32));
+                checksums[field] = toHex(await crypto.subtle.digest('SHA-256', manifest));
+            }
+            const response = await fetch(`/api/uploads/${uploadId}/finalize`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ checksums })
+            });
+            if (response.ok) {
+                localStorage.removeItem(key);
+                return (await response.json()).job_id;
+            }
+            if (response.status !== 409) {
+                throw new Error(await response.text());
+            }
+            // Chunks the server is missing or found corrupt are sent again
+            const { missing } = await response.json();
+            pending = Object.entries(missing).flatMap(([field, indices]) => indices.map(index => ({ field, index, send: true })));
+            doneBytes = totalBytes - pending.reduce((sum, chunk) => sum + Math.min(chunkSize, files[chunk.field].size - chunk.index * chunkSize), 0);
+        }
     }
     
+    // Stages reported by the server while a video job runs, in order ('starting', then final_app.STAGES)
+    const JOB_STAGES = ['starting', 'extract_audio', 'upload_audio', 'transcribe', 'load_script', 'align_script',
+                        'extract_frames', 'extract_additional_frames', 'assign_steps', 'generate_document'];
+    
     function processFiles(jobId) {
+        // The server queues the job and answers 202 right away; progress arrives over the WebSocket
         fetch(`/process/${jobId}`, {
             method: 'POST',
             headers: {
@@ -797,26 +1061,82 @@ document.addEventListener('DOMContentLoaded', function() {
             return response.json();
         })
         .then(data => {
-            progressBarInner.style.width = '100%';
-            
             if (data.error) {
                 showError(data.error);
                 return;
             }
-            
-            resultMessage.textContent = `Your document has been generated successfully!`;
-            downloadLink.href = data.download_url;
-            resultContainer.style.display = 'block';
-            
-            setTimeout(() => {
-                progressBar.style.display = 'none';
-            }, 1000);
+            watchJob(jobId, data.status_url);
         })
         .catch(error => {
             showError('Processing failed: ' + error.message);
         });
     }
     
+    function watchJob(jobId, statusUrl) {
+        let finished = false;
+        let polling = false;
+        
+        function startPolling() {
+            if (!polling) {
+                polling = true;
+                pollStatus();
+            }
+        }
+        
+        function pollStatus() {
+            if (finished) {
+                return;
+            }
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(updateJobStatus)
+                .catch(console.error)
+                .finally(() => {
+                    if (!finished) {
+                        setTimeout(pollStatus, 2000);
+                    }
+                });
+        }
+        
+        function updateJobStatus(job) {
+            if (finished) {
+                return;
+            }
+            if (job.state === 'done') {
+                finished = true;
+                progressBarInner.style.width = '100%';
+                resultMessage.textContent = `Your document has been generated successfully!`;
+                downloadLink.href = job.result.download_url;
+                resultContainer.style.display = 'block';
+                
+                setTimeout(() => {
+                    progressBar.style.display = 'none';
+                }, 1000);
+            } else if (job.state === 'failed' || job.state === 'unknown') {
+                finished = true;
+                showError('Processing failed: ' + (job.error || 'unknown job'));
+            } else if (job.state === 'running') {
+                // Upload took the bar to 50%; the stages fill the rest
+                const stageIndex = Math.max(JOB_STAGES.indexOf(job.stage), 0);
+                progressBarInner.style.width = `${50 + Math.round(45 * stageIndex / JOB_STAGES.length)}%`;
+            }
+        }
+        
+        // Prefer pushed updates; fall back to polling if the WebSocket is unavailable
+        const jobSocket = new WebSocket(`ws://localhost:${window.wsPort}`);
+        jobSocket.onopen = function() {
+            jobSocket.send(JSON.stringify({ type: 'watch_job', job_id: jobId }));
+        };
+        jobSocket.onmessage = function(event) {
+            updateJobStatus(JSON.parse(event.data));
+            if (finished) {
+                jobSocket.close();
+            }
+        };
+        jobSocket.onerror = startPolling;
+        jobSocket.onclose = startPolling;
+    }
+    
     function cleanupFiles(jobId) {
         fetch(`/cleanup/${jobId}`, {
             method: 'POST'
@@ -4,53 +4,192 @@ import os
 import json
 import sys
 import tempfile
-from docx import Document
-from docx.shared import RGBColor
-from openai import OpenAI
-from config import OPENAI_API_KEY
-
-# Initialize OpenAI client (v1+)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+import hashlib
+import gzip
+import sqlite3
+import re
+import cProfile
+import pstats
+import tracemalloc
+import importlib.util
+import types
 import shutil
+import errno
 from urllib.parse import parse_qs, urlparse
 import mimetypes
 import threading
+import multiprocessing
+import socket
 from pathlib import Path
 import io
 import email
+from email.utils import formatdate, parsedate_to_datetime
 from werkzeug.utils import secure_filename # Added import
-import websockets
 import asyncio
-import keyboard
-import pyperclip
-import openpyxl
-from openpyxl import Workbook
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import win32com.client
-import pythoncom
-import tkinter as tk
-from tkinter import filedialog
 
-# Import functions from the formatting script
-from formatting import clean_text, remove_blank_rows, process_excel
+# Optional: static assets are also served brotli-compressed when the module is installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-# Import functions from Video to PDF project
+# The Video to PDF and TTS projects are imported on first use through FEATURES below
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Video to PDF'))
-from final_app import process_files
-
-# Import functions from TTS project
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'TTS'))
-# Assuming tts4.py has functions get_available_voices() and generate_tts()
-try:
+from process_memory import memory_usage
+
+class FeatureUnavailable(Exception):
+    """Raised when a feature's dependencies can't be imported."""
+
+class Feature:
+    """
+    A tool whose dependencies are imported the first time one of its routes is used, so
+    the server starts quickly and still runs on machines that lack some of them.
+    loader imports what the routes need and returns those names as a dict; load() hands
+    them out as attributes. Availability is checked with importlib.util.find_spec(),
+    which locates a module without running it. A failed load is remembered.
+    """
+    def __init__(self, name, description, requires, routes, loader):
+        self.name = name
+        self.description = description
+        self.requires = requires  # Modules checked by find_spec() before anything is loaded
+        self.routes = routes
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.api = None
+        self.error = None
+        self.load_seconds = None
+
+    def missing(self):
+        missing = []
+        for module in self.requires:
+            try:
+                found = importlib.util.find_spec(module) is not None
+            except (ImportError, ValueError):
+                found = False  # A parent package is missing or broken
+            if not found:
+                missing.append(module)
+        return missing
+
+    def load(self):
+        """Returns the feature's names, importing them on first use; raises FeatureUnavailable."""
+        if self.api is None:
+            with self.lock:
+                if self.api is None and self.error is None:
+                    started = time.perf_counter()
+                    try:
+                        self.api = types.SimpleNamespace(**self.loader())
+                    except Exception as e:
+                        self.error = f"{type(e).__name__}: {e}"
+                        print(f"WARNING: {self.description} is unavailable: {self.error}")
+                    self.load_seconds = time.perf_counter() - started
+                    if self.api is not None:
+                        print(f"DEBUG: Loaded {self.name} in {self.load_seconds:.2f}s")
+        if self.api is None:
+            raise FeatureUnavailable(f"{self.description} is not available: {self.error}")
+        return self.api
+
+    def status(self):
+        missing = [] if self.api is not None else self.missing()
+        return {
+            'description': self.description,
+            'routes': self.routes,
+            'available': self.api is not None or (self.error is None and not missing),
+            'loaded': self.api is not None,
+            'missing': missing,
+            'error': self.error,
+            'load_seconds': self.load_seconds
+        }
+
+def load_excel():
+    from openpyxl import Workbook
+    from formatting import (TEXT_OPTIONS, clean_text, compile_cleaner, format_workbook, preview_rows,
+                            remove_blank_rows, process_excel, process_excel_streaming, rewrite_shared_strings,
+                            start_worker_pool, shutdown_worker_pool)
+    return locals()
+
+def load_checklist():
+    from docx import Document
+    from docx.shared import RGBColor
+    from openai import OpenAI
+    from config import OPENAI_API_KEY
+    # Initialize OpenAI client (v1+)
+    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return locals()
+
+def load_word_to_pdf():
+    import win32com.client
+    import pythoncom
+    return locals()
+
+def load_directory_picker():
+    import tkinter as tk
+    from tkinter import filedialog
+    return locals()
+
+def load_video():
+    # Import functions from Video to PDF project
+    from final_app import process_files
+    return locals()
+
+def load_tts():
+    # Assuming tts4.py has functions get_available_voices() and generate_tts()
     from tts4 import get_available_voices, generate_tts
-    TTS_ENABLED = True
-except ImportError:
-    print("WARNING: TTS module (tts4.py) not found or failed to import. TTS functionality will be disabled.")
-    TTS_ENABLED = False
-    # Define dummy functions if import fails
-    def get_available_voices(): return []
-    def generate_tts(text, voice_id): raise NotImplementedError("TTS module not loaded")
+    return locals()
+
+def load_websocket():
+    import websockets
+    return locals()
+
+def load_clipboard():
+    import keyboard
+    import pyperclip
+    return locals()
+
+FEATURES = {feature.name: feature for feature in (
+    Feature('excel', "Excel formatting", ['openpyxl'],
+            ['/api/format-excel', '/api/excel-preview', '/api/start-excel-session'], load_excel),
+    Feature('checklist', "Checklist conversion", ['docx', 'openai', 'config'],
+            ['/api/process-checklist'], load_checklist),
+    Feature('word_to_pdf', "Word to PDF conversion", ['win32com', 'pythoncom'],
+            ['/api/convert-word'], load_word_to_pdf),
+    Feature('directory_picker', "Directory picker", ['tkinter'],
+            ['/api/browse-directory'], load_directory_picker),
+    Feature('video', "Video to PDF", ['flask', 'pandas', 'cv2', 'numpy', 'PIL', 'imagehash', 'docx',
+                                      'google.cloud.speech_v1p1beta1', 'google.cloud.storage'],
+            ['/upload', '/process/'], load_video),
+    Feature('tts', "Text to speech", ['google.cloud.texttospeech'],
+            ['/api/tts-voices', '/api/tts'], load_tts),
+    Feature('websocket', "WebSocket server", ['websockets'],
+            ['/ws-port'], load_websocket),
+    Feature('clipboard', "Clipboard capture", ['keyboard', 'pyperclip'],
+            ['/api/start-excel-session'], load_clipboard),
+)}
+
+def parse_column_selector(text):
+    """
+    Parses a JSON column selector such as {"Sheet1": ["A", "C"], "*": ["B"]} sent with
+    /api/format-excel and /api/excel-preview. Raises ValueError when it has another shape.
+    """
+    try:
+        columns = json.loads(text)
+    except ValueError:
+        columns = None
+    if not isinstance(columns, dict) or not all(isinstance(letters, list) for letters in columns.values()):
+        raise ValueError("columns must map sheet names to lists of column letters")
+    return columns
+
+def parse_content_length(headers):
+    """A request's Content-Length as an int, 0 when it is absent. Raises ValueError when it is malformed."""
+    value = headers.get('Content-Length')
+    if value is None:
+        return 0
+    if not value.strip().isdigit():
+        raise ValueError(f"Malformed Content-Length: {value!r}")
+    return int(value)
 
 def handle_error(e):
     """Simple error handler that returns a user-friendly error message"""
@@ -68,19 +207,686 @@ def handle_error(e):
 HTTP_PORT = 8001
 WS_PORT = 8002
 
+# Excel uploads at least this large are formatted on disk when they can be: text-only
+# cleaning through the lossless shared-strings fast path when the workbook allows it.
+# Anything else is loaded whole, unless the request opts into low-memory mode
+# (lowMemory=true), which uses formatting.process_excel_streaming. That mode keeps styles
+# only on a best-effort basis and drops merged cells, row heights and images, so its
+# responses carry an X-Format-Warning header and are not cached.
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+LOW_MEMORY_WARNING = "Formatted in low-memory mode: merged cells, row heights and images were not kept"
+
+# Concurrent serving: requests run on a pool of HTTP_WORKERS threads, and at most
+# HEAVY_REQUEST_WORKERS of them may run slow requests (Word/checklist conversion, TTS,
+# checking finished chunked uploads)
+# so static files, history and Excel formats stay responsive. Video processing runs
+# on the background job queue instead.
+HTTP_WORKERS = int(os.environ.get('HTTP_WORKERS', '16'))
+HEAVY_REQUEST_WORKERS = int(os.environ.get('HEAVY_REQUEST_WORKERS', str(max(1, HTTP_WORKERS // 4))))
+HEAVY_ROUTES = ('/api/convert-word', '/api/process-checklist', '/api/tts', '/api/uploads/')
+heavy_request_slots = threading.BoundedSemaphore(HEAVY_REQUEST_WORKERS)
+# Seconds a connection may sit idle (no bytes sent or received) before its worker thread
+# drops it, so idle keep-alive or stalled clients can't tie up the whole pool
+HTTP_CONNECTION_TIMEOUT = float(os.environ.get('HTTP_CONNECTION_TIMEOUT', '60'))
+
+# Pre-fork mode: with HTTP_PROCESSES > 1 a supervisor runs that many worker processes on
+# the same port, restarts any that crash, and on /shutdown gives in-flight requests up
+# to DRAIN_TIMEOUT seconds to finish
+HTTP_PROCESSES = int(os.environ.get('HTTP_PROCESSES', '1'))
+DRAIN_TIMEOUT = 60
+worker_shutdown_event = None  # Set in worker processes; /shutdown sets it to stop all workers
+
 # Get the directory of the current script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_DIR = os.path.join(SCRIPT_DIR, 'uploads')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Uploaded files are spooled here while the request is parsed, then moved into place.
+# Request bodies over MAX_UPLOAD_BYTES are rejected with 413 before they are read.
+UPLOAD_SPOOL_DIR = os.path.join(UPLOAD_DIR, 'incoming')
+os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(4 * 1024 * 1024 * 1024)))
+
+# Resumable video uploads: POST /api/uploads opens a session in a new job directory,
+# PUT /api/uploads/<id>/<field>/<n> writes chunk n at its offset (in any order, from any
+# worker), GET /api/uploads/<id> lists the chunks received and POST .../finalize checks
+# the whole files and turns the directory into a job for /process/<id>
+UPLOAD_SESSION_FILE = 'upload.json'
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MIN_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_CHUNKED_UPLOAD_BYTES = int(os.environ.get('MAX_CHUNKED_UPLOAD_BYTES', str(32 * 1024 * 1024 * 1024)))
+UPLOAD_CLAIM_WAIT = 5  # Seconds a chunk waits for the job's claim before answering 409
+
+# Job inputs are stored once per content under BLOB_DIR/<sha256>; job directories hold
+# hard links to them, so the link count doubles as the blob's reference count
+BLOB_DIR = os.path.join(UPLOAD_DIR, 'blobs')
+os.makedirs(BLOB_DIR, exist_ok=True)
+
+# Formatted workbooks are cached here, keyed by the uploaded bytes, the options used and
+# FORMAT_CACHE_VERSION, a hash of formatting.py, so a changed formatter never serves
+# results made by the old one
+FORMAT_CACHE_DIR = os.path.join(UPLOAD_DIR, 'format_cache')
+FORMAT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+def formatter_version():
+    """Short SHA-256 of formatting.py, read without importing it."""
+    try:
+        with open(os.path.join(SCRIPT_DIR, 'formatting.py'), 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except OSError:
+        return 'missing'
+
+FORMAT_CACHE_VERSION = formatter_version()
+
+# Uploaded workbooks being previewed, stored by SHA-256 so pages can be fetched with GET
+PREVIEW_DIR = os.path.join(UPLOAD_DIR, 'previews')
+PREVIEW_MAX_ROWS = 500
+
+# Retention: a background thread deletes jobs untouched for RETENTION_MAX_AGE seconds and,
+# while UPLOAD_DIR holds more than RETENTION_QUOTA_BYTES, evicts artefacts - intermediate
+# frames/ and temp/ folders and preview workbooks before whole jobs. Jobs that are queued
+# or running are never touched. TTS .mp3 files left in the temp dir are removed as well.
+RETENTION_MAX_AGE = int(os.environ.get('RETENTION_MAX_AGE_DAYS', '30')) * 24 * 60 * 60
+RETENTION_QUOTA_BYTES = int(os.environ.get('RETENTION_QUOTA_BYTES', str(50 * 1024 * 1024 * 1024)))
+RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL', '600'))
+RETENTION_STATS_FILE = os.path.join(UPLOAD_DIR, 'retention.json')
+INTERMEDIATE_DIRS = ('frames', 'temp')
+TTS_TEMP_MAX_AGE = 60 * 60
+TTS_TEMP_PATTERN = re.compile(r'tmp[a-z0-9_]{8}\.mp3')  # tempfile.NamedTemporaryFile(suffix='.mp3') names
+
+# The page's own assets are served from memory, precompressed, with strong ETags.
+# With STATIC_MAX_AGE = 0 browsers revalidate on every load and get a 304 when unchanged.
+STATIC_ASSETS = ('index.html', 'script.js', 'styles.css')
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', '0'))
+
+# Metrics for GET /metrics, in the Prometheus text format. In pre-fork mode each worker
+# also writes its totals to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, and /metrics
+# adds up every worker's file.
+METRICS_DIR = os.path.join(UPLOAD_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STAGE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+METRIC_ROUTES = ('/', '/index.html', '/script.js', '/styles.css', '/shutdown', '/get_frames', '/convert_to_pdf',
+                 '/settings', '/ws-port', '/metrics', '/upload', '/api/browse-directory', '/api/history',
+                 '/api/history/rebuild', '/api/tts-voices', '/api/tts', '/api/excel-preview', '/api/format-excel',
+                 '/api/format-cache', '/api/blobs', '/api/retention', '/api/start-excel-session',
+                 '/api/convert-word', '/api/process-checklist', '/api/profile', '/api/memory', '/api/capabilities',
+                 '/api/uploads')
+METRIC_ROUTE_PREFIXES = ('/process/', '/cleanup/', '/download/', '/api/jobs/', '/api/profile/', '/api/memory/',
+                         '/api/uploads/', '/templates/')
+
+# On-demand profiling: POST /api/profile arms cProfile for the next N requests of a route.
+# Each armed request is a token file under PROFILE_DIR/armed, so the count holds across
+# worker processes; requests only look there while profiling_armed.value is set.
+PROFILE_DIR = os.path.join(UPLOAD_DIR, 'profiles')
+PROFILE_ARMED_DIR = os.path.join(PROFILE_DIR, 'armed')
+PROFILE_MAX_COUNT = 100
+PROFILE_SUMMARY_LINES = 40
+
+# Opt-in memory accounting (MEMORY_TRACKING=1, or POST /api/memory {"enabled": true}).
+# While on, tracemalloc records every request and background job: peak traced memory and
+# RSS change per route, with snapshots of the top allocation sites for the worst ones.
+# Tracking is per process: each worker counts only the requests it served, and
+# GET /api/memory reports the worker that answered it under that worker's pid.
+MEMORY_TRACKING = os.environ.get('MEMORY_TRACKING') == '1'
+MEMORY_DIR = os.path.join(UPLOAD_DIR, 'memory')
+MEMORY_TRACE_FRAMES = 10
+MEMORY_SAMPLE_INTERVAL = 0.2  # Seconds between checks for a new high while requests run
+MEMORY_WORST_REQUESTS = 5
+MEMORY_TOP_SITES = 25
+MEMORY_IGNORED_FILES = {tracemalloc.__file__, '<frozen importlib._bootstrap>', '<unknown>'}
+
 # Store active Excel sessions
-excel_sessions = {}
+excel_sessions = {}  # Sessions with an open WebSocket, in the process running the WebSocket server
+excel_sessions_lock = threading.Lock()
+
+# Job directories currently being processed or removed carry a claim file holding the
+# owner's pid, so /process and /cleanup never work on the same job at once, even when
+# they run in different worker processes
+JOB_CLAIM_FILE = '.busy'
+
+def claim_job(job_id):
+    """Marks a job as busy. Returns False if another request is already using it."""
+    claim_path = os.path.join(UPLOAD_DIR, job_id, JOB_CLAIM_FILE)
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    except FileNotFoundError:
+        return True  # No job directory, nothing to protect
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(os.getpid()))
+    return True
+
+def release_job(job_id):
+    try:
+        os.unlink(os.path.join(UPLOAD_DIR, job_id, JOB_CLAIM_FILE))
+    except FileNotFoundError:
+        pass
+
+def clear_job_claims(pid=None):
+    """
+    Removes claims left behind by a crashed worker process, or all claims if pid is None,
+    and marks the jobs that were queued or running under them as failed.
+    """
+    for job_id in os.listdir(UPLOAD_DIR):
+        claim_path = os.path.join(UPLOAD_DIR, job_id, JOB_CLAIM_FILE)
+        try:
+            if pid is not None:
+                with open(claim_path) as f:
+                    if f.read().strip() != str(pid):
+                        continue
+            os.unlink(claim_path)
+            state = read_job_state(job_id)
+            if state and state.get('state') in ('queued', 'running'):
+                write_job_state(job_id, state='failed', stage=None, error="The server stopped while this job was running")
+        except OSError:
+            continue
+
+# Background jobs: /process/<job_id> queues the job and returns 202 right away. Each job
+# type runs on its own bounded pool, and the job's state (queued, running with the
+# current stage, done, failed) is kept in job.json in the job directory, where any worker
+# process, GET /api/jobs/<id> and the WebSocket server can read it.
+JOB_TYPE_WORKERS = {'video': int(os.environ.get('VIDEO_JOB_WORKERS', '2'))}
+JOB_STATE_FILE = 'job.json'
+JOB_TIMINGS_FILE = 'timings.json'  # Written by final_app.process_files
+JOB_WATCH_INTERVAL = 0.5  # Seconds between job.json checks for WebSocket watchers
+job_state_lock = threading.Lock()
+
+def read_job_state(job_id):
+    """Returns the job's state dict, or None if the job was never queued."""
+    try:
+        with open(os.path.join(UPLOAD_DIR, job_id, JOB_STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_job_timings(job_id):
+    """Returns the stage timings process_files recorded for a video job, or None."""
+    try:
+        with open(os.path.join(UPLOAD_DIR, job_id, JOB_TIMINGS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_job_state(job_id, **changes):
+    """Updates job.json with changes; the file is replaced atomically so readers never see half a write."""
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    with job_state_lock:
+        state = read_job_state(job_id) or {}
+        state.update(changes)
+        state['updated'] = time.time()
+        with tempfile.NamedTemporaryFile('w', dir=job_dir, suffix='.tmp', delete=False) as tmp_file:
+            json.dump(state, tmp_file)
+        os.replace(tmp_file.name, os.path.join(job_dir, JOB_STATE_FILE))
+    if 'state' in changes:
+        job_index.update(job_id, status=changes['state'])
+    return state
+
+class JobQueue:
+    """Runs background jobs on one bounded thread pool per job type."""
+    def __init__(self, limits):
+        self.executors = {job_type: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{job_type}-job')
+                          for job_type, workers in limits.items()}
+        self.queued = {job_type: 0 for job_type in limits}
+        self.lock = threading.Lock()
+
+    def submit(self, job_type, job_id, function):
+        """Queues function(job_id). The job must already be claimed; it is released when done."""
+        write_job_state(job_id, id=job_id, type=job_type, state='queued', stage=None,
+                        error=None, result=None, created=time.time())
+        with self.lock:
+            self.queued[job_type] += 1
+        self.executors[job_type].submit(self.run, job_type, job_id, function)
+
+    def run(self, job_type, job_id, function):
+        with self.lock:
+            self.queued[job_type] -= 1
+        memory_entry = memory_tracker.begin(f'job:{job_type}') if memory_tracker.enabled else None
+        try:
+            write_job_state(job_id, state='running', stage='starting', started=time.time())
+            result = function(job_id)
+        except Exception as e:
+            print(f"ERROR in {job_type} job {job_id}: {e}") # DEBUG
+            try:
+                write_job_state(job_id, state='failed', stage=None, error=handle_error(e))
+            except OSError:
+                pass  # Job directory is gone
+        else:
+            write_job_state(job_id, state='done', stage=None, result=result)
+        finally:
+            release_job(job_id)
+            if memory_entry is not None:
+                memory_tracker.end(memory_entry, job_id)
+
+    def depth(self):
+        """Number of jobs waiting for a worker, per job type."""
+        with self.lock:
+            return dict(self.queued)
+
+job_queue = JobQueue(JOB_TYPE_WORKERS)
+
+# /api/history is answered from a SQLite index of job directories instead of a scan of
+# UPLOAD_DIR. Handlers keep it current; POST /api/history/rebuild rescans the directory.
+JOB_INDEX_PATH = os.path.join(UPLOAD_DIR, 'jobs.sqlite3')
+JOB_TYPE_LABELS = {'video': 'Video to PDF', 'word': 'Word to PDF', 'checklist': 'Checklist'}
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.wmv', '.flv')
+
+def scan_job_dir(job_id):
+    """
+    Works out a job's type and files from its directory, for rebuilding the index.
+    Returns None for directories that are not recognisable jobs.
+    """
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    try:
+        created = os.path.getctime(job_dir)
+        files = [f for f in os.listdir(job_dir) if os.path.isfile(os.path.join(job_dir, f))]
+    except (FileNotFoundError, NotADirectoryError):
+        return None  # Not a directory, or removed by /cleanup meanwhile
+
+    lower_names = [f.lower() for f in files]
+    input_files = []
+    output_files = []
+    if any(f.endswith(VIDEO_EXTENSIONS) for f in lower_names) and any(f.endswith(('.xlsx', '.xls')) for f in lower_names):
+        job_type = 'video'
+        input_files = [f for f in files if f.lower().endswith(VIDEO_EXTENSIONS + ('.xlsx', '.xls'))]
+        # The generated document is in the 'results' subdirectory
+        try:
+            output_files = [f for f in os.listdir(os.path.join(job_dir, 'results'))
+                            if f.lower().endswith(('.pdf', '.docx'))]
+        except FileNotFoundError:
+            pass
+    elif any(f.endswith('_checklist.docx') for f in lower_names):
+        job_type = 'checklist'
+        output_files = [f for f in files if f.lower().endswith('_checklist.docx')]
+        input_files = [f for f in files if f.lower().endswith(('.doc', '.docx')) and f not in output_files]
+    elif any(f.endswith(('.doc', '.docx')) for f in lower_names):
+        job_type = 'word'
+        input_files = [f for f in files if f.lower().endswith(('.doc', '.docx'))]
+        output_files = [f for f in files if f.lower().endswith('.pdf')]  # PDF is directly in job_dir
+    else:
+        return None
+
+    state = read_job_state(job_id) or {}
+    return {
+        'id': job_id,
+        'type': job_type,
+        'created': created,
+        'status': state.get('state') or ('done' if output_files else 'uploaded'),
+        'duration': (read_job_timings(job_id) or {}).get('total_seconds'),
+        'input_files': sorted(input_files),
+        'output_files': sorted(output_files)
+    }
+
+class JobIndex:
+    """
+    SQLite index of jobs, one row per job directory.
+    The database runs in WAL mode so every worker process can write to it while others
+    read. Each thread keeps its own connection.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, type TEXT NOT NULL, created REAL NOT NULL, "
+        "status TEXT, input_files TEXT NOT NULL DEFAULT '[]', output_files TEXT NOT NULL DEFAULT '[]', "
+        "duration REAL)",
+        "CREATE INDEX IF NOT EXISTS jobs_by_created ON jobs (created, id)",
+        "CREATE INDEX IF NOT EXISTS jobs_by_type ON jobs (type, created, id)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+                columns = {row['name'] for row in connection.execute("PRAGMA table_info(jobs)")}
+                if 'duration' not in columns:  # Index created before durations were recorded
+                    connection.execute("ALTER TABLE jobs ADD COLUMN duration REAL")
+            self.local.connection = connection
+        return connection
+
+    def record(self, job_id, job_type, input_files=(), output_files=(), status='uploaded', duration=None):
+        """Adds a newly created job."""
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (id, type, created, status, input_files, output_files, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, time.time(), status, json.dumps(sorted(input_files)),
+                 json.dumps(sorted(output_files)), duration))
+
+    def update(self, job_id, status=None, output_files=None, duration=None):
+        """Changes a job's status, duration and/or adds output files; unknown jobs are ignored."""
+        with self.connect() as connection:
+            if status is not None:
+                connection.execute("UPDATE jobs SET status = ? WHERE id = ?", (status, job_id))
+            if duration is not None:
+                connection.execute("UPDATE jobs SET duration = ? WHERE id = ?", (duration, job_id))
+            if output_files:
+                row = connection.execute("SELECT output_files FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is not None:
+                    outputs = sorted(set(json.loads(row['output_files'])) | set(output_files))
+                    connection.execute("UPDATE jobs SET output_files = ? WHERE id = ?", (json.dumps(outputs), job_id))
+
+    def remove(self, job_id):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def query(self, job_type=None, since=None, until=None, limit=HISTORY_PAGE_SIZE, cursor=None):
+        """
+        Returns (jobs, next_cursor) for one page of jobs, newest first.
+        since/until are timestamps bounding the creation time (until is exclusive), and
+        cursor is the next_cursor of the previous page; next_cursor is None on the last page.
+        """
+        conditions = []
+        params = []
+        if job_type:
+            conditions.append("type = ?")
+            params.append(job_type)
+        if since is not None:
+            conditions.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created < ?")
+            params.append(until)
+        if cursor:
+            created, _, job_id = cursor.partition(':')
+            conditions.append("(created < ? OR (created = ? AND id < ?))")
+            params.extend([float(created), float(created), job_id])
+        sql = "SELECT * FROM jobs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created DESC, id DESC LIMIT ?"
+        rows = self.connect().execute(sql, params + [limit + 1]).fetchall()
+
+        jobs = []
+        for row in rows[:limit]:
+            input_files = json.loads(row['input_files'])
+            output_files = json.loads(row['output_files'])
+            jobs.append({
+                'id': row['id'],
+                'date': datetime.fromtimestamp(row['created']).strftime('%Y-%m-%d %H:%M:%S'),
+                'created': row['created'],
+                'type': JOB_TYPE_LABELS.get(row['type'], row['type']),
+                'status': row['status'],
+                'duration': row['duration'],
+                'files': input_files + output_files,
+                'input_files': input_files,
+                'output_files': output_files
+            })
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last['created']!r}:{last['id']}"
+        return jobs, next_cursor
+
+    def rebuild(self):
+        """Replaces the index with a scan of UPLOAD_DIR; returns the number of jobs found."""
+        jobs = [job for job in map(scan_job_dir, os.listdir(UPLOAD_DIR)) if job is not None]
+        with self.connect() as connection:
+            connection.execute("DELETE FROM jobs")
+            connection.executemany(
+                "INSERT INTO jobs (id, type, created, status, input_files, output_files, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(job['id'], job['type'], job['created'], job['status'], json.dumps(job['input_files']),
+                  json.dumps(job['output_files']), job['duration']) for job in jobs])
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rebuilt', ?)", (str(time.time()),))
+        print(f"DEBUG: Rebuilt job index with {len(jobs)} jobs")
+        return len(jobs)
+
+    def ensure_built(self):
+        """Builds the index from the directory scan the first time the server runs with it."""
+        row = self.connect().execute("SELECT value FROM meta WHERE key = 'rebuilt'").fetchone()
+        if row is None:
+            self.rebuild()
+
+job_index = JobIndex(JOB_INDEX_PATH)
+
+# Excel sessions are registered on disk so the WebSocket server can pick up a session
+# that was started by any worker process
+EXCEL_SESSION_DIR = os.path.join(UPLOAD_DIR, 'excel_sessions')
+
+def register_excel_session(session_id, filename, save_location):
+    os.makedirs(EXCEL_SESSION_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=EXCEL_SESSION_DIR, suffix='.tmp', delete=False) as tmp_file:
+        json.dump({'filename': filename, 'saveLocation': save_location}, tmp_file)
+    os.replace(tmp_file.name, os.path.join(EXCEL_SESSION_DIR, f"{session_id}.json"))
+
+def get_excel_session(session_id):
+    """Returns the ExcelSession for session_id, loading it from the registry on first use."""
+    with excel_sessions_lock:
+        session = excel_sessions.get(session_id)
+        if session:
+            return session
+        if not session_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(EXCEL_SESSION_DIR, f"{session_id}.json")) as f:
+                params = json.load(f)
+        except (OSError, ValueError):
+            return None
+        session = ExcelSession(params['filename'], params['saveLocation'])
+        excel_sessions[session_id] = session
+        return session
+
+def end_excel_session(session_id):
+    with excel_sessions_lock:
+        excel_sessions.pop(session_id, None)
+    try:
+        os.unlink(os.path.join(EXCEL_SESSION_DIR, f"{session_id}.json"))
+    except OSError:
+        pass
+
+class FormatResultCache:
+    """
+    Content-addressed on-disk cache of /api/format-excel results.
+    Entries are files named after the cache key. The directory itself is the index, so
+    every worker process sees the same entries: a hit refreshes the file's mtime, and
+    once the directory grows past max_bytes the least recently used files are evicted.
+    Hit/miss counters are per process.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.total_bytes = 0  # Size as of the last scan plus what this process added since
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(upload_digest, options):
+        """
+        Cache key for an upload's SHA-256 hex digest and an options dict. The current
+        FORMAT_CACHE_VERSION is part of it, so entries made by another formatter are not found.
+        """
+        canonical_options = json.dumps(options, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(f"{FORMAT_CACHE_VERSION}:{upload_digest}:{canonical_options}".encode()).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.xlsx")
+
+    def get(self, key):
+        """Returns the path of the cached result for key, or None on a miss."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # Marks the entry as recently used
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, data):
+        """Stores data under key, evicting old entries to stay under max_bytes."""
+        if len(data) > self.max_bytes:
+            return
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as tmp_file:
+            tmp_file.write(data)
+            tmp_filename = tmp_file.name
+        self.add(key, tmp_filename, len(data))
+
+    def put_file(self, key, path):
+        """Like put(), for a result that is in a file; the file is copied, not read into memory."""
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            return
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as tmp_file, \
+                open(path, 'rb') as f:
+            shutil.copyfileobj(f, tmp_file)
+            tmp_filename = tmp_file.name
+        self.add(key, tmp_filename, size)
+
+    def add(self, key, tmp_filename, size):
+        os.replace(tmp_filename, self.path_for(key))
+        with self.lock:
+            self.total_bytes += size
+            over_limit = self.total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def scan(self):
+        """Returns [(mtime, size, path)] for every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.xlsx'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Evicted by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        entries = self.scan()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+        with self.lock:
+            self.total_bytes = total
+
+    def stats(self):
+        entries = self.scan()
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'pid': os.getpid(),
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes
+            }
+
+format_cache = FormatResultCache(FORMAT_CACHE_DIR, FORMAT_CACHE_MAX_BYTES)
+
+class StaticAsset:
+    """One static file held in memory with its precompressed encodings."""
+    def __init__(self, path, mtime_ns, size, data):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.mtime = mtime_ns / 1e9
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        self.encodings = {'identity': (data, f'"{digest}"')}
+        gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(gzipped) < len(data):
+            self.encodings['gzip'] = (gzipped, f'"{digest}-gzip"')
+        if brotli is not None:
+            compressed = brotli.compress(data, mode=brotli.MODE_TEXT)
+            if len(compressed) < len(data):
+                self.encodings['br'] = (compressed, f'"{digest}-br"')
+
+    def negotiate(self, accept_encoding):
+        """Picks the smallest encoding the Accept-Encoding header allows; returns (name, data, etag)."""
+        accepted = {}
+        for item in (accept_encoding or '').split(','):
+            coding, _, params = item.strip().partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            if coding:
+                accepted[coding.strip().lower()] = quality
+        best = 'identity'
+        for coding in ('br', 'gzip'):
+            if coding in self.encodings and accepted.get(coding, accepted.get('*', 0)) > 0:
+                best = coding
+                break
+        data, etag = self.encodings[best]
+        return best, data, etag
+
+class StaticAssetCache:
+    """
+    In-memory cache of STATIC_ASSETS and their gzip/brotli encodings.
+    Files are compressed when first requested (or by warm() at startup) and again
+    whenever their mtime or size changes on disk.
+    """
+    def __init__(self, directory, names):
+        self.directory = directory
+        self.names = names
+        self.assets = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """Returns the StaticAsset for name, reloading it if the file changed, or None."""
+        if name not in self.names:
+            return None
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        asset = self.assets.get(name)
+        if asset is not None and asset.mtime_ns == stat.st_mtime_ns and asset.size == stat.st_size:
+            return asset
+        with self.lock:
+            asset = self.assets.get(name)
+            if asset is None or asset.mtime_ns != stat.st_mtime_ns or asset.size != stat.st_size:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                asset = StaticAsset(path, stat.st_mtime_ns, len(data), data)
+                self.assets[name] = asset
+                print(f"DEBUG: Compressed {name}: " + ", ".join(
+                    f"{coding} {len(encoded)} bytes" for coding, (encoded, _) in asset.encodings.items()))
+        return asset
+
+    def warm(self):
+        for name in self.names:
+            self.get(name)
+
+static_assets = StaticAssetCache(SCRIPT_DIR, STATIC_ASSETS)
 
 class ExcelSession:
     def __init__(self, filename, save_location):
         self.filename = filename
         self.save_location = save_location
-        self.workbook = Workbook()
+        self.workbook = FEATURES['excel'].load().Workbook()
         self.sheet = self.workbook.active
         self.row = 1
         self.websocket = None
@@ -110,115 +916,1186 @@ class ExcelSession:
         self.workbook.save(save_path)
         return save_path
 
+class BlobStore:
+    """
+    Content-addressed store for uploaded job inputs.
+    A blob is a file named after the SHA-256 of its content. Jobs hard-link to it, so a
+    re-uploaded video costs a rename and a link, not another copy. A blob whose only
+    remaining link is its own name is unreferenced and can be collected. On filesystems
+    without hard links uploads are simply moved into the job.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.deduplicated_bytes = 0  # Bytes not written again in this process
+
+    def path_for(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def add(self, source, digest, destination):
+        """
+        Moves the file at source (whose content hashes to digest) to destination, sharing
+        the stored blob when the same content was uploaded before. Returns True on a dedup.
+        """
+        blob_path = self.path_for(digest)
+        try:
+            os.link(blob_path, destination)
+        except FileNotFoundError:
+            pass  # New content
+        except OSError:
+            os.replace(source, destination)  # No hard links here
+            return False
+        else:
+            size = os.path.getsize(source)
+            os.unlink(source)
+            with self.lock:
+                self.deduplicated_bytes += size
+            print(f"DEBUG: {os.path.basename(destination)} is a re-upload of blob {digest}")
+            return True
+
+        # Link the blob name to the job's copy, so a blob never exists without a reference
+        os.replace(source, destination)
+        try:
+            os.link(destination, blob_path)
+        except FileExistsError:
+            # The same content was stored by another request meanwhile; share its copy
+            try:
+                os.link(blob_path, destination + '.tmp')
+                os.replace(destination + '.tmp', destination)
+            except OSError:
+                pass
+        except OSError:
+            pass  # The job keeps a private copy
+        return False
+
+    def linked_inodes(self, directory):
+        """The (device, inode) pairs of hard-linked files under directory."""
+        inodes = set()
+        for root, _, files in os.walk(directory):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if stat.st_nlink > 1:
+                    inodes.add((stat.st_dev, stat.st_ino))
+        return inodes
+
+    def collect(self, inodes=None):
+        """
+        Deletes unreferenced blobs, or only those among inodes (from linked_inodes()).
+        Returns the number of bytes freed.
+        """
+        freed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_nlink > 1 or (inodes is not None and (stat.st_dev, stat.st_ino) not in inodes):
+                    continue
+                os.unlink(path)
+            except OSError:
+                continue
+            freed += stat.st_size
+        return freed
+
+    def stats(self):
+        blobs = 0
+        total = 0
+        references = 0
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            blobs += 1
+            total += stat.st_size
+            references += stat.st_nlink - 1
+        with self.lock:
+            deduplicated = self.deduplicated_bytes
+        return {'blobs': blobs, 'bytes': total, 'references': references,
+                'deduplicated_bytes': deduplicated, 'pid': os.getpid()}
+
+blob_store = BlobStore(BLOB_DIR)
+
+def delete_job_files(job_id):
+    """
+    Removes a job's directory, its blobs no other job links to, and its index entry.
+    The caller must hold the job's claim. Returns the number of bytes freed.
+    """
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    freed = 0
+    if os.path.exists(job_dir):
+        freed = reclaimable_bytes(job_dir)
+        shared_inodes = blob_store.linked_inodes(job_dir)
+        shutil.rmtree(job_dir)
+        blob_store.collect(shared_inodes)
+    job_index.remove(job_id)
+    return freed
+
+def reclaimable_bytes(path):
+    """
+    Bytes that deleting path would free: files with no hard links besides their blob
+    (a link count of 2 or less) count, files shared with other jobs do not.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.st_nlink <= 2:
+                total += stat.st_size
+    return total
+
+def disk_usage(path):
+    """Total size of the files under path, counting hard-linked files once."""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+class RetentionScheduler:
+    """
+    Background thread enforcing RETENTION_MAX_AGE and RETENTION_QUOTA_BYTES on UPLOAD_DIR.
+    Runs in one process only (the server, or the pre-fork supervisor) and publishes its
+    counters to RETENTION_STATS_FILE so every worker can serve them.
+    """
+    def __init__(self, max_age, quota_bytes, interval):
+        self.max_age = max_age
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.loop, name='retention', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"ERROR in retention run: {e}") # DEBUG
+            self.stop_event.wait(self.interval)
+
+    def run_once(self):
+        started = time.time()
+        run = {'reclaimed_bytes': 0, 'deleted_jobs': 0, 'evicted_artefacts': 0, 'tts_files_removed': 0}
+        not_jobs = {os.path.basename(d) for d in (UPLOAD_SPOOL_DIR, BLOB_DIR, FORMAT_CACHE_DIR, PREVIEW_DIR,
+                                                  EXCEL_SESSION_DIR, METRICS_DIR, PROFILE_DIR, MEMORY_DIR)}
+
+        # Expire whole jobs and previews by age
+        candidates = []
+        for job_id in os.listdir(UPLOAD_DIR):
+            job_dir = os.path.join(UPLOAD_DIR, job_id)
+            if job_id in not_jobs or not os.path.isdir(job_dir):
+                continue
+            last_active = self.last_active(job_dir)
+            if started - last_active > self.max_age:
+                self.evict_job(job_id, run)
+                continue
+            if os.path.exists(os.path.join(job_dir, UPLOAD_SESSION_FILE)):
+                continue  # An upload still in progress only expires by age, never for quota
+            for name in INTERMEDIATE_DIRS:
+                path = os.path.join(job_dir, name)
+                if os.path.isdir(path):
+                    candidates.append((0, last_active, path, job_id))
+            candidates.append((1, last_active, job_dir, job_id))
+        for name in os.listdir(PREVIEW_DIR) if os.path.isdir(PREVIEW_DIR) else []:
+            path = os.path.join(PREVIEW_DIR, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if started - mtime > self.max_age:
+                self.evict_path(path, None, run)
+            else:
+                candidates.append((0, mtime, path, None))
+
+        # Over quota: intermediate artefacts go before whole jobs, the largest and
+        # oldest (by size times age) first within each group
+        usage = disk_usage(UPLOAD_DIR)
+        if usage > self.quota_bytes:
+            sized = [(tier, -reclaimable_bytes(path) * max(started - mtime, 1), path, job_id)
+                     for tier, mtime, path, job_id in candidates]
+            sized.sort(key=lambda candidate: candidate[:2])
+            for tier, _, path, job_id in sized:
+                if usage <= self.quota_bytes:
+                    break
+                if tier == 1:
+                    freed = self.evict_job(job_id, run)
+                else:
+                    freed = self.evict_path(path, job_id, run)
+                usage -= freed
+
+        self.sweep_tts_files(started, run)
+        self.publish(run, usage, time.time() - started)
+        return run
+
+    @staticmethod
+    def last_active(job_dir):
+        """Latest mtime of the job directory, its state file, its upload session and its results."""
+        latest = 0
+        for path in (job_dir, os.path.join(job_dir, JOB_STATE_FILE), os.path.join(job_dir, UPLOAD_SESSION_FILE),
+                     os.path.join(job_dir, 'results')):
+            try:
+                latest = max(latest, os.path.getmtime(path))
+            except OSError:
+                pass
+        return latest
+
+    def evict_job(self, job_id, run):
+        if not claim_job(job_id):
+            return 0  # Queued, running or being cleaned up
+        try:
+            freed = delete_job_files(job_id)
+        except OSError as e:
+            print(f"DEBUG: Could not delete job {job_id}: {e}")
+            release_job(job_id)
+            return 0
+        print(f"DEBUG: Retention deleted job {job_id} ({freed} bytes)")
+        run['deleted_jobs'] += 1
+        run['reclaimed_bytes'] += freed
+        return freed
+
+    def evict_path(self, path, job_id, run):
+        """Deletes an intermediate folder of job_id, or a preview file when job_id is None."""
+        if job_id is not None and not claim_job(job_id):
+            return 0
+        try:
+            freed = reclaimable_bytes(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+        except OSError:
+            return 0
+        finally:
+            if job_id is not None:
+                release_job(job_id)
+        run['evicted_artefacts'] += 1
+        run['reclaimed_bytes'] += freed
+        return freed
+
+    def sweep_tts_files(self, now, run):
+        temp_dir = tempfile.gettempdir()
+        for name in os.listdir(temp_dir):
+            if not TTS_TEMP_PATTERN.fullmatch(name):
+                continue
+            path = os.path.join(temp_dir, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime <= TTS_TEMP_MAX_AGE:
+                    continue
+                os.unlink(path)
+            except OSError:
+                continue
+            run['tts_files_removed'] += 1
+            run['reclaimed_bytes'] += stat.st_size
+
+    def publish(self, run, usage, duration):
+        """Adds this run to the totals in RETENTION_STATS_FILE."""
+        stats = read_retention_stats()
+        stats['runs'] = stats.get('runs', 0) + 1
+        for key, value in run.items():
+            stats[key] = stats.get(key, 0) + value
+        stats.update(last_run=time.time(), last_duration=duration, last_reclaimed_bytes=run['reclaimed_bytes'],
+                     usage_bytes=usage, quota_bytes=self.quota_bytes, max_age=self.max_age)
+        with tempfile.NamedTemporaryFile('w', dir=UPLOAD_DIR, suffix='.tmp', delete=False) as tmp_file:
+            json.dump(stats, tmp_file)
+        os.replace(tmp_file.name, RETENTION_STATS_FILE)
+
+def read_retention_stats():
+    try:
+        with open(RETENTION_STATS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+retention = RetentionScheduler(RETENTION_MAX_AGE, RETENTION_QUOTA_BYTES, RETENTION_INTERVAL)
+
+def route_label(path):
+    """The route a request path is counted under, keeping the number of label values bounded."""
+    path = urlparse(path).path
+    if path in METRIC_ROUTES:
+        return path
+    for prefix in METRIC_ROUTE_PREFIXES:
+        if path.startswith(prefix):
+            return prefix + '*'
+    return 'other'
+
+class Metrics:
+    """
+    Counters, gauges and histograms with per-thread shards.
+    Recording only touches the calling thread's own dicts, so it never waits on a lock;
+    snapshot() adds the shards up when /metrics is scraped.
+    """
+    HELP = {
+        'http_requests_total': ('counter', 'HTTP requests by route, method and status'),
+        'http_request_duration_seconds': ('histogram', 'HTTP request latency by route'),
+        'http_request_bytes_total': ('counter', 'Request body bytes received by route'),
+        'http_response_bytes_total': ('counter', 'Response bytes sent by route, headers included'),
+        'http_requests_in_flight': ('gauge', 'Requests currently being handled'),
+        'job_queue_depth': ('gauge', 'Background jobs waiting for a worker'),
+        'video_stage_duration_seconds': ('histogram', 'Duration of each video pipeline stage'),
+        'retention_reclaimed_bytes_total': ('counter', 'Bytes deleted by the retention scheduler'),
+        'format_cache_hits_total': ('counter', 'Format result cache hits'),
+        'format_cache_misses_total': ('counter', 'Format result cache misses')
+    }
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()  # Only taken when a thread records for the first time
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = ({}, {}, {})  # counters, gauges, histograms
+            with self.shards_lock:
+                self.shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self.shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def add(self, name, labels=(), value=1):
+        """Adds value (possibly negative) to a gauge."""
+        gauges = self.shard()[1]
+        key = (name, labels)
+        gauges[key] = gauges.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        histograms = self.shard()[2]
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+        counts = histogram[1]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        histogram[2] += value
+        histogram[3] += 1
+
+    def snapshot(self):
+        """
+        Totals across threads as {'counters', 'gauges', 'histograms'}, each a list of
+        [name, labels, value] entries (labels as [[key, value], ...]) so it can go to JSON.
+        """
+        counters = {}
+        gauges = {}
+        histograms = {}
+        with self.shards_lock:
+            shards = list(self.shards)
+        for shard_counters, shard_gauges, shard_histograms in shards:
+            # dict() copies are atomic in CPython, so recording threads never need to stop
+            for key, value in dict(shard_counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, value in dict(shard_gauges).items():
+                gauges[key] = gauges.get(key, 0) + value
+            for key, (buckets, counts, total, count) in dict(shard_histograms).items():
+                merged = histograms.setdefault(key, [list(buckets), [0] * len(buckets), 0.0, 0])
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+                merged[3] += count
+        return {
+            'counters': [[name, [list(label) for label in labels], value] for (name, labels), value in counters.items()],
+            'gauges': [[name, [list(label) for label in labels], value] for (name, labels), value in gauges.items()],
+            'histograms': [[name, [list(label) for label in labels], value] for (name, labels), value in histograms.items()]
+        }
+
+    @classmethod
+    def render(cls, snapshots):
+        """Adds up snapshots and formats them in the Prometheus text exposition format."""
+        merged = {}
+        for snapshot in snapshots:
+            for kind in ('counters', 'gauges'):
+                for name, labels, value in snapshot.get(kind, []):
+                    key = (name, tuple(tuple(label) for label in labels))
+                    merged[key] = merged.get(key, 0) + value
+            for name, labels, (buckets, counts, total, count) in snapshot.get('histograms', []):
+                key = (name, tuple(tuple(label) for label in labels))
+                if key in merged:
+                    _, old_counts, old_total, old_count = merged[key]
+                    merged[key] = [buckets, [a + b for a, b in zip(old_counts, counts)], old_total + total, old_count + count]
+                else:
+                    merged[key] = [buckets, list(counts), total, count]
+
+        lines = []
+        for metric in sorted({name for name, _ in merged}):
+            kind, description = cls.HELP.get(metric, ('untyped', metric))
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (name, labels), value in sorted(merged.items()):
+                if name != metric:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                buckets, counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+metrics = Metrics()
+
+def collect_metrics():
+    """This process's metrics, with the gauges that are read rather than recorded."""
+    snapshot = metrics.snapshot()
+    for job_type, depth in job_queue.depth().items():
+        snapshot['gauges'].append(['job_queue_depth', [['type', job_type]], depth])
+    snapshot['counters'].append(['format_cache_hits_total', [], format_cache.hits])
+    snapshot['counters'].append(['format_cache_misses_total', [], format_cache.misses])
+    return snapshot
+
+def write_metrics_file():
+    """Publishes this worker's metrics to METRICS_DIR for the other workers' /metrics."""
+    with tempfile.NamedTemporaryFile('w', dir=METRICS_DIR, suffix='.tmp', delete=False) as tmp_file:
+        json.dump(collect_metrics(), tmp_file)
+    os.replace(tmp_file.name, os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+
+def read_worker_metrics():
+    """
+    Snapshots written by the other worker processes. Counters from workers that have
+    exited are kept so totals don't go backwards; their gauges are dropped once stale.
+    """
+    snapshots = []
+    own_file = f"{os.getpid()}.json"
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json') or name == own_file:
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+            stale = time.time() - os.path.getmtime(path) > 3 * METRICS_FLUSH_INTERVAL
+        except (OSError, ValueError):
+            continue
+        if stale:
+            snapshot['gauges'] = []
+        snapshots.append(snapshot)
+    return snapshots
+
+class ProfilingFlag:
+    """Stand-in for the shared multiprocessing.RawValue the pre-fork supervisor passes to workers."""
+    value = 0
+
+profiling_armed = ProfilingFlag()
+
+def arm_profiling(route, count):
+    """Arms profiling of the next count requests to route (0 disarms it)."""
+    route_dir = os.path.join(PROFILE_ARMED_DIR, hashlib.sha256(route.encode()).hexdigest()[:16])
+    shutil.rmtree(route_dir, ignore_errors=True)
+    if count:
+        os.makedirs(route_dir)
+        with open(os.path.join(route_dir, 'route'), 'w') as f:
+            f.write(route)
+        for i in range(count):
+            open(os.path.join(route_dir, f"{i}.token"), 'w').close()
+    profiling_armed.value = 1 if armed_profiles() else 0
+
+def armed_profiles():
+    """{route: requests left to profile}"""
+    armed = {}
+    try:
+        route_dirs = os.listdir(PROFILE_ARMED_DIR)
+    except FileNotFoundError:
+        return armed
+    for name in route_dirs:
+        try:
+            with open(os.path.join(PROFILE_ARMED_DIR, name, 'route')) as f:
+                route = f.read()
+            remaining = sum(1 for token in os.listdir(os.path.join(PROFILE_ARMED_DIR, name))
+                            if token.endswith('.token'))
+        except OSError:
+            continue
+        if remaining:
+            armed[route] = remaining
+    return armed
+
+def claim_profile_token(path):
+    """Takes one armed slot for a request to path; returns the route it was armed for, or None."""
+    armed = armed_profiles()
+    if not armed:
+        profiling_armed.value = 0
+        return None
+    for route in (urlparse(path).path, route_label(path)):
+        if route not in armed:
+            continue
+        route_dir = os.path.join(PROFILE_ARMED_DIR, hashlib.sha256(route.encode()).hexdigest()[:16])
+        for token in sorted(os.listdir(route_dir)):
+            if not token.endswith('.token'):
+                continue
+            try:
+                os.unlink(os.path.join(route_dir, token))  # Only one request wins each token
+            except FileNotFoundError:
+                continue
+            if armed[route] == 1 and len(armed) == 1:
+                profiling_armed.value = 0  # That was the last one
+            return route
+    return None
+
+def save_profile(profiler, route, method, path, status, duration):
+    """Writes a request's profile as <name>.pstats plus a <name>.txt cumulative-time summary."""
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-') or 'root'
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}-{os.getpid()}"
+    stats_path = os.path.join(PROFILE_DIR, f"{name}.pstats")
+    profiler.dump_stats(stats_path)
+    summary = io.StringIO()
+    summary.write(f"{method} {path} -> {status} in {duration:.3f} s (pid {os.getpid()})\n\n")
+    pstats.Stats(stats_path, stream=summary).sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+    with open(os.path.join(PROFILE_DIR, f"{name}.txt"), 'w') as f:
+        f.write(summary.getvalue())
+    print(f"DEBUG: Saved profile {name} for {method} {path}")
+
+def list_profiles():
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith('.pstats'):
+            continue
+        base = name[:-len('.pstats')]
+        try:
+            stat = os.stat(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            continue
+        profiles.append({
+            'name': base,
+            'created': stat.st_mtime,
+            'size': stat.st_size,
+            'pstats_url': f'/api/profile/{base}.pstats',
+            'summary_url': f'/api/profile/{base}.txt'
+        })
+    return profiles
+
+class MemoryTracker:
+    """
+    Per-route memory accounting with tracemalloc, for this process only.
+    tracemalloc's peak is process-wide, so it is reset only when nothing else is being
+    tracked; a request that overlapped others is marked 'overlapped' and shares their peak.
+    A sampler thread snapshots allocations whenever a tracked request reaches a new high,
+    so the worst requests keep the allocation sites from near their peak, not their end.
+    Snapshots are saved with Snapshot.dump() next to a baseline taken when tracking
+    started, so they can be loaded and diffed with Snapshot.compare_to(). Diffing a large
+    snapshot takes seconds, so the worst requests are written out by the sampler thread
+    rather than the request that finished.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.active = {}  # id(entry) -> entry for requests and jobs being tracked
+        self.routes = {}
+        self.worst = []
+        self.baseline = None
+        self.pending = []  # (record, snapshot) of finished requests waiting to be written out
+        self.stop_event = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.enabled:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+            self.baseline = tracemalloc.take_snapshot()
+            self.baseline.dump(os.path.join(self.directory, f"baseline-{os.getpid()}.snapshot"))
+            self.routes = {}
+            self.worst = []
+            self.pending = []
+            self.stop_event = threading.Event()
+            self.enabled = True
+        threading.Thread(target=self.sample, args=(self.stop_event,), name='memory-sampler', daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self.stop_event.set()
+            self.active.clear()
+            tracemalloc.stop()
+
+    def begin(self, label):
+        current, _ = tracemalloc.get_traced_memory()
+        entry = {'label': label, 'traced_start': current, 'rss_start': memory_usage()[0],
+                 'started': time.time(), 'high': current, 'snapshot': None, 'overlapped': False}
+        with self.lock:
+            if not self.active:
+                tracemalloc.reset_peak()
+            else:
+                entry['overlapped'] = True
+                for other in self.active.values():
+                    other['overlapped'] = True
+            self.active[id(entry)] = entry
+        return entry
+
+    def end(self, entry, detail):
+        _, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            if self.active.pop(id(entry), None) is None or not tracemalloc.is_tracing():
+                return  # Tracking was switched off meanwhile
+        rss = memory_usage()[0]
+        peak_traced = max(peak - entry['traced_start'], 0)
+        rss_delta = rss - entry['rss_start'] if rss is not None and entry['rss_start'] is not None else None
+        record = {
+            'pid': os.getpid(),
+            'label': entry['label'],
+            'detail': detail,
+            'started': entry['started'],
+            'seconds': time.time() - entry['started'],
+            'peak_traced_bytes': peak_traced,
+            'rss_delta_bytes': rss_delta,
+            'overlapped': entry['overlapped']
+        }
+        with self.lock:
+            stats = self.routes.setdefault(entry['label'], {
+                'count': 0, 'peak_traced_max': 0, 'peak_traced_total': 0, 'rss_delta_max': None,
+                'rss_delta_total': 0})
+            stats['count'] += 1
+            stats['peak_traced_max'] = max(stats['peak_traced_max'], peak_traced)
+            stats['peak_traced_total'] += peak_traced
+            if rss_delta is not None:
+                if stats['rss_delta_max'] is None or rss_delta > stats['rss_delta_max']:
+                    stats['rss_delta_max'] = rss_delta
+                stats['rss_delta_total'] += rss_delta
+            is_worst = len(self.worst) < MEMORY_WORST_REQUESTS or peak_traced > self.worst[-1]['peak_traced_bytes']
+            if is_worst and tracemalloc.is_tracing():
+                self.pending.append((record, entry['snapshot'] or tracemalloc.take_snapshot()))
+
+    def keep_worst(self, record, snapshot):
+        """Saves the snapshot of one of the worst requests and drops the one it displaces."""
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', record['label']).strip('-') or 'root'
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}-{os.getpid()}"
+        snapshot.dump(os.path.join(self.directory, f"{name}.snapshot"))
+        overlapped = ' (overlapped other requests)' if record['overlapped'] else ''
+        with open(os.path.join(self.directory, f"{name}.txt"), 'w') as f:
+            f.write(f"{record['label']} {record['detail']}: peak {record['peak_traced_bytes']} bytes traced, "
+                    f"RSS change {record['rss_delta_bytes']} bytes{overlapped}\n\n")
+            f.write(f"Top allocation sites compared with baseline-{os.getpid()}.snapshot:\n")
+            sites = [stat for stat in snapshot.compare_to(self.baseline, 'lineno')
+                     if stat.traceback[0].filename not in MEMORY_IGNORED_FILES]
+            for stat in sites[:MEMORY_TOP_SITES]:
+                f.write(f"{stat}\n")
+        record['name'] = name
+        with self.lock:
+            self.worst.append(record)
+            self.worst.sort(key=lambda worst: worst['peak_traced_bytes'], reverse=True)
+            dropped = self.worst[MEMORY_WORST_REQUESTS:]
+            del self.worst[MEMORY_WORST_REQUESTS:]
+        for old in dropped:
+            for extension in ('.snapshot', '.txt'):
+                try:
+                    os.unlink(os.path.join(self.directory, old['name'] + extension))
+                except OSError:
+                    pass
+
+    def sample(self, stop_event):
+        """
+        Snapshots allocations when a tracked request reaches a new high that could rank among
+        the worst, and writes out the worst requests that have finished since the last pass.
+        """
+        while not stop_event.wait(MEMORY_SAMPLE_INTERVAL):
+            with self.lock:
+                pending, self.pending = self.pending, []
+            for record, snapshot in pending:
+                self.keep_worst(record, snapshot)
+            current, _ = tracemalloc.get_traced_memory()
+            with self.lock:
+                threshold = self.worst[-1]['peak_traced_bytes'] if len(self.worst) >= MEMORY_WORST_REQUESTS else 0
+                rising = [entry for entry in self.active.values()
+                          if current > entry['high'] and current - entry['traced_start'] > threshold]
+                for entry in rising:
+                    entry['high'] = current
+            if rising:
+                snapshot = tracemalloc.take_snapshot()
+                for entry in rising:
+                    entry['snapshot'] = snapshot
+
+    def report(self):
+        """This process's numbers, keyed by its pid; other workers track their own requests."""
+        with self.lock:
+            routes = {}
+            for label, stats in self.routes.items():
+                routes[label] = dict(stats, peak_traced_avg=stats['peak_traced_total'] / stats['count'],
+                                     rss_delta_avg=stats['rss_delta_total'] / stats['count'])
+            worst = [dict(record, snapshot_url=f"/api/memory/{record['name']}.snapshot",
+                          summary_url=f"/api/memory/{record['name']}.txt") for record in self.worst]
+        traced = tracemalloc.get_traced_memory()[0] if self.enabled else 0
+        return {'workers': {str(os.getpid()): {'enabled': self.enabled, 'rss_bytes': memory_usage()[0],
+                                               'traced_bytes': traced, 'routes': routes, 'worst': worst}}}
+
+memory_tracker = MemoryTracker(MEMORY_DIR)
+
+class CountingWriter:
+    """Wraps a handler's wfile to count the bytes written to it."""
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.wfile.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.wfile, name)
+
+class UploadTooLarge(ValueError):
+    """Raised when a request body is larger than the upload limit."""
+
+class UploadedFile:
+    """A file part that was spooled to disk while the request was parsed."""
+    def __init__(self, filename, path, size, sha256):
+        self.filename = filename  # As sent by the client, in bytes
+        self.path = path
+        self.size = size
+        self.sha256 = sha256  # Hex digest of the content
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def save(self, destination):
+        """Moves the spooled file to destination (a rename; the spool is under UPLOAD_DIR)."""
+        os.replace(self.path, destination)
+        self.path = destination
+
+    def store(self, destination):
+        """Saves the file to destination through the blob store, deduplicating by content."""
+        blob_store.add(self.path, self.sha256, destination)
+        self.path = destination
+
+    def discard(self):
+        """Removes the spooled file if it was never saved."""
+        if os.path.dirname(self.path) == UPLOAD_SPOOL_DIR:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+class ChunkedUpload:
+    """
+    A resumable upload of a video job's files into its job directory.
+    Each file is preallocated at its full size as <name>.part and every chunk is written at
+    its own offset, so chunks can arrive in any order and in parallel. <field>.chunks holds
+    the SHA-256 of each chunk received, zeros for the rest; it is the record of what has
+    arrived, shared by all worker processes, and finalize checks the file against it.
+    A chunk is received into a spool file first and copied into place under the job's
+    claim, the same claim finalize and retention take, so none of them overlap.
+    """
+    DIGEST_SIZE = 32
+    MISSING = bytes(DIGEST_SIZE)
+
+    def __init__(self, job_id, session):
+        self.job_id = job_id
+        self.job_dir = os.path.join(UPLOAD_DIR, job_id)
+        self.chunk_size = session['chunk_size']
+        self.files = session['files']  # field -> {'name', 'size', 'chunks'}
+
+    @classmethod
+    def create(cls, files, chunk_size):
+        """Opens a session for files, a dict of field -> (sanitized filename, size)."""
+        job_id = os.urandom(16).hex()
+        job_dir = os.path.join(UPLOAD_DIR, job_id)
+        os.makedirs(job_dir)
+        session = {'chunk_size': chunk_size, 'created': time.time(), 'files': {}}
+        try:
+            for field, (name, size) in files.items():
+                chunks = -(-size // chunk_size)
+                with open(os.path.join(job_dir, name + '.part'), 'wb') as f:
+                    # Reserve the blocks up front, so a full disk fails here rather than mid-upload
+                    # and the file isn't fragmented by chunks arriving out of order
+                    if hasattr(os, 'posix_fallocate'):
+                        os.posix_fallocate(f.fileno(), 0, size)
+                    else:
+                        f.truncate(size)
+                with open(os.path.join(job_dir, f"{field}.chunks"), 'wb') as f:
+                    f.truncate(chunks * cls.DIGEST_SIZE)
+                session['files'][field] = {'name': name, 'size': size, 'chunks': chunks}
+            with tempfile.NamedTemporaryFile('w', dir=job_dir, suffix='.tmp', delete=False) as tmp_file:
+                json.dump(session, tmp_file)
+            os.replace(tmp_file.name, os.path.join(job_dir, UPLOAD_SESSION_FILE))
+        except OSError:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        return cls(job_id, session)
+
+    @classmethod
+    def open(cls, job_id):
+        """The upload session of job_id, or None if there is none (or it was finalized)."""
+        if len(job_id) != 32 or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(os.path.join(UPLOAD_DIR, job_id, UPLOAD_SESSION_FILE)) as f:
+                return cls(job_id, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def part_path(self, field):
+        return os.path.join(self.job_dir, self.files[field]['name'] + '.part')
+
+    def chunks_path(self, field):
+        return os.path.join(self.job_dir, f"{field}.chunks")
+
+    def chunk_length(self, field, index):
+        return min(self.chunk_size, self.files[field]['size'] - index * self.chunk_size)
+
+    def receive_chunk(self, field, index, rfile):
+        """
+        Reads chunk index of field from rfile into a spool file, without holding the job's
+        claim. Returns the spool file's path and the chunk's SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        remaining = self.chunk_length(field, index)
+        fd, spool_path = tempfile.mkstemp(dir=UPLOAD_SPOOL_DIR, suffix='.chunk')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while remaining:
+                    data = rfile.read(min(remaining, MultipartFormParser.CHUNK_SIZE))
+                    if not data:
+                        raise ConnectionError("Client disconnected in the middle of a chunk")
+                    digest.update(data)
+                    f.write(data)
+                    remaining -= len(data)
+        except BaseException:
+            os.unlink(spool_path)
+            raise
+        return spool_path, digest.digest()
+
+    def write_chunk(self, field, index, spool_path):
+        """Copies a received chunk into place. The caller holds the job's claim."""
+        with open(spool_path, 'rb') as source, open(self.part_path(field), 'r+b') as f:
+            f.seek(index * self.chunk_size)
+            shutil.copyfileobj(source, f, MultipartFormParser.CHUNK_SIZE)
+
+    def mark_received(self, field, index, digest):
+        with open(self.chunks_path(field), 'r+b') as f:
+            f.seek(index * self.DIGEST_SIZE)
+            f.write(digest)
+        os.utime(os.path.join(self.job_dir, UPLOAD_SESSION_FILE))  # Keeps retention off an active upload
+
+    def chunk_digests(self, field):
+        with open(self.chunks_path(field), 'rb') as f:
+            data = f.read()
+        return [data[i:i + self.DIGEST_SIZE] for i in range(0, len(data), self.DIGEST_SIZE)]
+
+    def received(self, field):
+        return [index for index, digest in enumerate(self.chunk_digests(field)) if digest != self.MISSING]
+
+    def status(self):
+        return {
+            'upload_id': self.job_id,
+            'chunk_size': self.chunk_size,
+            'files': {field: dict(info, received=self.received(field)) for field, info in self.files.items()}
+        }
+
+    def verify(self, field):
+        """
+        Re-reads the whole file and checks every chunk against the digest recorded when it
+        arrived. Returns the file's SHA-256, its manifest digest (the SHA-256 of the chunk
+        digests in order, which the browser computes as it sends) and the bad chunks.
+        """
+        whole = hashlib.sha256()
+        manifest = hashlib.sha256()
+        bad_chunks = []
+        with open(self.part_path(field), 'rb') as f:
+            for index, recorded in enumerate(self.chunk_digests(field)):
+                data = f.read(self.chunk_length(field, index))
+                digest = hashlib.sha256(data).digest()
+                if digest != recorded:
+                    bad_chunks.append(index)
+                whole.update(data)
+                manifest.update(digest)
+        return whole.hexdigest(), manifest.hexdigest(), bad_chunks
+
+    def forget_chunks(self, field, indices):
+        """Marks chunks as not received, so the client sends them again."""
+        for index in indices:
+            self.mark_received(field, index, self.MISSING)
+
+    def complete(self, digests):
+        """
+        Moves the verified files (field -> SHA-256) into the job through the blob store and
+        closes the session. Returns the job's input filenames.
+        """
+        for field, sha256 in digests.items():
+            blob_store.add(self.part_path(field), sha256, os.path.join(self.job_dir, self.files[field]['name']))
+            os.unlink(self.chunks_path(field))
+        os.unlink(os.path.join(self.job_dir, UPLOAD_SESSION_FILE))
+        return [info['name'] for info in self.files.values()]
+
 class MultipartFormParser:
-    def __init__(self, content_type, content_length, rfile):
+    """
+    Streaming multipart/form-data parser. Reads the body in fixed-size chunks and scans for
+    the boundary, so memory use stays at a few chunks whatever the upload size. File parts
+    are written straight to spool files under UPLOAD_SPOOL_DIR, with their size and
+    SHA-256 computed on the way.
+    """
+    CHUNK_SIZE = 256 * 1024
+    MAX_HEADER_BYTES = 16 * 1024
+    MAX_FIELD_BYTES = 1024 * 1024
+
+    def __init__(self, content_type, content_length, rfile, max_bytes=None):
         self.content_type = content_type
         self.content_length = content_length
         self.rfile = rfile
+        self.max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.files = []  # Every UploadedFile created, so callers can discard the unused ones
         print(f"MultipartFormParser initialized with content length: {content_length}")  # Debug log
-        
+
+    def _fill(self, buffer):
+        """Reads the next chunk of the body into buffer. Returns False at the end of the body."""
+        if self.remaining <= 0:
+            return False
+        chunk = self.rfile.read(min(self.CHUNK_SIZE, self.remaining))
+        if not chunk:
+            raise ValueError("Unexpected end of upload")
+        self.remaining -= len(chunk)
+        buffer += chunk
+        return True
+
     def parse(self):
+        """
+        Returns {field name: value} with names as bytes. Text fields are bytes; file parts
+        are (filename bytes, UploadedFile). Raises UploadTooLarge before reading anything
+        if Content-Length is over the limit, and ValueError for malformed bodies.
+        """
         print("Starting form parse")  # Debug log
+        if self.content_length > self.max_bytes:
+            raise UploadTooLarge(f"Upload of {self.content_length} bytes exceeds the {self.max_bytes} byte limit")
+        try:
+            boundary = self.content_type.split('boundary=')[1].split(';')[0].strip().strip('"').encode()
+        except IndexError:
+            raise ValueError("Missing multipart boundary")
+
+        # Every boundary, including the first, is matched as CRLF--boundary
+        delimiter = b'\r\n--' + boundary
+        self.remaining = self.content_length
+        buffer = bytearray(b'\r\n')
         fields = {}
 
-        try:
-            # Get boundary from content type
-            boundary = self.content_type.split('boundary=')[1].encode()
-            print(f"Found boundary: {boundary}")  # Debug log
-            remainbytes = self.content_length
-            
-            # Read until first boundary
+        # Skip the preamble up to the first boundary
+        while True:
+            index = buffer.find(delimiter)
+            if index != -1:
+                del buffer[:index + len(delimiter)]
+                break
+            del buffer[:max(len(buffer) - len(delimiter), 0)]
+            if not self._fill(buffer):
+                raise ValueError("No multipart boundary found")
+
+        while True:
+            # After a boundary: "--" ends the body, CRLF starts another part
+            while len(buffer) < 2 and self._fill(buffer):
+                pass
+            if buffer[:2] == b'--':
+                break
+            if buffer[:2] != b'\r\n':
+                raise ValueError("Malformed multipart boundary")
+            del buffer[:2]
+
+            # Part headers end with an empty line
             while True:
-                line = self.rfile.readline()
-                remainbytes -= len(line)
-                if boundary in line:
-                    print("Found first boundary")  # Debug log
+                header_end = buffer.find(b'\r\n\r\n')
+                if header_end != -1:
                     break
-
-            # Process form fields
-            while remainbytes > 0:
-                try:
-            # Parse headers
-                    # Parse headers
-                    headers = {}
-                    while True:
-                        line = self.rfile.readline()
-                        remainbytes -= len(line)
-                        if line == b'\r\n':
-                            break
-                        
-                        # Parse header line
-                        line = line.decode('utf-8').strip()
-                        if ':' in line:
-                            key, value = line.split(':', 1)
-                            headers[key.strip().lower()] = value.strip()
-                    
-                    # Get field name and filename from Content-Disposition
-                    filename = None
-                    name = None
-                    if 'content-disposition' in headers:
-                        disposition = headers['content-disposition']
-                        items = disposition.split(';')
-                        for item in items:
-                            item = item.strip()
-                            if item.startswith('name='):
-                                name = item.split('=')[1].strip('"')
-                            elif item.startswith('filename='):
-                                filename = item.split('=')[1].strip('"')
-                        if not name:  # If name wasn't found, skip this part
-                            continue
-                    else:
-                        continue
-                    
-                    # Read content until boundary
-                    content = io.BytesIO()
-                    while remainbytes > 0:
-                        line = self.rfile.readline()
-                        remainbytes -= len(line)
-                        if boundary in line:
-                            break
-                        content.write(line)
-                    
-                    # Store field value and filename
-                    value = content.getvalue().strip(b'\r\n')
-                    if filename:
-                        print(f"Found file: {filename}, content length: {len(value)}")  # Debug log
-                        # Store as a tuple: (filename, content)
-                        fields[name.encode()] = (filename.encode(), value)
-                    else:
-                        print(f"Found field: {name}")  # Debug log
-                        # Store just the value
-                        fields[name.encode()] = value
-
-                    if remainbytes <= 0:
+                if len(buffer) > self.MAX_HEADER_BYTES:
+                    raise ValueError("Multipart headers too long")
+                if not self._fill(buffer):
+                    raise ValueError("Unexpected end of upload")
+            headers = {}
+            for line in bytes(buffer[:header_end]).decode('utf-8', errors='replace').split('\r\n'):
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+            del buffer[:header_end + 4]
+
+            # Get field name and filename from Content-Disposition
+            name = None
+            filename = None
+            for item in headers.get('content-disposition', '').split(';'):
+                item = item.strip()
+                if item.startswith('name='):
+                    name = item.split('=', 1)[1].strip('"')
+                elif item.startswith('filename='):
+                    filename = item.split('=', 1)[1].strip('"')
+
+            # Stream the body up to the next boundary into a spool file or a small buffer
+            if filename is not None:
+                fd, spool_path = tempfile.mkstemp(dir=UPLOAD_SPOOL_DIR, suffix='.part')
+                sink = os.fdopen(fd, 'wb')
+                upload = UploadedFile(filename.encode(), spool_path, 0, None)
+                self.files.append(upload)
+                digest = hashlib.sha256()
+            else:
+                sink = io.BytesIO()
+            size = 0
+            try:
+                while True:
+                    index = buffer.find(delimiter)
+                    end = index if index != -1 else max(len(buffer) - len(delimiter) + 1, 0)
+                    if end:
+                        piece = bytes(buffer[:end])
+                        sink.write(piece)
+                        size += end
+                        if filename is not None:
+                            digest.update(piece)
+                        elif size > self.MAX_FIELD_BYTES:
+                            raise ValueError(f"Form field {name} is too large")
+                        del buffer[:end]
+                    if index != -1:
+                        del buffer[:len(delimiter)]
                         break
+                    if not self._fill(buffer):
+                        raise ValueError("Unexpected end of upload")
+            finally:
+                if filename is not None:
+                    sink.close()
+
+            if not name:  # If name wasn't found, skip this part
+                continue
+            if filename is not None:
+                upload.size = size
+                upload.sha256 = digest.hexdigest()
+                print(f"Found file: {filename}, content length: {size}")  # Debug log
+                fields[name.encode()] = (filename.encode(), upload)
+            else:
+                print(f"Found field: {name}")  # Debug log
+                fields[name.encode()] = sink.getvalue()
 
-                except Exception as e:
-                    print(f"Error processing field: {str(e)}")  # Debug log
-                    continue
-        except Exception as e:
-            print(f"Error in main form processing loop: {str(e)}")  # Debug log
-            return fields
-        
         print(f"Form parsing complete. Found fields: {list(fields.keys())}")  # Debug log
         return fields
 
 class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=SCRIPT_DIR, **kwargs)
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def handle_one_request(self):
+        self.request_started = None
+        self.response_status = None
+        self.profiler = None
+        self.memory_entry = None
+        self.wfile.bytes_written = 0
+        try:
+            super().handle_one_request()
+        finally:
+            if self.memory_entry is not None:
+                memory_tracker.end(self.memory_entry, f"{self.command} {self.path}")
+            if self.profiler is not None:
+                self.finish_profile()
+            if self.request_started is not None:
+                self.record_request_metrics()
+
+    def parse_request(self):
+        # Called once the request line is in, so keep-alive idle time isn't counted
+        self.request_started = time.perf_counter()
+        metrics.add('http_requests_in_flight', (), 1)
+        parsed = super().parse_request()
+        if parsed and memory_tracker.enabled:
+            self.memory_entry = memory_tracker.begin(route_label(self.path))
+        if parsed and profiling_armed.value:
+            self.profiled_route = claim_profile_token(self.path)
+            if self.profiled_route is not None:
+                # Profiles the rest of this request on this thread, handler included
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+        return parsed
+
+    def finish_profile(self):
+        self.profiler.disable()
+        try:
+            save_profile(self.profiler, self.profiled_route, self.command, self.path, self.response_status,
+                         time.perf_counter() - self.request_started)
+        except Exception as e:
+            print(f"ERROR saving profile: {e}") # DEBUG
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def record_request_metrics(self):
+        duration = time.perf_counter() - self.request_started
+        metrics.add('http_requests_in_flight', (), -1)
+        route = route_label(self.path) if self.command else 'other'
+        method = self.command or 'unknown'
+        metrics.inc('http_requests_total', (('route', route), ('method', method),
+                                            ('status', str(self.response_status or 0))))
+        metrics.observe('http_request_duration_seconds', (('route', route), ('method', method)), duration)
+        try:
+            headers = getattr(self, 'headers', None)
+            request_bytes = int(headers.get('Content-Length') or 0) if headers else 0
+        except ValueError:
+            request_bytes = 0
+        if request_bytes:
+            metrics.inc('http_request_bytes_total', (('route', route),), request_bytes)
+        metrics.inc('http_response_bytes_total', (('route', route),), self.wfile.bytes_written)
+
+    def handle_metrics(self):
+        snapshots = [collect_metrics()]
+        if worker_shutdown_event is not None:
+            snapshots.extend(read_worker_metrics())
+        retention_stats = read_retention_stats()
+        snapshots.append({'counters': [['retention_reclaimed_bytes_total', [],
+                                        retention_stats.get('reclaimed_bytes', 0)]]})
+        body = Metrics.render(snapshots).encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
     def do_GET(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path
         
-        if path == '/':
-            self.path = '/index.html'
+        if path == '/' or path[1:] in STATIC_ASSETS:
+            self.send_static_asset(path[1:] or 'index.html')
+            return
         elif path == '/shutdown':
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
             self.wfile.write(b'Server shutting down...')
-            threading.Thread(target=self.server.shutdown).start()
+            if worker_shutdown_event is not None:
+                worker_shutdown_event.set()  # The supervisor drains every worker process
+            else:
+                threading.Thread(target=self.server.shutdown).start()
             return
         elif path == '/get_frames':
             self.redirect_to('/templates/get_frames.html')
@@ -239,14 +2116,90 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             self.handle_browse_directory()
             return
         elif path == '/api/history':
+            self.handle_history(parse_qs(parsed_path.query))
+            return
+        elif path == '/api/tts-voices':
+            self.handle_get_tts_voices()
+            return
+        elif path == '/api/excel-preview':
+            self.handle_excel_preview()
+            return
+        elif path == '/api/memory':
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            history = self.get_upload_history()
-            self.wfile.write(json.dumps(history).encode())
+            self.wfile.write(json.dumps(memory_tracker.report()).encode())
             return
-        elif path == '/api/tts-voices':
-            self.handle_get_tts_voices()
+        elif path.startswith('/api/memory/'):
+            name = os.path.basename(path)
+            file_path = os.path.join(MEMORY_DIR, name)
+            if not name.endswith(('.snapshot', '.txt')) or not os.path.isfile(file_path):
+                self.send_error(404, "Snapshot not found")
+                return
+            if name.endswith('.txt'):
+                self.send_file(file_path, 'text/plain; charset=utf-8')
+            else:
+                self.send_file(file_path, 'application/octet-stream', download_name=name)
+            return
+        elif path == '/api/profile':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'armed': armed_profiles(), 'profiles': list_profiles()}).encode())
+            return
+        elif path.startswith('/api/profile/'):
+            name = os.path.basename(path)
+            file_path = os.path.join(PROFILE_DIR, name)
+            if not name.endswith(('.pstats', '.txt')) or not os.path.isfile(file_path):
+                self.send_error(404, "Profile not found")
+                return
+            if name.endswith('.txt'):
+                self.send_file(file_path, 'text/plain; charset=utf-8')
+            else:
+                self.send_file(file_path, 'application/octet-stream', download_name=name)
+            return
+        elif path.startswith('/api/jobs/') and path.endswith('/timings'):
+            self.handle_job_timings(path.split('/')[3])
+            return
+        elif path.startswith('/api/jobs/'):
+            self.handle_job_status(path.split('/')[3])
+            return
+        elif path == '/api/blobs':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(blob_store.stats()).encode())
+            return
+        elif path == '/metrics':
+            self.handle_metrics()
+            return
+        elif path.startswith('/api/uploads/'):
+            upload = ChunkedUpload.open(path.split('/')[3])
+            if upload is None:
+                self.send_error(404, "Unknown upload")
+                return
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(upload.status()).encode())
+            return
+        elif path == '/api/capabilities':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({name: feature.status() for name, feature in FEATURES.items()}).encode())
+            return
+        elif path == '/api/retention':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(read_retention_stats()).encode())
+            return
+        elif path == '/api/format-cache':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(format_cache.stats()).encode())
             return
         elif path.startswith('/download/'):
             # Extract job_id and filename from path
@@ -270,42 +2223,107 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
                         file_path = file_path_results
 
                 if file_path and os.path.exists(file_path):
-                    with open(file_path, 'rb') as f:
-                        self.send_response(200)
-                        if filename.endswith('.pdf'):
-                            self.send_header('Content-type', 'application/pdf')
-                        elif filename.endswith('.docx'):
-                            self.send_header('Content-type', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-                        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-                        self.end_headers()
-                        shutil.copyfileobj(f, self.wfile)
+                    self.send_file(file_path, download_name=filename)
                     return # Correct indentation for the return statement
-        elif os.path.exists(path[1:]):  # Remove leading slash
-            with open(path[1:], 'rb') as f:
-                self.send_response(200)
-                if path.endswith('.xlsx'):
-                    self.send_header('Content-type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                self.end_headers()
-                shutil.copyfileobj(f, self.wfile)
+        elif os.path.isfile(path[1:]):  # Remove leading slash
+            self.send_file(path[1:])
             return
         
         return super().do_GET()
     
+    def read_content_length(self):
+        """
+        Parses Content-Length into self.content_length for the handlers. Answers 400 and
+        returns False when the header is malformed.
+        """
+        try:
+            self.content_length = parse_content_length(self.headers)
+        except ValueError as e:
+            self.close_connection = True  # The body's end is unknown, so the connection can't be reused
+            self.send_error(400, str(e))
+            return False
+        return True
+
     def do_POST(self):
+        if not self.read_content_length():
+            return
+        # Refuse oversized bodies before reading any of them
+        if self.content_length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self.send_error(413, f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+            return
+
+        self.uploads = []
+        try:
+            if not self.path.startswith(HEAVY_ROUTES):
+                self.dispatch_post()
+                return
+
+            # Slow jobs get a limited number of workers; the rest stay free for fast requests
+            if not heavy_request_slots.acquire(blocking=False):
+                self.send_response(503)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Retry-After', '5')
+                self.end_headers()
+                self.wfile.write(json.dumps({'error': 'Server is busy with other jobs, please retry shortly'}).encode())
+                return
+            try:
+                self.dispatch_post()
+            finally:
+                heavy_request_slots.release()
+        finally:
+            # Spooled uploads that a handler didn't move into place
+            for upload in self.uploads:
+                upload.discard()
+
+    def do_PUT(self):
+        if not self.read_content_length():
+            return
+        # /api/uploads/<id>/<field>/<index> is the only PUT route
+        parts = urlparse(self.path).path.split('/')
+        if len(parts) != 6 or parts[1:3] != ['api', 'uploads']:
+            self.send_error(404, "Not found")
+            return
+        self.handle_upload_chunk(*parts[3:])
+
+    def parse_form(self, content_type, content_length):
+        """Parses a multipart body with MultipartFormParser; spooled files are discarded after the request."""
+        parser = MultipartFormParser(content_type, content_length, self.rfile)
+        try:
+            return parser.parse()
+        finally:
+            self.uploads.extend(parser.files)
+
+    def dispatch_post(self):
         if self.path == '/api/format-excel':
             self.handle_format_excel()
+        elif self.path == '/api/excel-preview':
+            self.handle_excel_preview()
         elif self.path == '/upload':
             self.handle_video_upload()
+        elif self.path == '/api/uploads':
+            self.handle_create_upload()
+        elif self.path.startswith('/api/uploads/') and self.path.endswith('/finalize'):
+            self.handle_finalize_upload(self.path.split('/')[3])
         elif self.path.startswith('/process/'):
             self.handle_video_processing()
         elif self.path.startswith('/cleanup/'):
             self.handle_cleanup()
+        elif self.path == '/api/history/rebuild':
+            self.handle_rebuild_history()
+        elif self.path == '/api/profile':
+            self.handle_arm_profile()
+        elif self.path == '/api/memory':
+            self.handle_memory_tracking()
         elif self.path == '/api/start-excel-session':
             self.handle_start_excel_session()
         elif self.path == '/api/convert-word':
             self.handle_word_conversion()
         elif self.path == '/api/process-checklist':
-            if not OPENAI_API_KEY or OPENAI_API_KEY == 'your-api-key-here':
+            checklist = self.require_feature('checklist')
+            if checklist is None:
+                return
+            if not checklist.OPENAI_API_KEY or checklist.OPENAI_API_KEY == 'your-api-key-here':
                 self.send_error(500, "OpenAI API key not configured. Please set OPENAI_API_KEY in config.py")
                 return
             try:
@@ -319,16 +2337,16 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
     def handle_checklist_processing(self):
         """Handles POST request for processing Word documents into checklists."""
         print("Starting checklist processing...")  # Debug log
+        checklist = FEATURES['checklist'].load()
         try:
             print(f"Headers: {self.headers}")  # Debug log
-            content_length = int(self.headers['Content-Length'])
+            content_length = self.content_length
             content_type = self.headers['Content-Type']
             
             if not content_type.startswith('multipart/form-data'):
                 raise ValueError("Expected multipart/form-data")
             
-            parser = MultipartFormParser(content_type, content_length, self.rfile)
-            form = parser.parse()
+            form = self.parse_form(content_type, content_length)
             print(f"Form fields: {list(form.keys())}")  # Debug log
             
             if not form or b'file' not in form:
@@ -336,7 +2354,7 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
                 raise ValueError("No file uploaded")
 
             # Extract filename and content
-            filename_bytes, file_content = form[b'file']
+            filename_bytes, upload = form[b'file']
             original_filename = filename_bytes.decode('utf-8', errors='ignore')
             print(f"Original filename: {original_filename}")  # Debug log
             original_filename_safe = secure_filename(original_filename)
@@ -347,13 +2365,12 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             conversion_dir = os.path.join(UPLOAD_DIR, conversion_id)
             os.makedirs(conversion_dir, exist_ok=True)
 
-            # Save the uploaded file
+            # Move the uploaded file into place
             input_path = os.path.join(conversion_dir, original_filename_safe)
-            with open(input_path, 'wb') as f:
-                f.write(file_content)
+            upload.store(input_path)
 
             # Read the Word document
-            doc = Document(input_path)
+            doc = checklist.Document(input_path)
             text_content = []
             found_first_step = False
             
@@ -400,7 +2417,7 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             """ + "\n".join(text_content)
 
             # Call OpenAI API
-            response = openai_client.chat.completions.create(
+            response = checklist.openai_client.chat.completions.create(
                 model="gpt-4.1",
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant that extracts and organizes steps from text into a structured table format."},
@@ -409,7 +2426,7 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             )
 
             # Create new Word document
-            output_doc = Document()
+            output_doc = checklist.Document()
             
             # Set document properties for standard page formatting with integer values
             section = output_doc.sections[0]
@@ -554,6 +2571,8 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             output_filename = f"{base_name}_checklist.docx"
             output_path = os.path.join(conversion_dir, output_filename)
             output_doc.save(output_path)
+            job_index.record(conversion_id, 'checklist', [original_filename_safe], [output_filename], status='done',
+                             duration=time.perf_counter() - self.request_started)
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -569,21 +2588,23 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             self.send_error(500, str(e))
 
     def handle_word_conversion(self):
+        word_to_pdf = self.require_feature('word_to_pdf')
+        if word_to_pdf is None:
+            return
         try:
-            content_length = int(self.headers['Content-Length'])
+            content_length = self.content_length
             content_type = self.headers['Content-Type']
             
             if not content_type.startswith('multipart/form-data'):
                 raise ValueError("Expected multipart/form-data")
             
-            parser = MultipartFormParser(content_type, content_length, self.rfile)
-            form = parser.parse()
+            form = self.parse_form(content_type, content_length)
 
             if not form or b'file' not in form:
                 raise ValueError("No file uploaded")
 
             # Extract original filename and content
-            word_filename_bytes, word_content = form[b'file']
+            word_filename_bytes, word_upload = form[b'file']
             original_filename = word_filename_bytes.decode('utf-8', errors='ignore')
             original_filename_safe = secure_filename(original_filename)
             base_name, _ = os.path.splitext(original_filename_safe)
@@ -596,12 +2617,13 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
 
             # Save the Word file using original (sanitized) name
             word_path = os.path.join(conversion_dir, original_filename_safe)
-            with open(word_path, 'wb') as f:
-                f.write(word_content)
+            word_upload.store(word_path)
 
             # Convert to PDF using original (sanitized) base name
             pdf_path = os.path.join(conversion_dir, pdf_filename_safe)
-            self.convert_word_to_pdf(word_path, pdf_path)
+            self.convert_word_to_pdf(word_to_pdf, word_path, pdf_path)
+            job_index.record(conversion_id, 'word', [original_filename_safe], [pdf_filename_safe], status='done',
+                             duration=time.perf_counter() - self.request_started)
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -615,10 +2637,11 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, str(e))
 
-    def convert_word_to_pdf(self, word_path, pdf_path):
+    def convert_word_to_pdf(self, word_to_pdf, word_path, pdf_path):
+        pythoncom = word_to_pdf.pythoncom
         pythoncom.CoInitialize()
         try:
-            word = win32com.client.Dispatch('Word.Application')
+            word = word_to_pdf.win32com.client.Dispatch('Word.Application')
             doc = word.Documents.Open(word_path)
             doc.SaveAs(pdf_path, FileFormat=17)  # 17 = PDF format
             doc.Close()
@@ -626,21 +2649,136 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
         finally:
             pythoncom.CoUninitialize()
 
+    def require_feature(self, name):
+        """Loads the named feature for this route, or answers 501 and returns None."""
+        try:
+            return FEATURES[name].load()
+        except FeatureUnavailable as e:
+            self.send_error(501, str(e))
+            return None
+
     def redirect_to(self, path):
         self.send_response(302)
         self.send_header('Location', path)
         self.end_headers()
+
+    def send_file(self, file_path, content_type=None, download_name=None, headers=None):
+        """
+        Send a file from disk with validators and single-range support. headers holds any
+        extra response headers.
+        The body goes out through socket.sendfile(), which uses os.sendfile() where the
+        platform allows and falls back to plain send() calls elsewhere.
+        """
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+            if self.not_modified(etag, stat.st_mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                return
+
+            byte_range = None
+            if_range = self.headers.get('If-Range')
+            if self.headers.get('Range') and (not if_range or if_range.strip() == etag):
+                byte_range = parse_byte_range(self.headers['Range'], size)
+                if byte_range == 'unsatisfiable':
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+            start, end = byte_range or (0, size - 1)
+            length = end - start + 1 if size else 0
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-type', content_type or self.guess_type(file_path))
+            if download_name:
+                self.send_header('Content-Disposition', f'attachment; filename="{download_name}"')
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if self.command == 'HEAD' or not length:
+                return
+            self.wfile.flush()
+            try:
+                self.connection.sendfile(f, start, length)
+                self.wfile.bytes_written += length
+            except (BrokenPipeError, ConnectionResetError):
+                # DEBUG: Client went away mid-download; it can resume with a Range request
+                print(f"DEBUG: Download of {file_path} interrupted")
+                self.close_connection = True
+
+    def send_static_asset(self, name):
+        """Send one of STATIC_ASSETS from memory in the best encoding the client accepts"""
+        asset = static_assets.get(name)
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        coding, data, etag = asset.negotiate(self.headers.get('Accept-Encoding'))
+        cache_control = f'public, max-age={STATIC_MAX_AGE}' if STATIC_MAX_AGE else 'no-cache'
+        not_modified = self.not_modified(etag, asset.mtime)
+        if not_modified:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header('Content-type', self.guess_type(asset.path))
+            self.send_header('Content-Length', str(len(data)))
+            if coding != 'identity':
+                self.send_header('Content-Encoding', coding)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(asset.mtime, usegmt=True))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if self.command != 'HEAD' and not not_modified:
+            self.wfile.write(data)
+
+    def not_modified(self, etag, mtime):
+        """Whether the request's conditional headers say the client's copy is current"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f'W/{etag}' in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
     
     def handle_format_excel(self):
-        content_length = int(self.headers['Content-Length'])
+        excel = self.require_feature('excel')
+        if excel is None:
+            return
+        content_length = self.content_length
         content_type = self.headers['Content-Type']
         
         if not content_type.startswith('multipart/form-data'):
             self.send_error(400, "Expected multipart/form-data")
             return
         
-        parser = MultipartFormParser(content_type, content_length, self.rfile)
-        form = parser.parse()
+        try:
+            form = self.parse_form(content_type, content_length)
+        except ValueError as e:
+            self.send_error(400, f"Malformed upload: {str(e)}")
+            return
         
         if not form or b'file' not in form:
             self.send_error(400, "No file uploaded")
@@ -652,9 +2790,9 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             self.send_error(400, "Not a file")
             return
             
-        filename, file_content = file_tuple
+        filename, upload = file_tuple
         
-        if not file_content:
+        if not upload.size:
             self.send_error(400, "Not a file")
             return
         
@@ -667,38 +2805,64 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             'remove_lone_quotes': form.get(b'removeLoneQuotes', b'false').decode() == 'true',
             'remove_ellipsis': form.get(b'removeEllipsis', b'false').decode() == 'true'
         }
+
+        low_memory = form.get(b'lowMemory', b'false').decode() == 'true'
+
+        # Optional column selector, e.g. {"Sheet1": ["A", "C"], "*": ["B"]}
+        if form.get(b'columns'):
+            try:
+                options['columns'] = parse_column_selector(form[b'columns'])
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_file:
-            tmp_file.write(file_content)
-            tmp_filename = tmp_file.name
-        
+        # The upload was hashed while it was parsed, so a repeat request is answered from
+        # the cache without reading the bytes again or touching formatting.py. Only lossless
+        # results are cached, and they don't depend on low_memory, so it isn't in the key.
+        cache_key = FormatResultCache.make_key(upload.sha256, options)
+        cached_path = format_cache.get(cache_key)
+        if cached_path:
+            try:
+                with open(cached_path, 'rb') as f:
+                    print(f"Serving cached result for {filename} ({cache_key})") # DEBUG
+                    self.send_response(200)
+                    self.send_header('Content-type', XLSX_CONTENT_TYPE)
+                    self.send_header('Content-Disposition', 'attachment; filename="modified_file.xlsx"')
+                    self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+                    self.end_headers()
+                    shutil.copyfileobj(f, self.wfile)
+                return
+            except FileNotFoundError:
+                pass  # Evicted between lookup and open; format it again
+
         try:
-            print(f"Starting formatting for {tmp_filename} with options: {options}") # DEBUG
-            # First process the text if any text processing options are enabled
-            text_options_enabled = any([options['capitalize_sentences'], options['add_periods'],
-                                        options['remove_spaces_quotes'], options['remove_spaces_unquoted'],
-                                        options['remove_lone_quotes'], options['remove_ellipsis']])
-            if text_options_enabled:
-                print(f"Calling process_excel for {tmp_filename}...") # DEBUG
-                process_excel(tmp_filename, options) # Pass the options dict
-                print(f"Finished process_excel for {tmp_filename}.") # DEBUG
-            else:
-                 print(f"Skipping process_excel for {tmp_filename} as no text options enabled.") # DEBUG
+            print(f"Starting formatting for {filename} with options: {options}") # DEBUG
+            cleaner = excel.compile_cleaner(options)
+            large = upload.size >= STREAMING_THRESHOLD_BYTES and not options.get('columns')
+            # Large uploads are processed in place on the spooled upload and sent from it.
+            # Text-only cleaning first tries the shared-strings fast path, which is lossless.
+            if large and cleaner.enabled and not options['remove_blank_lines'] \
+                    and excel.rewrite_shared_strings(upload.path, options):
+                format_cache.put_file(cache_key, upload.path)
+                self.send_file(upload.path, XLSX_CONTENT_TYPE, 'modified_file.xlsx')
+                return
+            if large and low_memory and (cleaner.enabled or options['remove_blank_lines']):
+                print(f"Calling process_excel_streaming for {upload.path} ({upload.size} bytes)...") # DEBUG
+                excel.process_excel_streaming(upload.path, options)
+                print(f"Finished process_excel_streaming for {upload.path}.") # DEBUG
+                self.send_file(upload.path, XLSX_CONTENT_TYPE, 'modified_file.xlsx',
+                               headers={'X-Format-Warning': LOW_MEMORY_WARNING})
+                return
 
-            # Then remove blank rows if that option is enabled
-            if options['remove_blank_lines']:
-                print(f"Calling remove_blank_rows for {tmp_filename}...") # DEBUG
-                remove_blank_rows(tmp_filename)
-                print(f"Finished remove_blank_rows for {tmp_filename}.") # DEBUG
-            else:
-                 print(f"Skipping remove_blank_rows for {tmp_filename}.") # DEBUG
+            # Load once from memory, clean and drop blank rows in one pass, save once
+            stats = {}
+            processed_data = excel.format_workbook(upload.read(), options, stats=stats)
+            print(f"Finished format_workbook for {filename}: {stats}") # DEBUG
 
-            print(f"Reading processed data from {tmp_filename}...") # DEBUG
-            with open(tmp_filename, 'rb') as f:
-                processed_data = f.read()
+            format_cache.put(cache_key, processed_data)
             
             self.send_response(200)
-            self.send_header('Content-type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+            self.send_header('Content-type', XLSX_CONTENT_TYPE)
             self.send_header('Content-Disposition', 'attachment; filename="modified_file.xlsx"')
             self.send_header('Content-Length', str(len(processed_data)))
             self.end_headers()
@@ -708,27 +2872,101 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             print(f"ERROR during Excel processing: {e}") # DEBUG - Print error to console
             self.send_error(500, f"Error processing Excel: {str(e)}")
 
-        finally:
-            if os.path.exists(tmp_filename):
-                os.unlink(tmp_filename)
+    def handle_excel_preview(self):
+        """
+        Returns one page of rows from a workbook as JSON.
+        POST uploads the workbook (multipart 'file') and returns the first page along with
+        its preview id. GET /api/excel-preview?id=... fetches further pages of a stored
+        workbook. Both take offset, limit, sheet, options (JSON text options; when given,
+        each page includes the cleaned value next to every value /api/format-excel would
+        clean) and columns (the same column selector as /api/format-excel).
+        """
+        excel = self.require_feature('excel')
+        if excel is None:
+            return
+        try:
+            if self.command == 'POST':
+                content_length = self.content_length
+                content_type = self.headers['Content-Type']
+                if not content_type.startswith('multipart/form-data'):
+                    self.send_error(400, "Expected multipart/form-data")
+                    return
+
+                form = self.parse_form(content_type, content_length)
+                file_tuple = form.get(b'file')
+                if not isinstance(file_tuple, tuple) or not file_tuple[1].size:
+                    self.send_error(400, "No file uploaded")
+                    return
+
+                # Keep the workbook so later pages don't need another upload
+                upload = file_tuple[1]
+                preview_id = upload.sha256
+                os.makedirs(PREVIEW_DIR, exist_ok=True)
+                preview_path = os.path.join(PREVIEW_DIR, f"{preview_id}.xlsx")
+                if not os.path.exists(preview_path):
+                    upload.save(preview_path)
+                params = {key.decode(): value.decode() for key, value in form.items() if isinstance(value, bytes)}
+            else:
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                preview_id = params.get('id', '')
+                preview_path = os.path.join(PREVIEW_DIR, f"{preview_id}.xlsx")
+                if len(preview_id) != 64 or not all(c in '0123456789abcdef' for c in preview_id) \
+                        or not os.path.exists(preview_path):
+                    self.send_error(404, "Unknown preview id")
+                    return
+
+            try:
+                offset = max(int(params.get('offset', 0)), 0)
+                limit = min(max(int(params.get('limit', 100)), 1), PREVIEW_MAX_ROWS)
+            except ValueError:
+                self.send_error(400, "offset and limit must be integers")
+                return
+            options = None
+            if params.get('options'):
+                try:
+                    requested = json.loads(params['options'])
+                except ValueError:
+                    requested = None
+                if not isinstance(requested, dict):
+                    self.send_error(400, "options must be a JSON object")
+                    return
+                options = {key: bool(requested.get(key, False)) for key in excel.TEXT_OPTIONS}
+            columns = parse_column_selector(params['columns']) if params.get('columns') else None
+
+            page = excel.preview_rows(preview_path, offset, limit, params.get('sheet') or None, options, columns)
+            page['id'] = preview_id
+
+            body = json.dumps(page).encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        except (ValueError, KeyError) as e:
+            self.send_error(400, f"Invalid preview request: {str(e)}")
+        except Exception as e:
+            print(f"ERROR during Excel preview: {e}") # DEBUG
+            self.send_error(500, handle_error(e))
 
     def handle_video_upload(self):
+        if self.require_feature('video') is None:
+            return
         try:
-            content_length = int(self.headers['Content-Length'])
+            content_length = self.content_length
             content_type = self.headers['Content-Type']
             
             if not content_type.startswith('multipart/form-data'):
                 raise ValueError("Expected multipart/form-data")
             
-            parser = MultipartFormParser(content_type, content_length, self.rfile)
-            form = parser.parse()
+            form = self.parse_form(content_type, content_length)
             
             if not form or b'video' not in form or b'excel' not in form:
                 raise ValueError("Missing video or excel file")
 
             # Extract filenames and content from the form data
-            video_filename_bytes, video_content = form[b'video']
-            excel_filename_bytes, excel_content = form[b'excel']
+            video_filename_bytes, video_upload = form[b'video']
+            excel_filename_bytes, excel_upload = form[b'excel']
 
             # Decode filenames
             video_filename = video_filename_bytes.decode('utf-8', errors='ignore')
@@ -746,10 +2984,10 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             video_path = os.path.join(job_dir, video_filename_safe)
             excel_path = os.path.join(job_dir, excel_filename_safe)
 
-            with open(video_path, 'wb') as f:
-                f.write(video_content)
-            with open(excel_path, 'wb') as f:
-                f.write(excel_content)
+            # The parser already wrote both files to disk; just move them into the job
+            video_upload.store(video_path)
+            excel_upload.store(excel_path)
+            job_index.record(job_id, 'video', [video_filename_safe, excel_filename_safe])
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -759,129 +2997,230 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, str(e))
 
-    def handle_video_processing(self):
+    def handle_create_upload(self):
+        """
+        Opens a chunked upload for a video job. Body: {"files": {"video": {"name", "size"},
+        "excel": {"name", "size"}}, "chunk_size": optional}. Answers 201 with the session
+        (see ChunkedUpload.status); its upload_id becomes the job_id once finalized.
+        """
+        if self.require_feature('video') is None:
+            return
         try:
-            job_id = self.path.split('/')[-1]
-            job_dir = os.path.join(UPLOAD_DIR, job_id)
-            
-            if not os.path.exists(job_dir):
-                raise ValueError("Invalid job ID")
-
-            # Find the video and excel files in the job directory
-            video_path = None
-            excel_path = None
-            for filename in os.listdir(job_dir):
-                if filename.lower().endswith(('.mp4', '.avi', '.mov', '.wmv', '.flv')): # Add other video extensions if needed
-                    video_path = os.path.join(job_dir, filename)
-                elif filename.lower().endswith(('.xlsx', '.xls')):
-                    excel_path = os.path.join(job_dir, filename)
-
-            if not video_path or not excel_path:
-                 raise ValueError(f"Missing required video or excel file in job directory: {job_dir}")
-            if not os.path.exists(video_path) or not os.path.exists(excel_path):
-                 raise ValueError(f"Required files not found: Video={video_path}, Excel={excel_path}")
-
-            # Create frames folder
-            frames_folder = os.path.join(job_dir, 'frames')
-            os.makedirs(frames_folder, exist_ok=True)
-
-            # Create required folders
-            temp_folder = os.path.join(job_dir, 'temp')
-            # frames_folder is already defined and created
-            results_folder = os.path.join(job_dir, 'results')
-            os.makedirs(temp_folder, exist_ok=True)
-            # os.makedirs(frames_folder, exist_ok=True) # Redundant
-            os.makedirs(results_folder, exist_ok=True)
-
-            # Copy required assets to results directory
-            video_to_pdf_dir = os.path.join(SCRIPT_DIR, 'Video to PDF')
-            assets = {
-                'logo.jpg': 'logo.jpg',
-                'sideimage.png': 'sideimage.png.png',  # Fix double extension
-                'Copyright.docx': 'Copyright.docx',
-                'Template.docx': 'Template.docx'
-            }
-            for dest_name, src_name in assets.items():
-                src = os.path.join(video_to_pdf_dir, src_name)
-                dst = os.path.join(results_folder, dest_name)
-                if os.path.exists(src):
-                    shutil.copy(src, dst)
-                else:
-                    raise ValueError(f"Required asset not found: {src}")
-
-            # Process files using the Video to PDF project's function
-            result = process_files(
-                video_path=video_path,
-                excel_path=excel_path,
-                credential_path=os.path.join(UPLOAD_DIR, 'sapheb-b87c6918d4ef.json'),
-                bucket_name='sap_pdf',
-                frames_folder=frames_folder,
-                temp_folder=temp_folder,
-                job_id=job_id
-            )
+            content_length = self.content_length
+            params = json.loads(self.rfile.read(content_length))
+            chunk_size = int(params.get('chunk_size') or UPLOAD_CHUNK_SIZE)
+            files = {}
+            for field in ('video', 'excel'):
+                info = params['files'][field]
+                files[field] = (secure_filename(info['name']), int(info['size']))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            self.send_error(400, f"Malformed upload request: {str(e)}")
+            return
 
-            # Ensure the docx file exists and get the base name for PDF
-            results_dir = os.path.join(job_dir, 'results')
-            docx_filename = result['docx_filename']
-            docx_path = os.path.join(results_dir, docx_filename)
-            if not os.path.exists(docx_path):
-                raise ValueError(f"Generated DOCX file not found: {docx_path}")
-
-            # Use the original Word document path (as generated by processing.py)
-            # Use the docx file directly instead of looking for a PDF
-            original_docx_filename = docx_filename
-            original_docx_path = os.path.join(results_dir, original_docx_filename)
-            if not os.path.exists(original_docx_path):
-                 raise ValueError(f"Generated Word document not found: {original_docx_path}")
-
-            # --- Apply new filename formatting ---
-            # Get base name without '-DOCX.docx'
-            base_name_with_underscores = original_docx_filename.replace('-DOCX.docx', '')
-            # Replace underscores with spaces
-            base_name_with_spaces = base_name_with_underscores.replace('_', ' ')
-            
-            # Find the first space
-            first_space_index = base_name_with_spaces.find(' ')
-            
-            if first_space_index != -1:
-                # Construct new name: [FirstPart] Rest Of Name.docx
-                first_part = base_name_with_spaces[:first_space_index]
-                rest_of_name = base_name_with_spaces[first_space_index:] # Includes the leading space
-                new_docx_filename = f"[{first_part}]{rest_of_name}.docx"
-            else:
-                # No spaces, just add brackets: [WholeName].docx
-                new_docx_filename = f"[{base_name_with_spaces}].docx"
+        if not UPLOAD_MIN_CHUNK_SIZE <= chunk_size <= UPLOAD_MAX_CHUNK_SIZE:
+            self.send_error(400, f"chunk_size must be between {UPLOAD_MIN_CHUNK_SIZE} and {UPLOAD_MAX_CHUNK_SIZE}")
+            return
+        names = [name for name, _ in files.values()]
+        reserved = (UPLOAD_SESSION_FILE, JOB_STATE_FILE, JOB_TIMINGS_FILE)
+        if len(set(names)) != len(names) or any(not name or name in reserved or name.endswith(('.part', '.chunks'))
+                                                for name in names):
+            self.send_error(400, "The video and the script need distinct, valid filenames")
+            return
+        total = sum(size for _, size in files.values())
+        if any(size <= 0 for _, size in files.values()):
+            self.send_error(400, "Empty files can't be uploaded")
+            return
+        if total > MAX_CHUNKED_UPLOAD_BYTES:
+            self.send_error(413, f"Upload exceeds the {MAX_CHUNKED_UPLOAD_BYTES} byte limit")
+            return
+        if shutil.disk_usage(UPLOAD_DIR).free < total:
+            self.send_error(507, "Not enough disk space for this upload")
+            return
+
+        try:
+            upload = ChunkedUpload.create(files, chunk_size)
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                raise
+            self.send_error(507, "Not enough disk space for this upload")
+            return
+        print(f"DEBUG: Opened upload {upload.job_id} for {total} bytes in chunks of {chunk_size}")
+        self.send_response(201)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Location', f'/api/uploads/{upload.job_id}')
+        self.end_headers()
+        self.wfile.write(json.dumps(upload.status()).encode())
 
-            # Sanitize the new filename
-            new_docx_filename_safe = secure_filename(new_docx_filename)
-            new_docx_path = os.path.join(results_dir, new_docx_filename_safe)
+    def handle_upload_chunk(self, job_id, field, index):
+        """Stores one chunk of a chunked upload. An X-Chunk-SHA256 header, when sent, is checked."""
+        upload = ChunkedUpload.open(job_id)
+        if upload is None or field not in upload.files:
+            self.send_error(404, "Unknown upload")
+            return
+        if not index.isdigit() or int(index) >= upload.files[field]['chunks']:
+            self.send_error(404, "No such chunk")
+            return
+        index = int(index)
+        expected_length = upload.chunk_length(field, index)
+        if self.content_length != expected_length:
+            self.send_error(400, f"Chunk {index} of {field} must be exactly {expected_length} bytes")
+            return
+
+        try:
+            spool_path, digest = upload.receive_chunk(field, index, self.rfile)
+        except ConnectionError as e:
+            print(f"Chunk {index} of upload {job_id} {field} was cut off: {e}") # DEBUG
+            self.close_connection = True
+            return
+        try:
+            expected = self.headers.get('X-Chunk-SHA256')
+            if expected and expected.lower() != digest.hex():
+                self.send_error(400, f"Chunk {index} of {field} does not match its X-Chunk-SHA256")
+                return
 
-            # Rename the generated Word document file
+            # The claim keeps finalize and retention off the files while the chunk is copied
+            # in; other chunks of the same upload hold it only as long as their copy takes
+            deadline = time.monotonic() + UPLOAD_CLAIM_WAIT
+            while not claim_job(job_id):
+                if time.monotonic() > deadline:
+                    self.send_error(409, "The upload is being finalized or removed")
+                    return
+                time.sleep(0.01)
             try:
-                os.rename(original_docx_path, new_docx_path)
-            except OSError as rename_error:
-                 raise OSError(f"Failed to rename Word document: {rename_error}")
-            # --- End of filename formatting ---
+                if ChunkedUpload.open(job_id) is None:
+                    self.send_error(404, "Unknown upload")  # Finalized or removed meanwhile
+                    return
+                upload.write_chunk(field, index, spool_path)
+                upload.mark_received(field, index, digest)
+            finally:
+                release_job(job_id)
+        finally:
+            os.unlink(spool_path)
 
-            self.send_response(200)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'field': field, 'index': index, 'sha256': digest.hex()}).encode())
+
+    def handle_finalize_upload(self, job_id):
+        """
+        Checks a chunked upload's files and turns its directory into a video job.
+        Body: {"checksums": {"video": ..., "excel": ...}}, each the hex SHA-256 of the file or
+        its manifest digest (see ChunkedUpload.verify). Chunks that are missing or fail the
+        check are listed in a 409 response; the client sends them again and retries.
+        """
+        upload = ChunkedUpload.open(job_id)
+        if upload is None:
+            self.send_error(404, "Unknown upload")
+            return
+        try:
+            content_length = self.content_length
+            checksums = json.loads(self.rfile.read(content_length) or b'{}')['checksums']
+            checksums = {field: str(checksums[field]).lower() for field in upload.files}
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_error(400, f"A checksum is needed for every file: {str(e)}")
+            return
+
+        missing = {}
+        for field, info in upload.files.items():
+            received = set(upload.received(field))
+            indices = [index for index in range(info['chunks']) if index not in received]
+            if indices:
+                missing[field] = indices
+        if not missing:
+            if not claim_job(job_id):
+                self.send_error(409, "The upload is already being finalized")
+                return
+            try:
+                if ChunkedUpload.open(job_id) is None:
+                    self.send_error(404, "Unknown upload")  # Finalized by another request meanwhile
+                    return
+                digests = {}
+                for field, info in upload.files.items():
+                    sha256, manifest, bad_chunks = upload.verify(field)
+                    if bad_chunks or checksums[field] not in (sha256, manifest):
+                        # Without a corrupt chunk to blame, the whole file is sent again
+                        missing[field] = bad_chunks or list(range(info['chunks']))
+                        upload.forget_chunks(field, missing[field])
+                        print(f"DEBUG: Upload {job_id} {field} failed its check, {len(missing[field])} chunks to resend")
+                    digests[field] = sha256
+                if not missing:
+                    input_files = upload.complete(digests)
+                    job_index.record(job_id, 'video', input_files)
+            finally:
+                release_job(job_id)
+
+        if missing:
+            self.send_response(409)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps({
-                 # Send the *new* filename for download
-                'download_url': f'/download/{job_id}/{new_docx_filename_safe}'
-            }).encode())
+            self.wfile.write(json.dumps({'error': 'Some chunks are missing or corrupt', 'missing': missing}).encode())
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'job_id': job_id}).encode())
 
-        except Exception as e:
-            error_message = handle_error(e)
-            self.send_error(500, error_message)
+    def handle_video_processing(self):
+        """
+        Queues a video job and returns 202 with the URL to poll for its status, or 409 if
+        the job is being removed.
+        """
+        if self.require_feature('video') is None:
+            return
+        job_id = self.path.split('/')[-1]
+        job_dir = os.path.join(UPLOAD_DIR, job_id)
+        if not job_id or not os.path.isdir(job_dir):
+            self.send_error(500, handle_error(ValueError("Invalid job ID")))
+            return
+        if os.path.exists(os.path.join(job_dir, UPLOAD_SESSION_FILE)):
+            self.send_error(409, "The upload has not been finalized yet")
+            return
+
+        # A job that is already queued or running is not started twice. The claim may also
+        # be held by /cleanup or retention removing the job, which is a conflict.
+        if claim_job(job_id):
+            job_queue.submit('video', job_id, run_video_job)
+        elif (read_job_state(job_id) or {}).get('state') not in ('queued', 'running'):
+            self.send_error(409, "Job is being removed")
+            return
+
+        self.send_response(202)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Location', f'/api/jobs/{job_id}')
+        self.end_headers()
+        self.wfile.write(json.dumps({
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}'
+        }).encode())
+
+    def handle_job_status(self, job_id):
+        state = read_job_state(job_id)
+        if state is None:
+            self.send_error(404, "Unknown job")
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(state).encode())
+
+    def handle_job_timings(self, job_id):
+        timings = read_job_timings(job_id)
+        if timings is None:
+            self.send_error(404, "No timings recorded for this job")
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(timings).encode())
 
     def handle_cleanup(self):
+        job_id = self.path.split('/')[-1]
+        if not claim_job(job_id):
+            self.send_error(409, "Job is still being processed")
+            return
         try:
-            job_id = self.path.split('/')[-1]
-            job_dir = os.path.join(UPLOAD_DIR, job_id)
-            
-            if os.path.exists(job_dir):
-                shutil.rmtree(job_dir)
+            delete_job_files(job_id)
             
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -891,14 +3230,20 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, str(e))
 
+        finally:
+            release_job(job_id)
+
     def handle_start_excel_session(self):
+        if self.require_feature('excel') is None or self.require_feature('clipboard') is None:
+            return
         try:
-            content_length = int(self.headers['Content-Length'])
+            content_length = self.content_length
             data = self.rfile.read(content_length)
             params = json.loads(data)
             
             session_id = os.urandom(16).hex()
-            excel_sessions[session_id] = ExcelSession(
+            register_excel_session(
+                session_id,
                 params['filename'],
                 params['saveLocation']
             )
@@ -913,14 +3258,17 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
 
     def handle_browse_directory(self):
         """Handles request to open a directory selection dialog."""
+        directory_picker = self.require_feature('directory_picker')
+        if directory_picker is None:
+            return
         try:
             # We need a Tk root window, but we don't want to show it
-            root = tk.Tk()
+            root = directory_picker.tk.Tk()
             root.withdraw()  # Hide the main window
             root.attributes('-topmost', True) # Bring the dialog to the front
 
             # Open the directory selection dialog
-            selected_path = filedialog.askdirectory(
+            selected_path = directory_picker.filedialog.askdirectory(
                 title="Select Save Location",
                 initialdir=os.path.expanduser("~") # Start in user's home directory
             )
@@ -941,77 +3289,82 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(json.dumps({'error': str(e)}).encode())
 
-    def get_upload_history(self):
-        """Scans the UPLOAD_DIR for job folders and extracts history information."""
-        history = []
-        if not os.path.exists(UPLOAD_DIR):
-            return history
+    def handle_history(self, query):
+        """
+        One page of job history from the job index, newest first. Query parameters:
+        type (video, word or checklist), from/to (ISO dates or datetimes; a date-only
+        'to' includes that whole day), limit, and cursor (next_cursor of the previous page).
+        """
+        try:
+            job_type = query.get('type', [None])[0]
+            since = until = None
+            if query.get('from'):
+                since = datetime.fromisoformat(query['from'][0]).timestamp()
+            if query.get('to'):
+                to_value = query['to'][0]
+                until = datetime.fromisoformat(to_value).timestamp()
+                if len(to_value) == 10:  # Date only
+                    until += 24 * 60 * 60
+            limit = min(max(int(query.get('limit', [HISTORY_PAGE_SIZE])[0]), 1), HISTORY_MAX_PAGE_SIZE)
+            cursor = query.get('cursor', [None])[0]
+            jobs, next_cursor = job_index.query(job_type, since, until, limit, cursor)
+        except ValueError as e:
+            self.send_error(400, f"Invalid history query: {e}")
+            return
 
-        for job_id in os.listdir(UPLOAD_DIR):
-            job_dir = os.path.join(UPLOAD_DIR, job_id)
-            if os.path.isdir(job_dir):
-                # Get directory creation time
-                try:
-                    created_time = os.path.getctime(job_dir)
-                    created_date = datetime.fromtimestamp(created_time).strftime('%Y-%m-%d %H:%M:%S')
-                except OSError:
-                    created_date = "Unknown Date"
-
-                job_type = "Unknown"
-                input_files = []
-                output_files = []
-
-                # List all files in the job directory
-                all_files_in_job_dir = [f for f in os.listdir(job_dir) if os.path.isfile(os.path.join(job_dir, f))]
-
-                # --- Detect Job Type and Files ---
-                is_video_job = any(f.lower().endswith(('.mp4', '.avi', '.mov', '.wmv', '.flv')) for f in all_files_in_job_dir) and \
-                               any(f.lower().endswith(('.xlsx', '.xls')) for f in all_files_in_job_dir)
-                is_word_job = any(f.lower().endswith(('.doc', '.docx')) for f in all_files_in_job_dir)
-
-                if is_video_job:
-                    job_type = "Video to PDF"
-                    for f in all_files_in_job_dir:
-                        if f.lower().endswith(('.mp4', '.avi', '.mov', '.wmv', '.flv', '.xlsx', '.xls')):
-                            input_files.append(f)
-                    # Look for output PDF in 'results' subdirectory
-                    results_dir = os.path.join(job_dir, 'results')
-                    if os.path.exists(results_dir):
-                        for f in os.listdir(results_dir):
-                            if f.lower().endswith('.pdf'):
-                                output_files.append(f)
-                elif is_word_job:
-                    job_type = "Word to PDF"
-                    for f in all_files_in_job_dir:
-                        if f.lower().endswith(('.doc', '.docx')):
-                            input_files.append(f)
-                        elif f.lower().endswith('.pdf'): # PDF is directly in job_dir for Word conversion
-                            output_files.append(f)
-                # Add more job type detections here if needed (e.g., TTS)
-
-                # Combine input and output files for display, prioritizing outputs if needed
-                display_files = sorted(input_files) + sorted(output_files) # Simple concatenation for now
-
-                if job_type != "Unknown" and display_files: # Only add jobs we could identify with files
-                    history.append({
-                        'id': job_id,
-                        'date': created_date,
-                        'type': job_type,
-                        'files': display_files # Use the detected files
-                    })
-
-        # Sort by date, newest first
-        history.sort(key=lambda x: x['date'], reverse=True)
-        print(f"DEBUG: Generated history: {history}") # DEBUG - See what history is being generated
-        return history
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'jobs': jobs, 'next_cursor': next_cursor}).encode())
+
+    def handle_arm_profile(self):
+        """POST {"route": "/api/format-excel", "count": 5} profiles the next 5 requests to that route."""
+        try:
+            data = json.loads(self.rfile.read(self.content_length))
+            route = data['route']
+            count = int(data.get('count', 1))
+            if not isinstance(route, str) or not route.startswith('/') or not 0 <= count <= PROFILE_MAX_COUNT:
+                raise ValueError(f"route must be a path and count between 0 and {PROFILE_MAX_COUNT}")
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_error(400, f"Invalid profile request: {e}")
+            return
+        arm_profiling(route, count)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'success': True, 'armed': armed_profiles()}).encode())
+
+    def handle_memory_tracking(self):
+        """POST {"enabled": true} starts memory tracking in this process (resetting its stats); false stops it."""
+        try:
+            data = json.loads(self.rfile.read(self.content_length))
+            enabled = data['enabled']
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_error(400, f"Invalid memory tracking request: {e}")
+            return
+        if enabled:
+            memory_tracker.start()
+        else:
+            memory_tracker.stop()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'success': True, 'enabled': memory_tracker.enabled, 'pid': os.getpid()}).encode())
+
+    def handle_rebuild_history(self):
+        count = job_index.rebuild()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'success': True, 'jobs': count}).encode())
 
     def handle_get_tts_voices(self):
         """Handles GET request for available TTS voices."""
-        if not TTS_ENABLED:
-            self.send_error(501, "TTS functionality is not available.")
+        tts = self.require_feature('tts')
+        if tts is None:
             return
         try:
-            voices = get_available_voices() # Assuming this returns a list of dicts like [{'id': 'voice1', 'name': 'Voice One'}]
+            voices = tts.get_available_voices() # Assuming this returns a list of dicts like [{'id': 'voice1', 'name': 'Voice One'}]
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
@@ -1021,11 +3374,11 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
 
     def handle_tts_conversion(self):
         """Handles POST request for TTS conversion."""
-        if not TTS_ENABLED:
-            self.send_error(501, "TTS functionality is not available.")
+        tts = self.require_feature('tts')
+        if tts is None:
             return
         try:
-            content_length = int(self.headers['Content-Length'])
+            content_length = self.content_length
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data)
 
@@ -1037,7 +3390,7 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
                 return
 
             # Assuming generate_tts returns the path to the generated MP3 file
-            output_path = generate_tts(text, voice_id)
+            output_path = tts.generate_tts(text, voice_id)
 
             if not output_path or not os.path.exists(output_path):
                  raise ValueError("TTS generation failed or did not produce an output file.")
@@ -1045,9 +3398,8 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
             with open(output_path, 'rb') as f:
                 audio_data = f.read()
 
-            # Clean up the temporary audio file if necessary (depends on tts4.py implementation)
-            # If generate_tts creates a temp file, uncomment the line below:
-            # os.unlink(output_path)
+            # generate_tts leaves its MP3 in the system temp dir; the retention sweep catches any missed here
+            os.unlink(output_path)
 
             self.send_response(200)
             self.send_header('Content-type', 'audio/mpeg') # MP3 MIME type
@@ -1063,15 +3415,170 @@ class MultiToolHandler(http.server.SimpleHTTPRequestHandler):
              self.end_headers()
              self.wfile.write(json.dumps({'error': error_message}).encode())
 
+def run_video_job(job_id):
+    """
+    Runs the Video to PDF pipeline for an uploaded job on a job queue worker.
+    Returns the job result ({'download_url': ...}); raises on failure.
+    """
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+
+    if not os.path.exists(job_dir):
+        raise ValueError("Invalid job ID")
+
+    # Find the video and excel files in the job directory
+    video_path = None
+    excel_path = None
+    for filename in os.listdir(job_dir):
+        if filename.lower().endswith(('.mp4', '.avi', '.mov', '.wmv', '.flv')): # Add other video extensions if needed
+            video_path = os.path.join(job_dir, filename)
+        elif filename.lower().endswith(('.xlsx', '.xls')):
+            excel_path = os.path.join(job_dir, filename)
+
+    if not video_path or not excel_path:
+         raise ValueError(f"Missing required video or excel file in job directory: {job_dir}")
+    if not os.path.exists(video_path) or not os.path.exists(excel_path):
+         raise ValueError(f"Required files not found: Video={video_path}, Excel={excel_path}")
+
+    # Create frames folder
+    frames_folder = os.path.join(job_dir, 'frames')
+    os.makedirs(frames_folder, exist_ok=True)
+
+    # Create required folders
+    temp_folder = os.path.join(job_dir, 'temp')
+    # frames_folder is already defined and created
+    results_folder = os.path.join(job_dir, 'results')
+    os.makedirs(temp_folder, exist_ok=True)
+    # os.makedirs(frames_folder, exist_ok=True) # Redundant
+    os.makedirs(results_folder, exist_ok=True)
+
+    # Copy required assets to results directory
+    video_to_pdf_dir = os.path.join(SCRIPT_DIR, 'Video to PDF')
+    assets = {
+        'logo.jpg': 'logo.jpg',
+        'sideimage.png': 'sideimage.png.png',  # Fix double extension
+        'Copyright.docx': 'Copyright.docx',
+        'Template.docx': 'Template.docx'
+    }
+    for dest_name, src_name in assets.items():
+        src = os.path.join(video_to_pdf_dir, src_name)
+        dst = os.path.join(results_folder, dest_name)
+        if os.path.exists(src):
+            shutil.copy(src, dst)
+        else:
+            raise ValueError(f"Required asset not found: {src}")
+
+    # Each stage lasts until the next one starts
+    current_stage = []
+    def on_stage(stage):
+        now = time.perf_counter()
+        if current_stage:
+            name, started = current_stage.pop()
+            metrics.observe('video_stage_duration_seconds', (('stage', name),), now - started, STAGE_BUCKETS)
+        if stage is not None:
+            current_stage.append((stage, now))
+            write_job_state(job_id, stage=stage)
+
+    # Process files using the Video to PDF project's function
+    try:
+        result = FEATURES['video'].load().process_files(
+            video_path=video_path,
+            excel_path=excel_path,
+            credential_path=os.path.join(UPLOAD_DIR, 'sapheb-b87c6918d4ef.json'),
+            bucket_name='sap_pdf',
+            frames_folder=frames_folder,
+            temp_folder=temp_folder,
+            job_id=job_id,
+            on_stage=on_stage
+        )
+    finally:
+        on_stage(None)  # Time the last stage
+
+    # Ensure the docx file exists and get the base name for PDF
+    results_dir = os.path.join(job_dir, 'results')
+    docx_filename = result['docx_filename']
+    docx_path = os.path.join(results_dir, docx_filename)
+    if not os.path.exists(docx_path):
+        raise ValueError(f"Generated DOCX file not found: {docx_path}")
+
+    # Use the original Word document path (as generated by processing.py)
+    # Use the docx file directly instead of looking for a PDF
+    original_docx_filename = docx_filename
+    original_docx_path = os.path.join(results_dir, original_docx_filename)
+    if not os.path.exists(original_docx_path):
+         raise ValueError(f"Generated Word document not found: {original_docx_path}")
+
+    # --- Apply new filename formatting ---
+    # Get base name without '-DOCX.docx'
+    base_name_with_underscores = original_docx_filename.replace('-DOCX.docx', '')
+    # Replace underscores with spaces
+    base_name_with_spaces = base_name_with_underscores.replace('_', ' ')
+
+    # Find the first space
+    first_space_index = base_name_with_spaces.find(' ')
+
+    if first_space_index != -1:
+        # Construct new name: [FirstPart] Rest Of Name.docx
+        first_part = base_name_with_spaces[:first_space_index]
+        rest_of_name = base_name_with_spaces[first_space_index:] # Includes the leading space
+        new_docx_filename = f"[{first_part}]{rest_of_name}.docx"
+    else:
+        # No spaces, just add brackets: [WholeName].docx
+        new_docx_filename = f"[{base_name_with_spaces}].docx"
+
+    # Sanitize the new filename
+    new_docx_filename_safe = secure_filename(new_docx_filename)
+    new_docx_path = os.path.join(results_dir, new_docx_filename_safe)
+
+    # Rename the generated Word document file
+    try:
+        os.rename(original_docx_path, new_docx_path)
+    except OSError as rename_error:
+         raise OSError(f"Failed to rename Word document: {rename_error}")
+    # --- End of filename formatting ---
+    job_index.update(job_id, output_files=[new_docx_filename_safe], duration=result.get('total_seconds'))
+
+    return {
+        # Send the *new* filename for download
+        'download_url': f'/download/{job_id}/{new_docx_filename_safe}'
+    }
+
+async def watch_job(websocket, job_id):
+    """Pushes the job's state to the client whenever it changes, until the job finishes."""
+    last_update = None
+    while True:
+        state = read_job_state(job_id)
+        if state is None:
+            await websocket.send(json.dumps({'type': 'job', 'id': job_id, 'state': 'unknown'}))
+            return
+        if state.get('updated') != last_update:
+            last_update = state.get('updated')
+            await websocket.send(json.dumps(dict(state, type='job')))
+        if state.get('state') in ('done', 'failed'):
+            return
+        await asyncio.sleep(JOB_WATCH_INTERVAL)
+
 async def handle_websocket(websocket, path):
+    websockets = FEATURES['websocket'].load().websockets  # Already loaded by run_websocket_server
     try:
-        # First message should be session ID
+        # First message is either a job to watch or an Excel session ID
         session_id = await websocket.recv()
-        session = excel_sessions.get(session_id)
+        try:
+            message = json.loads(session_id)
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and message.get('type') == 'watch_job':
+            await watch_job(websocket, str(message.get('job_id', '')))
+            return
+        session = get_excel_session(session_id)
         
         if not session:
             await websocket.close()
             return
+        try:
+            clipboard = FEATURES['clipboard'].load()
+        except FeatureUnavailable:
+            await websocket.close()
+            return
         
         # Store websocket connection in session
         session.websocket = websocket
@@ -1082,11 +3589,11 @@ async def handle_websocket(websocket, path):
             if session.monitoring:
                 # Wait a brief moment for the clipboard to update
                 time.sleep(0.1)
-                text = pyperclip.paste()
+                text = clipboard.pyperclip.paste()
                 asyncio.run(session.add_text(text))
         
         # Set up hotkey with delay
-        keyboard.add_hotkey('ctrl+c', on_clipboard_change)
+        clipboard.keyboard.add_hotkey('ctrl+c', on_clipboard_change)
         
         try:
             while True:
@@ -1103,34 +3610,245 @@ async def handle_websocket(websocket, path):
                     break
         
         finally:
-            keyboard.remove_hotkey('ctrl+c')
+            clipboard.keyboard.remove_hotkey('ctrl+c')
             session.monitoring = False
-            del excel_sessions[session_id]
+            end_excel_session(session_id)
     
     except websockets.exceptions.ConnectionClosed:
         pass
 
 def run_websocket_server():
+    try:
+        websockets = FEATURES['websocket'].load().websockets
+    except FeatureUnavailable:
+        return  # Job progress falls back to polling /api/jobs/<id>
     asyncio.set_event_loop(asyncio.new_event_loop())
     start_server = websockets.serve(handle_websocket, "localhost", WS_PORT)
     asyncio.get_event_loop().run_until_complete(start_server)
     asyncio.get_event_loop().run_forever()
 
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """TCPServer that handles each connection on a bounded pool of worker threads."""
+    def __init__(self, server_address, handler_class, workers=HTTP_WORKERS, bind_and_activate=True,
+                 reuse_port=False, connection_timeout=HTTP_CONNECTION_TIMEOUT):
+        self.reuse_port = reuse_port
+        self.connection_timeout = connection_timeout
+        # Before binding: TCPServer calls server_close() when the bind fails
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            request.settimeout(self.connection_timeout)
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+def parse_byte_range(header, size):
+    """
+    Parse a single-range "bytes=" Range header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored (malformed or multi-range) and
+    'unsatisfiable' when the range lies entirely past the end of the file.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix == 0:
+                return 'unsatisfiable'
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+def add_mime_types():
+    if not mimetypes.guess_type('file.js')[0]:
+        mimetypes.add_type('application/javascript', '.js')
+    if not mimetypes.guess_type('file.css')[0]:
+        mimetypes.add_type('text/css', '.css')
+    # Downloads and static workbooks rely on these when send_file() guesses the type
+    mimetypes.add_type('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx')
+    mimetypes.add_type('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx')
+    mimetypes.add_type('application/pdf', '.pdf')
+
+def report_capabilities():
+    """Warns at startup about tools whose dependencies are missing; the rest load on first use."""
+    for feature in FEATURES.values():
+        missing = feature.missing()
+        if missing:
+            print(f"WARNING: {feature.description} is disabled, missing {', '.join(missing)}")
+
+def start_worker_pools():
+    """
+    Creates the Excel formatter's cleaning pool at startup rather than in whichever
+    request thread first needs it. Skipped when the formatter is unavailable.
+    """
+    try:
+        FEATURES['excel'].load().start_worker_pool()
+    except FeatureUnavailable:
+        pass
+
+def stop_worker_pools():
+    """Shuts the cleaning pool down once the server has stopped taking requests."""
+    excel = FEATURES['excel'].api
+    if excel is not None:
+        excel.shutdown_worker_pool()
+
+def clear_profiling():
+    """Drops requests left armed by a previous run; saved profiles are kept."""
+    shutil.rmtree(PROFILE_ARMED_DIR, ignore_errors=True)
+    os.makedirs(PROFILE_ARMED_DIR, exist_ok=True)
+
 def run_http_server():
-    with socketserver.TCPServer(("", HTTP_PORT), MultiToolHandler) as httpd:
-        print(f"HTTP server running at http://localhost:{HTTP_PORT}")
+    clear_job_claims()
+    clear_profiling()
+    if MEMORY_TRACKING:
+        memory_tracker.start()
+    job_index.ensure_built()
+    retention.start()
+    static_assets.warm()
+    start_worker_pools()
+    with ThreadPoolHTTPServer(("", HTTP_PORT), MultiToolHandler) as httpd:
+        print(f"HTTP server running at http://localhost:{HTTP_PORT} with {HTTP_WORKERS} worker threads")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("Server stopped by user")
-            httpd.server_close()
+        finally:
+            httpd.server_close()  # Waits for requests in progress, which may still use the pool
+            stop_worker_pools()
+
+def run_http_worker(listen_socket, shutdown_event, profiling_flag):
+    """
+    Entry point of a pre-fork worker process. Serves the supervisor's listening socket,
+    or binds its own with SO_REUSEPORT when listen_socket is None, until shutdown_event
+    is set. Closing the server waits for requests already in progress.
+    """
+    global worker_shutdown_event, profiling_armed
+    worker_shutdown_event = shutdown_event
+    profiling_armed = profiling_flag
+    add_mime_types()
+    if MEMORY_TRACKING:
+        memory_tracker.start()
+    static_assets.warm()
+    start_worker_pools()
+
+    if listen_socket is None:
+        httpd = ThreadPoolHTTPServer(("", HTTP_PORT), MultiToolHandler, reuse_port=True)
+    else:
+        httpd = ThreadPoolHTTPServer(listen_socket.getsockname(), MultiToolHandler, bind_and_activate=False)
+        httpd.socket.close()
+        httpd.socket = listen_socket
+
+    def stop_when_draining():
+        shutdown_event.wait()
+        httpd.shutdown()
+    threading.Thread(target=stop_when_draining, daemon=True).start()
+
+    def flush_metrics():
+        while not shutdown_event.wait(METRICS_FLUSH_INTERVAL):
+            write_metrics_file()
+        write_metrics_file()
+    threading.Thread(target=flush_metrics, daemon=True).start()
+
+    print(f"HTTP worker {os.getpid()} serving with {HTTP_WORKERS} threads")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        stop_worker_pools()
+
+def run_prefork_server(processes):
+    """
+    Supervisor for the pre-fork mode. Starts the worker processes, restarts any that exit
+    unexpectedly (releasing the jobs they had claimed), and once /shutdown or Ctrl+C sets
+    the shutdown event, waits up to DRAIN_TIMEOUT seconds for the workers to finish.
+    On Linux each worker binds the port with SO_REUSEPORT; elsewhere they share a socket
+    created here.
+    """
+    context = multiprocessing.get_context('spawn')
+    shutdown_event = context.Event()
+    profiling_flag = context.RawValue('b', 0)  # Read lock-free by every request in every worker
+    listen_socket = None
+    if not (sys.platform.startswith('linux') and hasattr(socket, 'SO_REUSEPORT')):
+        listen_socket = socket.create_server(("", HTTP_PORT))
+
+    clear_job_claims()
+    clear_profiling()
+    job_index.ensure_built()
+    retention.start()  # In the supervisor only, so one process does the deleting
+    # Worker metrics files from a previous run; counters start from zero with the server
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for name in os.listdir(METRICS_DIR):
+        os.unlink(os.path.join(METRICS_DIR, name))
+    workers = {}
+
+    def start_worker(slot):
+        process = context.Process(target=run_http_worker, args=(listen_socket, shutdown_event, profiling_flag),
+                                  name=f"http-worker-{slot}")
+        process.start()
+        workers[slot] = process
+
+    for slot in range(processes):
+        start_worker(slot)
+    print(f"HTTP server running at http://localhost:{HTTP_PORT} with {processes} worker processes")
+
+    try:
+        while not shutdown_event.wait(1):
+            for slot, process in list(workers.items()):
+                if not process.is_alive():
+                    print(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                    clear_job_claims(process.pid)
+                    start_worker(slot)
+    except KeyboardInterrupt:
+        print("Server stopped by user")
+        shutdown_event.set()
+
+    print("Draining worker processes...")
+    deadline = time.time() + DRAIN_TIMEOUT
+    for process in workers.values():
+        process.join(max(deadline - time.time(), 0))
+    for process in workers.values():
+        if process.is_alive():
+            print(f"Worker {process.pid} did not finish in time, terminating")
+            process.terminate()
+            clear_job_claims(process.pid)
+    if listen_socket:
+        listen_socket.close()
 
 if __name__ == "__main__":
     # Add MIME types
-    if not mimetypes.guess_type('file.js')[0]:
-        mimetypes.add_type('application/javascript', '.js')
-    if not mimetypes.guess_type('file.css')[0]:
-        mimetypes.add_type('text/css', '.css')
+    add_mime_types()
+    report_capabilities()
     
     # Start WebSocket server in a separate thread
     ws_thread = threading.Thread(target=run_websocket_server)
@@ -1138,4 +3856,7 @@ if __name__ == "__main__":
     ws_thread.start()
     
     # Start HTTP server in main thread
-    run_http_server()
\ No newline at end of file
+    if HTTP_PROCESSES > 1:
+        run_prefork_server(HTTP_PROCESSES)
+    else:
+        run_http_server()
\ No newline at end of file
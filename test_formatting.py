@@ -0,0 +1,386 @@
+"""
+Tests for formatting.py.
+
+The differential tests run the same corpus through the 'regex' and 'scan' cleaning
+engines with every combination of text options and require identical output.
+"""
+
+import io
+import itertools
+import random
+import shutil
+import zipfile
+from xml.sax.saxutils import escape
+
+import openpyxl
+import pytest
+
+import formatting
+from formatting import (TEXT_OPTIONS, clean_text, clean_texts, clean_texts_parallel, compact_rows, compile_cleaner,
+                        format_workbook, preview_rows, process_excel, process_excel_streaming, remove_blank_rows,
+                        rewrite_shared_strings)
+
+# Hand-picked cases for each rule and the places where rules interact
+CORPUS = [
+    "",
+    "   ",
+    "hello world",
+    "  padded text  ",
+    "Check 'BOM' and \"bom\" and ' Bom '",
+    'Part "P R 3" fits "A B C" slot',
+    "Serial P B 0 0 3 7 2 0 1 here",
+    "a b c",
+    "a b cd",
+    "ab c d e",
+    "a b c_d",
+    "a b c. next",
+    "x  y   z",
+    "tabs\tand\t\tnewlines\n\nhere",
+    "wait... what....  and ......",
+    "..'...'..",
+    "empty '' and \"\" quotes",
+    "'\"\"' nested",
+    "a '\"\"' b",
+    "'x''",
+    "\"'\"'",
+    "it's John's",
+    "unclosed \"quote\nand 'next' line",
+    "'a\n'b'",
+    "é b c d",
+    "a b c é",
+    "1 2 3 4 5 6 7 8 9 0",
+    "ends with )",
+    "ends with !",
+    "'spaced out'",
+    "\" \"",
+    "' a b '",
+]
+
+def random_corpus(count, seed=0):
+    """Random strings built from the characters the rules care about."""
+    pieces = list('ab0Z "\'.\n\t_é²ß\r,') + ['BOM', '...', '  ', 'P R 3', "'x'", '""', "''", ' a ']
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(pieces) for _ in range(rnd.randint(0, 60))) for _ in range(count)]
+
+ALL_OPTION_SETS = [dict(zip(TEXT_OPTIONS, flags))
+                   for flags in itertools.product([False, True], repeat=len(TEXT_OPTIONS))]
+
+@pytest.mark.parametrize('options', ALL_OPTION_SETS)
+def test_scan_engine_matches_regex_engine(options):
+    regex = compile_cleaner(options, engine='regex')
+    scan = compile_cleaner(options, engine='scan')
+    for text in CORPUS + random_corpus(300):
+        assert scan(text) == regex(text), (text, options)
+
+def test_examples():
+    options = {'remove_spaces_quotes': True, 'remove_spaces_unquoted': True,
+               'capitalize_sentences': True, 'add_periods': True, 'remove_ellipsis': True}
+    assert clean_text('part "P R 3" and P B 0 0 3...', options) == 'Part "PR3" and PB003.'
+    assert clean_text("use 'bom'", {}) == 'use BOM'
+
+@pytest.mark.parametrize('engine', ['regex', 'scan'])
+def test_clean_texts_matches_clean_text(engine):
+    values = random_corpus(200, seed=1)
+    values += values[:50]  # Repeated values are cleaned once and scattered back
+    for options in ALL_OPTION_SETS[::7]:
+        expected = [clean_text(value, options) for value in values]
+        assert clean_texts(values, options, engine=engine) == expected
+
+def test_compile_cleaner_is_cached():
+    assert compile_cleaner({'add_periods': True}) is compile_cleaner({'add_periods': 1, 'unknown': True})
+    assert not compile_cleaner({'remove_blank_lines': True}).enabled
+
+def test_compile_cleaner_cache_key():
+    options = {'add_periods': True, 'remove_ellipsis': True}
+    reordered = {'remove_ellipsis': 'yes', 'add_periods': True, 'remove_blank_lines': False}
+    assert compile_cleaner(options) is compile_cleaner(reordered)
+    assert compile_cleaner(options) is not compile_cleaner({'add_periods': True})
+    assert compile_cleaner(options) is not compile_cleaner(options, engine='scan')
+    assert compile_cleaner(options) is not compile_cleaner(options, debug=True)
+
+    hits = formatting._cached_plan.cache_info().hits
+    compile_cleaner(dict(options))
+    assert formatting._cached_plan.cache_info().hits == hits + 1
+
+def test_clean_texts_cleans_each_distinct_value_once(monkeypatch):
+    seen = []
+    def step(text):
+        seen.append(text)
+        return text.upper()
+    plan = type('Plan', (), {'steps': [('upper', step, None)]})()
+    monkeypatch.setattr(formatting, 'compile_cleaner', lambda options, engine='regex': plan)
+
+    values = ['b', '', 'a', 'b', '', 'a', 'b']
+    assert clean_texts(values, {}) == ['B', '', 'A', 'B', '', 'A', 'B']
+    assert seen == ['b', '', 'a']
+    assert clean_texts([], {}) == []
+
+@pytest.mark.parametrize('engine', ['regex', 'scan'])
+def test_clean_texts_empty_and_blank_strings(engine):
+    options = dict.fromkeys(TEXT_OPTIONS, True)
+    values = ['', ' ', '', '\n', ' ']
+    assert clean_texts(values, options, engine=engine) == [clean_text(value, options) for value in values]
+
+def test_format_workbook_cleans_non_string_cells_like_the_cell_loop():
+    # Column A is cleaned as str(value), as the original one-cell-at-a-time loop did
+    values = [' a b c', 5, 1.5, True, 5, '5', None, 'after', None, None, 'not reached']
+    wb = openpyxl.Workbook()
+    for row, value in enumerate(values, start=1):
+        wb.active.cell(row=row, column=1).value = value
+    data = io.BytesIO()
+    wb.save(data)
+
+    options = dict(FAST_PATH_OPTIONS, remove_blank_lines=False)
+    expected = []
+    for value in values[:-1]:
+        text = None if value is None else str(value)
+        expected.append(clean_text(text, options) if text else value)
+    expected.append('not reached')
+    result = openpyxl.load_workbook(io.BytesIO(format_workbook(data.getvalue(), options)))
+    assert [result.active.cell(row=row, column=1).value for row in range(1, len(values) + 1)] == expected
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        compile_cleaner({}, engine='fast')
+
+def write_shared_strings_workbook(path, column_a, other_cells=()):
+    """
+    Writes a minimal .xlsx that stores its text in xl/sharedStrings.xml the way Excel does
+    (openpyxl itself writes inline strings). other_cells is a list of (cell ref, text).
+    """
+    strings = []
+    def string_index(text):
+        if text not in strings:
+            strings.append(text)
+        return strings.index(text)
+
+    rows = {}
+    for row, text in enumerate(column_a, start=1):
+        if text is not None:
+            rows.setdefault(row, []).append(f'<c r="A{row}" t="s"><v>{string_index(text)}</v></c>')
+    for ref, text in other_cells:
+        rows.setdefault(int(ref[1:]), []).append(f'<c r="{ref}" t="s"><v>{string_index(text)}</v></c>')
+
+    main = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel_type = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    sheet_data = ''.join(f'<row r="{row}">{"".join(cells)}</row>' for row, cells in sorted(rows.items()))
+    parts = {
+        '[Content_Types].xml':
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '</Types>',
+        '_rels/.rels':
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{rel_type}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        'xl/workbook.xml':
+            f'<workbook {main} xmlns:r="{rel_type}"><sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        'xl/_rels/workbook.xml.rels':
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{rel_type}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{rel_type}/sharedStrings" Target="sharedStrings.xml"/></Relationships>',
+        'xl/worksheets/sheet1.xml': f'<worksheet {main}><sheetData>{sheet_data}</sheetData></worksheet>',
+        'xl/sharedStrings.xml':
+            f'<sst {main}>' + ''.join(f'<si><t xml:space="preserve">{escape(text)}</t></si>' for text in strings) + '</sst>',
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for name, xml in parts.items():
+            zout.writestr(name, xml)
+
+def column_values_of(ws):
+    return [[cell.value for cell in row] for row in ws.iter_rows()]
+
+def column_values(path):
+    return column_values_of(openpyxl.load_workbook(path).active)
+
+FAST_PATH_OPTIONS = {'capitalize_sentences': True, 'add_periods': True, 'remove_ellipsis': True,
+                     'remove_spaces_quotes': True, 'remove_spaces_unquoted': True}
+
+def test_rewrite_shared_strings_matches_process_excel(tmp_path):
+    column_a = [' hello', '"P R 3" fits...', 'dup', 'dup', None, 'a & <b> c d e', '  ', None, 'after']
+    fast, full = tmp_path / 'fast.xlsx', tmp_path / 'full.xlsx'
+    write_shared_strings_workbook(fast, column_a)
+    shutil.copy(fast, full)
+
+    assert rewrite_shared_strings(str(fast), FAST_PATH_OPTIONS)
+    process_excel(str(full), FAST_PATH_OPTIONS)
+    assert column_values(fast) == column_values(full)
+    assert column_values(fast)[0] == ['Hello.']
+
+def test_rewrite_shared_strings_falls_back_for_shared_values(tmp_path):
+    path = tmp_path / 'shared.xlsx'
+    write_shared_strings_workbook(path, ['dup', 'other'], other_cells=[('B1', 'dup')])
+    before = path.read_bytes()
+    assert not rewrite_shared_strings(str(path), FAST_PATH_OPTIONS)
+    assert path.read_bytes() == before
+
+def test_format_workbook_reports_a_skipped_fast_path_in_stats(tmp_path, capsys):
+    path = tmp_path / 'shared.xlsx'
+    write_shared_strings_workbook(path, ['dup', 'other'], other_cells=[('B1', 'dup')])
+    stats = {}
+    result = format_workbook(path.read_bytes(), FAST_PATH_OPTIONS, stats=stats)
+    assert stats['fast_path_skipped'] and stats['values_changed'] == 2
+    ws = openpyxl.load_workbook(io.BytesIO(result)).active
+    assert [ws['A1'].value, ws['A2'].value, ws['B1'].value] == ['Dup.', 'Other.', 'dup']
+    assert capsys.readouterr().out == ''
+
+def test_streaming_matches_process_excel_and_remove_blank_rows(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row, text in enumerate([' hello', '"P R 3" fits...', None, '...', 'a b c', None, None, 'after'], start=1):
+        ws.cell(row=row, column=1).value = text
+    ws['B3'] = 'kept'
+    ws.column_dimensions['B'].width = 25
+    wb.create_sheet('Other')['A2'] = 'untouched'
+    streamed, full = tmp_path / 'streamed.xlsx', tmp_path / 'full.xlsx'
+    wb.save(streamed)
+    shutil.copy(streamed, full)
+
+    options = dict(FAST_PATH_OPTIONS, remove_blank_lines=True)
+    process_excel(str(full), options)
+    expected_removed = remove_blank_rows(str(full))
+    assert process_excel_streaming(str(streamed), options) == expected_removed
+
+    result, expected = openpyxl.load_workbook(streamed), openpyxl.load_workbook(full)
+    assert result.sheetnames == expected.sheetnames
+    for name in result.sheetnames:
+        assert column_values_of(result[name]) == column_values_of(expected[name])
+    assert result.active.column_dimensions['B'].width == 25
+
+def test_compact_rows_moves_merges_and_row_dimensions():
+    ws = openpyxl.Workbook().active
+    ws['A1'] = 'title'
+    ws['A3'] = 'merged'
+    ws.merge_cells('A3:B5')  # Rows 4 and 5 are blank apart from the merge
+    ws['C6'].font = openpyxl.styles.Font(bold=True)  # Styled but empty is still blank
+    ws['A7'] = '   '
+    ws['A8'] = 'last'
+    ws.row_dimensions[8].height = 40
+
+    assert compact_rows(ws) == 5
+    assert column_values_of(ws) == [['title', None], ['merged', None], ['last', None]]
+    assert [str(merged) for merged in ws.merged_cells.ranges] == ['A2:B2']
+    assert ws.row_dimensions[3].height == 40
+
+def test_compact_rows_leaves_no_stale_row_dimensions():
+    ws = openpyxl.Workbook().active
+    ws['A1'] = 'first'
+    ws['A3'] = 'second'
+    ws.row_dimensions[2].height = 11  # Removed with its row
+    ws.row_dimensions[3].height = 33
+    ws.row_dimensions[6].height = 66  # Past the data, shifts up like delete_rows() would
+
+    assert compact_rows(ws) == 1
+    assert ws.max_row == 2
+    heights = {row: dimension.height for row, dimension in ws.row_dimensions.items() if dimension.height}
+    assert heights == {2: 33, 5: 66}
+    assert all(dimension.index == row for row, dimension in ws.row_dimensions.items())
+
+def test_format_workbook_matches_file_functions(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row, text in enumerate([' hello', None, '"P R 3" fits...', '   ', 'a b c', None, None, 'after'], start=1):
+        ws.cell(row=row, column=1).value = text
+    ws['B2'] = 'kept'
+    path = tmp_path / 'file.xlsx'
+    wb.save(path)
+    data = path.read_bytes()
+
+    options = dict(FAST_PATH_OPTIONS, remove_blank_lines=True)
+    process_excel(str(path), options)
+    expected_removed = remove_blank_rows(str(path))
+
+    stats = {}
+    result = openpyxl.load_workbook(io.BytesIO(format_workbook(io.BytesIO(data), options, stats=stats)))
+    assert column_values_of(result.active) == column_values(path)
+    assert stats['blank_rows_removed'] == expected_removed
+    assert format_workbook(data, {}) == data
+
+def test_clean_texts_parallel_matches_clean_texts(monkeypatch):
+    monkeypatch.setattr(formatting, 'PARALLEL_MIN_VALUES', 10)
+    monkeypatch.setattr(formatting, '_worker_count', lambda: 2)
+    values = random_corpus(300, seed=2)
+    assert clean_texts_parallel(values, FAST_PATH_OPTIONS) == clean_texts(values, FAST_PATH_OPTIONS)
+
+
+def test_worker_pool_spawns_and_restarts_after_shutdown():
+    pool = formatting.start_worker_pool()
+    assert formatting.start_worker_pool() is pool
+    assert pool._mp_context.get_start_method() == 'spawn'  # Never forked from a threaded server
+    formatting.shutdown_worker_pool()
+    assert formatting.start_worker_pool() is not pool
+    formatting.shutdown_worker_pool()
+
+def test_format_workbook_column_selector():
+    wb = openpyxl.Workbook()
+    first = wb.active
+    first.title = 'Sheet1'
+    second = wb.create_sheet('Sheet2')
+    for ws in (first, second):
+        for column in 'ABC':
+            ws[f'{column}1'] = f'{column.lower()} text'
+    output = io.BytesIO()
+    wb.save(output)
+
+    options = {'capitalize_sentences': True, 'columns': {'Sheet1': ['A', 'c'], '*': ['B']}}
+    result = openpyxl.load_workbook(io.BytesIO(format_workbook(output.getvalue(), options)))
+    assert column_values_of(result['Sheet1']) == [['A text', 'b text', 'C text']]
+    assert column_values_of(result['Sheet2']) == [['a text', 'B text', 'c text']]
+
+    with pytest.raises(ValueError):
+        format_workbook(output.getvalue(), {'capitalize_sentences': True, 'columns': {'Missing': ['A']}})
+
+def test_preview_rows_reads_one_page(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, 26):
+        ws.cell(row=row, column=1).value = f'row {row}...'
+        ws.cell(row=row, column=2).value = row
+    path = tmp_path / 'preview.xlsx'
+    wb.save(path)
+
+    page = preview_rows(str(path), offset=20, limit=3, options={'remove_ellipsis': True})
+    assert page['rows'] == [['row 21...', 21], ['row 22...', 22], ['row 23...', 23]]
+    assert page['cleaned'] == [['row 21', None], ['row 22', None], ['row 23', None]]
+    assert page['has_more']
+    last = preview_rows(str(path), offset=23, limit=3)
+    assert len(last['rows']) == 2 and not last['has_more'] and 'cleaned' not in last
+
+def test_preview_rows_stops_cleaning_where_format_workbook_does(tmp_path):
+    wb = openpyxl.Workbook()
+    for value in ['one...', 5, None, 'two...', None, None, 'after the gap...', 'more...']:
+        wb.active.append([value])
+    path = tmp_path / 'preview.xlsx'
+    wb.save(path)
+    options = {'remove_ellipsis': True, 'add_periods': True}
+    formatted = openpyxl.load_workbook(io.BytesIO(format_workbook(path.read_bytes(), options))).active
+    expected = [[cell.value] for cell in formatted['A']]
+
+    for offset, limit in [(0, 8), (3, 2), (5, 3)]:
+        page = preview_rows(str(path), offset=offset, limit=limit, options=options)
+        shown = [[original if cleaned is None else cleaned for original, cleaned in zip(row, cleaned_row)]
+                 for row, cleaned_row in zip(page['rows'], page['cleaned'])]
+        assert shown == expected[offset:offset + limit]
+    assert preview_rows(str(path), offset=6, limit=2, options=options)['cleaned'] == [[None], [None]]
+
+def test_preview_rows_cleans_the_columns_format_workbook_cleans(tmp_path):
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Steps'
+    wb.active.append(['one...', 'two...', 'three...'])
+    wb.create_sheet('Notes').append(['four...', 'five...'])
+    path = tmp_path / 'preview.xlsx'
+    wb.save(path)
+    options = {'remove_ellipsis': True}
+
+    assert preview_rows(str(path), options=options)['cleaned'] == [['one', None, None]]
+    assert preview_rows(str(path), sheet_name='Notes', options=options)['cleaned'] == [[None, None]]
+    columns = {'Steps': ['B', 'C'], '*': ['A']}
+    assert preview_rows(str(path), options=options, columns=columns)['cleaned'] == [[None, 'two', 'three']]
+    assert preview_rows(str(path), sheet_name='Notes', options=options, columns=columns)['cleaned'] == [['four', None]]
+
+    formatted = openpyxl.load_workbook(io.BytesIO(format_workbook(path.read_bytes(), dict(options, columns=columns))))
+    assert [cell.value for cell in formatted['Steps'][1]] == ['one...', 'two', 'three']
+    assert [cell.value for cell in formatted['Notes'][1]] == ['four', 'five...']
@@ -0,0 +1,467 @@
+"""
+Tests for MultiToolHandler routes, run against the handler on a local ephemeral port.
+
+They need server.py's own dependencies (werkzeug) and skip without them.
+"""
+
+import gzip
+import http.client
+import http.server
+import io
+import json
+import os
+import socket
+import threading
+import uuid
+import zipfile
+
+import openpyxl
+import pytest
+
+from test_formatting import write_shared_strings_workbook
+
+server = pytest.importorskip('server', reason="server.py's own dependencies are not installed")
+
+@pytest.fixture(scope='module')
+def port():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), server.MultiToolHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture(autouse=True)
+def uploads(tmp_path, monkeypatch):
+    """
+    Points UPLOAD_DIR and everything kept under it at tmp_path, so tests start from empty
+    caches and stores and leave nothing behind in the repository's uploads/ directory.
+    """
+    monkeypatch.setattr(server, 'UPLOAD_DIR', str(tmp_path))
+    for name, directory in [('UPLOAD_SPOOL_DIR', 'incoming'), ('BLOB_DIR', 'blobs'), ('PREVIEW_DIR', 'previews'),
+                            ('METRICS_DIR', 'metrics'), ('PROFILE_DIR', 'profiles'), ('MEMORY_DIR', 'memory'),
+                            ('EXCEL_SESSION_DIR', 'excel_sessions')]:
+        monkeypatch.setattr(server, name, str(tmp_path / directory))
+    (tmp_path / 'incoming').mkdir()
+    (tmp_path / 'blobs').mkdir()
+    (tmp_path / 'profiles').mkdir()
+    monkeypatch.setattr(server, 'PROFILE_ARMED_DIR', str(tmp_path / 'profiles' / 'armed'))
+    monkeypatch.setattr(server, 'profiling_armed', server.ProfilingFlag())
+    monkeypatch.setattr(server, 'RETENTION_STATS_FILE', str(tmp_path / 'retention.json'))
+    monkeypatch.setattr(server, 'blob_store', server.BlobStore(str(tmp_path / 'blobs')))
+    monkeypatch.setattr(server, 'format_cache', server.FormatResultCache(str(tmp_path / 'format_cache'),
+                                                                         server.FORMAT_CACHE_MAX_BYTES))
+    monkeypatch.setattr(server, 'job_index', server.JobIndex(str(tmp_path / 'jobs.sqlite3')))
+    return tmp_path
+
+def post_form(port, path, fields, files):
+    """POSTs multipart/form-data; files maps field name to (filename, bytes). Returns (status, body, headers)."""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        body.write(data + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request('POST', path, body.getvalue(),
+                           {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        response = connection.getresponse()
+        return response.status, response.read(), response.headers
+    finally:
+        connection.close()
+
+def test_large_text_only_format_uses_the_lossless_fast_path(port, tmp_path, monkeypatch):
+    path = tmp_path / 'large.xlsx'
+    write_shared_strings_workbook(path, ['  first step', 'second step...', None, 'third'], [('B1', 'note')])
+    monkeypatch.setattr(server, 'STREAMING_THRESHOLD_BYTES', 0)
+    def fail(*args, **kwargs):
+        raise AssertionError("streaming mode used for text-only cleaning")
+    monkeypatch.setattr(server.FEATURES['excel'].load(), 'process_excel_streaming', fail)
+
+    status, body, headers = post_form(port, '/api/format-excel',
+                                      {'addPeriods': 'true', 'capitalizeSentences': 'true'},
+                                      {'file': ('large.xlsx', path.read_bytes())})
+    assert status == 200
+    with zipfile.ZipFile(io.BytesIO(body)) as result, zipfile.ZipFile(path) as original:
+        assert result.read('xl/worksheets/sheet1.xml') == original.read('xl/worksheets/sheet1.xml')
+    cells = openpyxl.load_workbook(io.BytesIO(body)).active
+    assert [cells['A1'].value, cells['A2'].value, cells['B1'].value] == ['First step.', 'Second step...', 'note']
+
+def write_merged_workbook(path):
+    wb = openpyxl.Workbook()
+    for text in ['first step', None, 'second step', None, 'third step']:
+        wb.active.append([text])
+    wb.active.merge_cells('A3:B3')
+    wb.save(path)
+
+def test_large_upload_with_blank_row_removal_keeps_the_workbook_intact(port, tmp_path, monkeypatch):
+    path = tmp_path / 'large.xlsx'
+    write_merged_workbook(path)
+    monkeypatch.setattr(server, 'STREAMING_THRESHOLD_BYTES', 0)
+
+    status, body, headers = post_form(port, '/api/format-excel', {'removeBlankLines': 'true', 'addPeriods': 'true'},
+                                      {'file': ('large.xlsx', path.read_bytes())})
+    assert status == 200 and 'X-Format-Warning' not in headers
+    cells = openpyxl.load_workbook(io.BytesIO(body)).active
+    assert [row[0].value for row in cells.iter_rows()] == ['first step.', 'second step.', 'third step.']
+    assert [str(merged) for merged in cells.merged_cells.ranges] == ['A2:B2']
+
+def test_low_memory_mode_streams_the_spooled_file_with_a_warning(port, tmp_path, monkeypatch):
+    path = tmp_path / 'large.xlsx'
+    write_merged_workbook(path)
+    monkeypatch.setattr(server, 'STREAMING_THRESHOLD_BYTES', 0)
+    fields = {'removeBlankLines': 'true', 'addPeriods': 'true', 'lowMemory': 'true'}
+
+    for _ in range(2):  # Not cached, so the second request gets the warning too
+        status, body, headers = post_form(port, '/api/format-excel', fields, {'file': ('large.xlsx', path.read_bytes())})
+        assert status == 200 and headers['X-Format-Warning'] == server.LOW_MEMORY_WARNING
+    cells = openpyxl.load_workbook(io.BytesIO(body)).active
+    assert [row[0].value for row in cells.iter_rows()] == ['first step.', 'second step.', 'third step.']
+    assert not cells.merged_cells.ranges
+
+@pytest.mark.parametrize('state, expected', [('running', 202), ('done', 409), (None, 409)])
+def test_process_answers_409_while_the_claim_is_held_by_a_removal(port, tmp_path, monkeypatch, state, expected):
+    monkeypatch.setattr(server.MultiToolHandler, 'require_feature', lambda self, name: object())
+    job_dir = tmp_path / 'job'
+    job_dir.mkdir()
+    (job_dir / server.JOB_CLAIM_FILE).write_text('1')
+    if state:
+        (job_dir / server.JOB_STATE_FILE).write_text(json.dumps({'state': state}))
+
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request('POST', '/process/job')
+        response = connection.getresponse()
+        assert response.status == expected
+    finally:
+        connection.close()
+
+def put_chunk(port, upload, field, index, data):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request('PUT', f'/api/uploads/{upload.job_id}/{field}/{index}', data)
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+def test_chunks_are_written_under_the_job_claim(port, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'UPLOAD_CLAIM_WAIT', 0.2)
+    chunk_size = server.UPLOAD_MIN_CHUNK_SIZE
+    upload = server.ChunkedUpload.create({'video': ('video.mp4', chunk_size + 100), 'excel': ('script.xlsx', 10)},
+                                         chunk_size)
+    assert os.stat(upload.part_path('video')).st_blocks * 512 >= chunk_size + 100  # Preallocated, not sparse
+
+    # Held by finalize or retention: the chunk is turned away and the file is left alone
+    assert server.claim_job(upload.job_id)
+    assert put_chunk(port, upload, 'video', 1, b'x' * 100) == 409
+    server.release_job(upload.job_id)
+    assert upload.received('video') == []
+
+    assert put_chunk(port, upload, 'video', 1, b'x' * 100) == 200
+    assert upload.received('video') == [1]
+    with open(upload.part_path('video'), 'rb') as f:
+        f.seek(chunk_size)
+        assert f.read() == b'x' * 100
+    assert not os.path.exists(os.path.join(upload.job_dir, server.JOB_CLAIM_FILE))
+
+def test_retention_quota_leaves_uploads_in_progress_alone(tmp_path, monkeypatch):
+    upload = server.ChunkedUpload.create({'video': ('video.mp4', 1000), 'excel': ('script.xlsx', 10)},
+                                         server.UPLOAD_MIN_CHUNK_SIZE)
+    finished = tmp_path / 'finished'
+    finished.mkdir()
+    (finished / 'result.docx').write_bytes(b'x' * 1000)
+
+    server.RetentionScheduler(max_age=3600, quota_bytes=0, interval=60).run_once()
+    assert os.path.isdir(upload.job_dir)
+    assert not finished.exists()
+
+def test_static_assets_are_served_precompressed_and_reloaded(port, tmp_path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/script.js', headers={'Accept-Encoding': 'gzip, deflate'})
+    response = conn.getresponse()
+    body = response.read()
+    assert response.status == 200 and response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Vary') == 'Accept-Encoding'
+    with open(os.path.join(server.SCRIPT_DIR, 'script.js'), 'rb') as f:
+        assert gzip.decompress(body) == f.read()
+    conn.request('GET', '/script.js', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.getheader('ETag')})
+    cached = conn.getresponse()
+    assert cached.status == 304 and cached.read() == b''
+    conn.close()
+
+    (tmp_path / 'styles.css').write_text('body { margin: 0; }\n' * 100)
+    cache = server.StaticAssetCache(str(tmp_path), ('styles.css',))
+    asset = cache.get('styles.css')
+    assert asset.negotiate('gzip;q=0, identity')[0] == 'identity'
+    assert asset.negotiate('*')[0] in ('br', 'gzip')
+    assert cache.get('styles.css') is asset and cache.get('index.html') is None
+    (tmp_path / 'styles.css').write_text('body { margin: 1px; }\n')
+    reloaded = cache.get('styles.css')
+    assert reloaded is not asset and reloaded.negotiate(None)[1] == b'body { margin: 1px; }\n'
+
+def test_downloads_answer_validators_and_byte_ranges(port, uploads):
+    (uploads / 'job' / 'results').mkdir(parents=True)
+    content = bytes(range(256)) * 4
+    (uploads / 'job' / 'results' / 'video.pdf').write_bytes(content)
+
+    def get(headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', '/download/job/video.pdf', headers=headers or {})
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return response, body
+
+    response, body = get()
+    etag = response.getheader('ETag')
+    assert response.status == 200 and body == content and response.getheader('Accept-Ranges') == 'bytes'
+    response, body = get({'Range': 'bytes=100-199'})
+    assert response.status == 206 and body == content[100:200]
+    assert response.getheader('Content-Range') == f'bytes 100-199/{len(content)}'
+    response, body = get({'Range': 'bytes=-10', 'If-Range': etag})
+    assert response.status == 206 and body == content[-10:]
+    response, body = get({'Range': 'bytes=10-19', 'If-Range': '"stale"'})
+    assert response.status == 200 and body == content
+    response, body = get({'Range': f'bytes={len(content)}-'})
+    assert response.status == 416 and response.getheader('Content-Range') == f'bytes */{len(content)}'
+    response, body = get({'If-None-Match': etag})
+    assert response.status == 304 and body == b''
+    assert server.parse_byte_range('bytes=0-1,5-6', len(content)) is None
+    assert server.parse_byte_range('items=0-1', len(content)) is None
+
+def test_job_index_pages_through_jobs_created_at_the_same_time():
+    index = server.job_index
+    for number in range(5):
+        index.record(f'job{number}', 'video', input_files=['video.mp4'])
+    with index.connect() as connection:
+        connection.execute("UPDATE jobs SET created = 1000.0")
+
+    seen = []
+    cursor = None
+    while True:
+        jobs, cursor = index.query(limit=2, cursor=cursor)
+        seen += [job['id'] for job in jobs]
+        if cursor is None:
+            break
+    assert seen == ['job4', 'job3', 'job2', 'job1', 'job0']
+    assert index.query(job_type='excel')[0] == []
+    assert [job['id'] for job in index.query(until=1000.0)[0]] == []
+    assert len(index.query(since=1000.0, limit=10)[0]) == 5
+
+def test_blob_store_keeps_shared_content_until_the_last_job_is_deleted(uploads):
+    digest = 'ab' * 32
+    for job_id in ('first', 'second'):
+        (uploads / job_id).mkdir()
+        source = uploads / 'incoming' / f'{job_id}.part'
+        source.write_bytes(b'video' * 100)
+        deduplicated = server.blob_store.add(str(source), digest, str(uploads / job_id / 'video.mp4'))
+        assert deduplicated == (job_id == 'second')
+    blob = uploads / 'blobs' / digest
+    assert os.stat(blob).st_nlink == 3
+
+    assert server.delete_job_files('first') == 0  # Still shared with the second job
+    assert (uploads / 'second' / 'video.mp4').read_bytes() == b'video' * 100
+    assert blob.exists()
+
+    assert server.delete_job_files('second') == 500
+    assert not blob.exists()
+
+def test_retention_evicts_intermediates_first_and_skips_claimed_jobs(uploads):
+    for job_id in ('running', 'finished'):
+        for name in ('frames', 'temp', 'results'):
+            (uploads / job_id / name).mkdir(parents=True)
+        (uploads / job_id / 'frames' / 'frame0001.png').write_bytes(b'f' * 1000)
+        (uploads / job_id / 'temp' / 'audio.wav').write_bytes(b't' * 1000)
+        (uploads / job_id / 'results' / 'video.pdf').write_bytes(b'r' * 100)
+    assert server.claim_job('running')
+
+    run = server.RetentionScheduler(max_age=3600, quota_bytes=2500, interval=60).run_once()
+    assert run['evicted_artefacts'] == 2 and run['deleted_jobs'] == 0
+    assert not (uploads / 'finished' / 'frames').exists() and not (uploads / 'finished' / 'temp').exists()
+    assert (uploads / 'finished' / 'results' / 'video.pdf').exists()
+    assert (uploads / 'running' / 'frames' / 'frame0001.png').exists()
+
+    run = server.RetentionScheduler(max_age=3600, quota_bytes=0, interval=60).run_once()
+    assert run['deleted_jobs'] == 1
+    assert not (uploads / 'finished').exists()
+    assert (uploads / 'running' / 'temp' / 'audio.wav').exists()
+    server.release_job('running')
+
+def test_metrics_add_up_threads_and_workers_when_rendered():
+    recorder = server.Metrics()
+    labels = (('route', '/api/history'), ('method', 'GET'), ('status', '200'))
+
+    def record():
+        recorder.inc('http_requests_total', labels)
+        recorder.observe('http_request_duration_seconds', (('route', '/api/history'),), 0.5, buckets=(0.1, 1.0))
+
+    threads = [threading.Thread(target=record) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.add('http_requests_in_flight', value=2)
+    snapshot = json.loads(json.dumps(recorder.snapshot()))  # As another worker would publish it
+
+    lines = server.Metrics.render([snapshot, snapshot]).splitlines()
+    assert '# TYPE http_requests_total counter' in lines
+    assert 'http_requests_total{route="/api/history",method="GET",status="200"} 6' in lines
+    assert 'http_requests_in_flight 4' in lines
+    assert 'http_request_duration_seconds_bucket{route="/api/history",le="0.1"} 0' in lines
+    assert 'http_request_duration_seconds_bucket{route="/api/history",le="1.0"} 6' in lines
+    assert 'http_request_duration_seconds_bucket{route="/api/history",le="+Inf"} 6' in lines
+    assert 'http_request_duration_seconds_sum{route="/api/history"} 3.0' in lines
+    assert server.format_labels((('file', 'a "b"\\c'),)) == '{file="a \\"b\\"\\\\c"}'
+
+def test_metrics_endpoint_serves_the_text_format(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/metrics')
+    response = conn.getresponse()
+    body = response.read().decode()
+    conn.close()
+    assert response.status == 200
+    assert response.getheader('Content-type').startswith('text/plain; version=0.0.4')
+    assert '# TYPE format_cache_hits_total counter' in body
+
+def test_profiling_covers_exactly_the_armed_requests(port, uploads):
+    def request(method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request(method, path, body=json.dumps(body) if body is not None else None)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        return response.status, data
+
+    assert request('POST', '/api/profile', {'route': '/api/history', 'count': 1000})[0] == 400
+    status, body = request('POST', '/api/profile', {'route': '/api/history', 'count': 2})
+    assert status == 200 and json.loads(body)['armed'] == {'/api/history': 2}
+    assert server.profiling_armed.value == 1
+
+    for _ in range(3):
+        assert request('GET', '/api/history?limit=5')[0] == 200
+    assert server.profiling_armed.value == 0
+    listing = json.loads(request('GET', '/api/profile')[1])
+    assert listing['armed'] == {} and len(listing['profiles']) == 2
+    status, summary = request('GET', listing['profiles'][0]['summary_url'])
+    assert status == 200 and summary.startswith(b'GET /api/history?limit=5 -> 200')
+
+    request('POST', '/api/profile', {'route': '/api/history', 'count': 3})
+    request('POST', '/api/profile', {'route': '/api/history', 'count': 0})
+    assert server.armed_profiles() == {} and server.profiling_armed.value == 0
+
+def test_stage_timings_are_saved_per_stage_and_served(port, uploads):
+    final_app = pytest.importorskip('final_app', reason="the video pipeline's dependencies are not installed")
+    (uploads / 'video-job').mkdir()
+    started = []
+    timings = final_app.StageTimings(str(uploads / 'video-job' / server.JOB_TIMINGS_FILE), 'video-job', started.append)
+    with timings.stage('extract_audio') as sizes:
+        sizes['audio_bytes'] = 1234
+    assert server.read_job_timings('video-job')['stages'][0]['audio_bytes'] == 1234  # Saved before the job ends
+    with pytest.raises(ValueError):
+        with timings.stage('not_a_stage'):
+            pass
+    with pytest.raises(RuntimeError):
+        with timings.stage('transcribe'):
+            raise RuntimeError("Speech-to-Text failed")
+    timings.finish('failed')
+    assert started == ['extract_audio', 'transcribe']
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/api/jobs/video-job/timings')
+    response = conn.getresponse()
+    record = json.loads(response.read())
+    conn.request('GET', '/api/jobs/unknown-job/timings')
+    missing = conn.getresponse()
+    missing.read()
+    conn.close()
+    assert response.status == 200 and missing.status == 404
+    assert record['status'] == 'failed' and record['total_seconds'] >= 0
+    assert [stage['name'] for stage in record['stages']] == ['extract_audio', 'transcribe']
+    assert all(stage['wall_seconds'] >= 0 and 'peak_rss_bytes' in stage for stage in record['stages'])
+
+def test_format_cache_key_is_canonical_and_versioned(monkeypatch):
+    key = server.FormatResultCache.make_key('ab' * 32, {'add_periods': True, 'remove_ellipsis': False})
+    assert key == server.FormatResultCache.make_key('ab' * 32, {'remove_ellipsis': False, 'add_periods': True})
+    assert key != server.FormatResultCache.make_key('ab' * 32, {'add_periods': True, 'remove_ellipsis': True})
+    assert key != server.FormatResultCache.make_key('cd' * 32, {'add_periods': True, 'remove_ellipsis': False})
+    monkeypatch.setattr(server, 'FORMAT_CACHE_VERSION', 'changed')
+    assert key != server.FormatResultCache.make_key('ab' * 32, {'add_periods': True, 'remove_ellipsis': False})
+
+def test_format_cache_hits_misses_and_evicts_least_recently_used(tmp_path):
+    cache = server.FormatResultCache(str(tmp_path / 'cache'), max_bytes=250)
+    assert cache.get('first') is None
+    cache.put('first', b'1' * 100)
+    cache.put('second', b'2' * 100)
+    os.utime(cache.path_for('second'), (1, 1))  # Used long ago
+    assert open(cache.get('first'), 'rb').read() == b'1' * 100
+
+    source = tmp_path / 'result.xlsx'
+    source.write_bytes(b'3' * 100)
+    cache.put_file('third', str(source))
+    assert cache.get('second') is None
+    assert cache.get('first') and cache.get('third')
+    cache.put('too-large', b'4' * 251)
+    assert cache.get('too-large') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (3, 3, 2, 200)
+
+@pytest.mark.parametrize('fields', [{'options': '[]'}, {'options': '"x"'}, {'options': '{'},
+                                    {'offset': 'abc'}, {'limit': '1.5'}])
+def test_preview_rejects_malformed_parameters(port, tmp_path, monkeypatch, fields):
+    path = tmp_path / 'preview.xlsx'
+    openpyxl.Workbook().save(path)
+    status, _, _ = post_form(port, '/api/excel-preview', fields, {'file': ('preview.xlsx', path.read_bytes())})
+    assert status == 400
+
+@pytest.mark.parametrize('method, path', [('POST', '/api/format-excel'), ('POST', '/api/memory'),
+                                          ('PUT', '/api/uploads/0/video/0')])
+def test_malformed_content_length_is_a_400(port, method, path):
+    with socket.create_connection(('127.0.0.1', port), timeout=30) as connection:
+        connection.sendall(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: abc\r\n\r\n'.encode())
+        assert connection.makefile('rb').readline().split()[1] == b'400'
+
+def test_thread_pool_server_reports_bind_errors(port):
+    # The port is taken by the fixture's server
+    with pytest.raises(OSError):
+        server.ThreadPoolHTTPServer(('127.0.0.1', port), server.MultiToolHandler)
+
+def test_idle_connection_does_not_block_the_pool():
+    class Hello(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '5')
+            self.end_headers()
+            self.wfile.write(b'hello')
+
+        def log_message(self, *args):
+            pass
+
+    httpd = server.ThreadPoolHTTPServer(('127.0.0.1', 0), Hello, workers=1, connection_timeout=0.5)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        # Takes the only worker and never sends a request line
+        idle = socket.create_connection(httpd.server_address)
+        conn = http.client.HTTPConnection(*httpd.server_address, timeout=10)
+        conn.request('GET', '/')
+        response = conn.getresponse()
+        assert response.status == 200 and response.read() == b'hello'
+        conn.close()
+        idle.close()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_memory_tracker_ignores_requests_that_end_after_it_stopped(tmp_path):
+    tracker = server.MemoryTracker(str(tmp_path))
+    tracker.start()
+    entry = tracker.begin('/api/format-excel')
+    tracker.stop()
+    tracker.end(entry, 'POST /api/format-excel')
+    worker = tracker.report()['workers'][str(os.getpid())]
+    assert worker['routes'] == {} and worker['worst'] == [] and not worker['enabled']
@@ -0,0 +1,46 @@
+"""
+Startup budget for server.py.
+
+The heavy tools are imported on first use through server.FEATURES. These tests import the
+server in a fresh interpreter under `python -X importtime` and fail when startup grows past
+the budget or pulls one of those dependencies back in.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_BUDGET_SECONDS = float(os.environ.get('IMPORT_BUDGET_SECONDS', '1.0'))
+# Loaded by FEATURES when a route needs them, never at startup
+LAZY_MODULES = ['openai', 'docx', 'openpyxl', 'websockets', 'keyboard', 'pyperclip', 'win32com', 'pythoncom',
+                'tkinter', 'formatting', 'final_app', 'processing', 'tts4', 'pandas', 'cv2', 'numpy', 'flask']
+
+@pytest.fixture(scope='module')
+def import_times():
+    """Cumulative import time in seconds of every module loaded by `import server`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import server'], cwd=SERVER_DIR,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        missing = [line for line in result.stderr.splitlines() if line.startswith('ModuleNotFoundError')]
+        if missing:
+            pytest.skip(f"server.py's own dependencies are not installed: {missing[-1]}")
+        pytest.fail(result.stderr[-2000:])
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+def test_server_import_is_within_budget(import_times):
+    assert import_times['server'] <= IMPORT_BUDGET_SECONDS
+
+def test_heavy_dependencies_are_not_imported_at_startup(import_times):
+    loaded = sorted({name.split('.')[0] for name in import_times} & set(LAZY_MODULES))
+    assert loaded == []